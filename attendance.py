@@ -20,6 +20,10 @@ import time
 import traceback
 from datetime import datetime
 
+# thread limits for OpenCV / BLAS; the BLAS part must run before numpy is imported
+import runtime_policy
+runtime_policy.apply_env_limits()
+
 # ---------- Optional third-party imports (defensive) ----------
 CV2_AVAILABLE = True
 FR_AVAILABLE = True
@@ -28,6 +32,7 @@ CTKIMAGE_AVAILABLE = True
 
 try:
     import cv2
+    runtime_policy.apply_native_limits(cv2)
 except Exception:
     cv2 = None
     CV2_AVAILABLE = False
@@ -66,6 +71,14 @@ except Exception:
     ctk = None
     messagebox = None
 
+from recognition_service import get_recognition_service
+from unknown_faces import get_unknown_buffer
+from attendance_writer import get_attendance_writer, mark_present
+from recognition_events import (
+    RecognitionEventBus, PreviewFrame, StatusText, AccessDenied, CameraError,
+    AttendanceMatch, MarkResult, UI_POLL_MS,
+)
+
 # ---------- Configuration ----------
 IMAGES_DIR = "images"
 ATTENDANCE_CSV = "Attendance.csv"
@@ -82,6 +95,9 @@ USER_FACE_MAP = {
 
 FR_TOLERANCE = 0.45
 ENFORCE_MAPPING = True
+# Keep encodings that fail FR_TOLERANCE in unknown_faces/ for offline clustering
+# (python unknown_faces.py ranks them so unenrolled students / bad templates can be fixed in bulk)
+UNKNOWN_CAPTURE = False
 
 # Performance tuning (adjust to taste)
 # NOTE: preview size controls how large the UI image appears; recognition uses a separate smaller scale.
@@ -89,10 +105,54 @@ FRAME_RESIZE_SCALE = 0.35        # scale applied when creating encodings/recogni
 PROCESS_EVERY_N_FRAMES = 2       # do recognition on every Nth frame
 UI_UPDATE_EVERY_N_FRAMES = 1     # update shown UI image every N frames (1 = every time)
 
+# Detection mode per camera index:
+#   "resized" - whole frame shrunk by FRAME_RESIZE_SCALE (default, fast, close-up kiosk cameras)
+#   "tiled"   - full-resolution overlapping tiles in worker processes (wide classroom shots,
+#               see face_detection.py for the tile size and per-frame time budget)
+DEFAULT_DETECTION_MODE = "resized"
+CAMERA_DETECTION_MODE = {}        # e.g. {1: "tiled"} for a lecture-hall camera on index 1
+TILED_CAMERA_RESOLUTION = (3840, 2160)
+
 # Preview target size (UI) - larger -> clearer preview; does not affect recognition cost significantly
 PREVIEW_WIDTH = 640
 PREVIEW_HEIGHT = 360
 
+def get_shared_recognition_service():
+    """The process-wide recognition service, configured with this module's settings."""
+    return get_recognition_service(images_dir=IMAGES_DIR, resize_scale=FRAME_RESIZE_SCALE)
+
+# ---------- Reusable frame buffers ----------
+class FrameBufferPool:
+    """
+    Named, preallocated image buffers for one thread's per-frame work, passed to
+    OpenCV as dst= so resize / cvtColor write in place instead of allocating a new
+    array every frame. A buffer is only reallocated when the requested shape
+    changes (e.g. the camera switches resolution); `allocations` counts those.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.frames = 0
+
+    def get(self, name, shape, dtype=None):
+        dtype = dtype or np.uint8
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+            self.allocations += 1
+        return buf
+
+    def allocations_per_frame(self):
+        return self.allocations / self.frames if self.frames else 0.0
+
+
+def _scaled_size(frame, scale):
+    """(width, height) cv2.resize would produce for fx=fy=scale."""
+    h, w = frame.shape[:2]
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
 # ---------- Helper: safe messagebox ----------
 def _safe_show_error(title, message):
     try:
@@ -238,9 +298,6 @@ class MarkAttendancePage:
         self.cap = None
         self.running = False
         self.marked = False
-        self.encodeListKnown = []
-        self.student_info = {}
-        self.classNames = []
         self.last_seen = {}
         self.detection_delay = 0.1
 
@@ -265,28 +322,46 @@ class MarkAttendancePage:
             # Show once in UI
             _safe_show_warning("Missing Dependencies", msg)
 
-        # Load known faces in background (will be a no-op if cv2/face_recognition missing)
-        threading.Thread(target=self.load_known_faces, daemon=True).start()
+        # Known faces are owned by the shared recognition service; the first page warms it up
+        self._service = get_shared_recognition_service()
+        self._service.acquire()
+        self._closed = False
+
+        # recognition threads -> (storage writer | Tk) via the event bus; Tk polls its queue
+        self._bus = RecognitionEventBus(self._on_storage_event)
+        self._ui_pump_id = None
+        self._pump_ui_events()
         # Populate last-attendance info
         self.auto_fetch_last_attendance_info()
 
     # ---------------- Attendance info helpers ----------------
     def auto_fetch_last_attendance_info(self):
+        """Refresh the "Last Attendance" panel; the CSV is read on the attendance writer thread."""
+        future = get_attendance_writer().submit(self._compute_last_attendance_info)
+        future.add_done_callback(self._post_last_info)
+        return future
+
+    def _post_last_info(self, future):
+        try:
+            text, color = future.result()
+        except Exception as e:
+            text, color = f"Error: {e}", "#fca5a5"
+        self._bus.publish(StatusText(text, color))
+
+    def _compute_last_attendance_info(self):
+        """(text, color) for the last-attendance panel. Reads the CSV; no UI calls."""
         try:
             if not self.student_username:
-                self._set_last_info_label("No user is logged in.", "#fca5a5")
-                return
+                return "No user is logged in.", "#fca5a5"
 
             csv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ATTENDANCE_CSV))
             if not os.path.exists(csv_path):
-                self._set_last_info_label("No attendance file found yet.", "#cbd5e1")
-                return
+                return "No attendance file found yet.", "#cbd5e1"
 
             # get the most relevant last row (may lack registration)
             last_row = self._get_last_record_for_user(csv_path, self.student_username)
             if not last_row:
-                self._set_last_info_label("No attendance for this user yet.", "#cbd5e1")
-                return
+                return "No attendance for this user yet.", "#cbd5e1"
 
             # Try to extract FullName + Registration + Dept from the chosen row (check many variants)
             def _pick_row_field(row, candidates):
@@ -375,9 +450,9 @@ class MarkAttendancePage:
                 f"Registration No: {student_id}     Dept: {dept}\n"
                 f"Date: {date_v}    Time: {time_v}      Status: {status}"
             )
-            self._set_last_info_label(text)
+            return text, "#cbd5e1"
         except Exception as e:
-            self._set_last_info_label(f"Error: {e}", "#fca5a5")
+            return f"Error: {e}", "#fca5a5"
 
     def _get_last_record_for_user(self, csv_path, username):
         """
@@ -517,60 +592,78 @@ class MarkAttendancePage:
             except Exception:
                 print("[WARN] Could not update last info label")
 
-    # ---------------- Load encodings ----------------
+    # ---------------- Known faces (shared service) ----------------
+    @property
+    def encodeListKnown(self):
+        return self._service.gallery.encodings
+
+    @property
+    def student_info(self):
+        return self._service.gallery.info
+
+    @property
+    def classNames(self):
+        return self._service.gallery.class_names
+
     def load_known_faces(self, path=IMAGES_DIR):
         """
-        Loads face encodings from images folder. Expected filename format:
+        Ask the shared recognition service to re-encode the images folder. Expected filename format:
             FULLNAME_STUDENTID_DEPT.jpg
-        This function is defensive and will skip if cv2/face_recognition missing.
+        Every open page sees the new gallery once it is published.
         """
-        encodings = []
-        info = {}
+        self._service.reload(path)
+
+    def close(self):
+        """Stop the camera and drop this page's reference on the recognition service."""
+        if self._closed:
+            return
+        self._closed = True
         try:
-            os.makedirs(path, exist_ok=True)
+            self.stop_recognition(clear_label=False)
         except Exception:
             pass
-
-        if not CV2_AVAILABLE or not FR_AVAILABLE:
-            print("[WARN] load_known_faces skipped: cv2 or face_recognition not available.")
-            self.encodeListKnown = []
-            self.student_info = {}
-            self.classNames = []
+        if self._ui_pump_id is not None:
+            try:
+                self.frame.after_cancel(self._ui_pump_id)
+            except Exception:
+                pass
+            self._ui_pump_id = None
+        self._bus.close()
+        self._service.release()
+
+    # ---------------- Event bus: Tk side ----------------
+    def _pump_ui_events(self):
+        """Runs on the Tk thread every UI_POLL_MS and handles whatever the worker threads published."""
+        if self._closed:
             return
-
-        for fname in os.listdir(path):
-            if not fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                continue
-            base = os.path.splitext(fname)[0]
-            parts = base.split("_")
-            if len(parts) >= 3:
-                fullname, student_id, dept = parts[:3]
-            else:
-                fullname, student_id, dept = parts[0], "Unknown", "Unknown"
-
-            img_path = os.path.join(path, fname)
-            img = cv2.imread(img_path) if cv2 else None
-            if img is None:
-                print(f"[WARN] Could not read image {img_path}")
-                continue
-
+        for event in self._bus.drain_ui():
             try:
-                small = cv2.resize(img, (0, 0), fx=FRAME_RESIZE_SCALE, fy=FRAME_RESIZE_SCALE)
-                rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-                encs = face_recognition.face_encodings(rgb_small) if face_recognition else []
-                if not encs:
-                    print(f"[WARN] No face found in {fname}")
-                    continue
-                encodings.append(encs[0])
-                info[fullname.strip().upper()] = (student_id.strip(), dept.strip())
+                self._handle_ui_event(event)
             except Exception as e:
-                print(f"[ERROR] loading {fname}: {e}")
-                traceback.print_exc()
-
-        self.encodeListKnown = encodings
-        self.student_info = info
-        self.classNames = list(info.keys())
-        print("[INFO] Loaded encodings for:", self.classNames)
+                print(f"[WARN] UI event {type(event).__name__} failed: {e}")
+        try:
+            self._ui_pump_id = self.frame.after(UI_POLL_MS, self._pump_ui_events)
+        except Exception:
+            self._ui_pump_id = None
+
+    def _handle_ui_event(self, event):
+        if isinstance(event, PreviewFrame):
+            if self.running:
+                self._set_video_image(event.image)
+        elif isinstance(event, StatusText):
+            self._set_last_info_label(event.text, event.color)
+        elif isinstance(event, AccessDenied):
+            _safe_show_warning("Access Denied", event.message)
+        elif isinstance(event, CameraError):
+            _safe_show_error("Error", event.message)
+        elif isinstance(event, MarkResult):
+            self._show_mark_result(event)
+
+    # ---------------- Event bus: storage side ----------------
+    def _on_storage_event(self, event):
+        """Runs on the bus's storage thread; never touches Tk."""
+        if isinstance(event, AttendanceMatch):
+            self.mark_attendance(event.name)
 
     # ---------------- Start recognition ----------------
     def start_recognition(self):
@@ -587,7 +680,7 @@ class MarkAttendancePage:
 
         if self.running:
             return
-        if not self.encodeListKnown:
+        if len(self._service.gallery) == 0:
             _safe_show_info("Info", "Face encodings are still loading or none found in images/; please add images and wait.")
             return
 
@@ -621,13 +714,17 @@ class MarkAttendancePage:
                     cap = None
 
             if not cap or not cap.isOpened():
-                self.frame.after(0, lambda: _safe_show_error("Error", "Could not open webcam."))
+                self._bus.publish(CameraError("Could not open webcam."))
                 return
 
             # request a reasonable camera resolution (driver may ignore)
             try:
-                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+                if self._detection_mode() == "tiled":
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, TILED_CAMERA_RESOLUTION[0])
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, TILED_CAMERA_RESOLUTION[1])
+                else:
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
                 cap.set(cv2.CAP_PROP_FPS, 30)
             except Exception:
                 pass
@@ -635,31 +732,43 @@ class MarkAttendancePage:
             self.cap = cap
 
             ui_update_counter = 0
+            buffers = self._capture_buffers = FrameBufferPool()
+            frame = None
 
             while not self._stop_event.is_set():
-                success, frame = cap.read()
-                if not success or frame is None:
+                # read into the previous frame's array (OpenCV reuses it when the size matches)
+                success, read = cap.read(frame)
+                if not success or read is None:
                     time.sleep(0.01)
                     continue
+                if read is not frame:
+                    buffers.allocations += 1
+                frame = read
+                buffers.frames += 1
 
-                # store latest frame for processing thread
+                # publish into the shared latest-frame buffer (copied in place, no new array)
                 with self._frame_lock:
-                    self._latest_frame = frame.copy()
+                    latest = buffers.get("latest", frame.shape)
+                    np.copyto(latest, frame)
+                    self._latest_frame = latest
 
                 # Update UI (preview) - produce preview sized image (maintain aspect ratio)
                 ui_update_counter = (ui_update_counter + 1) % UI_UPDATE_EVERY_N_FRAMES
                 if ui_update_counter == 0:
                     try:
-                        preview = cv2.resize(frame, (PREVIEW_WIDTH, PREVIEW_HEIGHT))
-                        rgb_preview = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB)
+                        preview = cv2.resize(frame, (PREVIEW_WIDTH, PREVIEW_HEIGHT),
+                                             dst=buffers.get("preview", (PREVIEW_HEIGHT, PREVIEW_WIDTH, 3)))
+                        rgb_preview = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB,
+                                                   dst=buffers.get("preview_rgb", (PREVIEW_HEIGHT, PREVIEW_WIDTH, 3)))
+                        # PhotoImage copies the pixels into Tk, so the buffer can be reused next frame
                         pil_img = Image.fromarray(rgb_preview)
                         # Prefer ImageTk.PhotoImage for speed on many platforms
+                        # (coalesced: if Tk is behind, only the newest preview is shown)
                         if ImageTk is not None:
-                            tk_img = ImageTk.PhotoImage(pil_img)
-                            self.frame.after(0, lambda img=tk_img: self._set_tk_video_image(img))
+                            self._bus.publish(PreviewFrame(ImageTk.PhotoImage(pil_img)))
                         elif CTKIMAGE_AVAILABLE:
                             ctki = CTkImage(light_image=pil_img, dark_image=pil_img, size=(PREVIEW_WIDTH, PREVIEW_HEIGHT))
-                            self.frame.after(0, lambda ctki=ctki: self._set_video_image(ctki))
+                            self._bus.publish(PreviewFrame(ctki))
                     except Exception:
                         pass
 
@@ -675,30 +784,36 @@ class MarkAttendancePage:
             except Exception:
                 pass
             self.cap = None
-            print("[INFO] Capture loop ended.")
-
-    def _set_video_image(self, ctki):
-        try:
-            self.video_label.configure(image=ctki)
-            self.video_label.image = ctki
-        except Exception:
-            pass
+            b = getattr(self, "_capture_buffers", None)
+            if b is not None and b.frames:
+                print(f"[INFO] Capture loop ended: {b.frames} frame(s), "
+                      f"{b.allocations_per_frame():.3f} buffer allocation(s)/frame.")
+            else:
+                print("[INFO] Capture loop ended.")
 
-    def _set_tk_video_image(self, tk_img):
+    def _set_video_image(self, img):
         try:
-            self.video_label.configure(image=tk_img)
-            self.video_label.image = tk_img
+            self.video_label.configure(image=img)
+            self.video_label.image = img
         except Exception:
             pass
 
     # ---------------- Processing loop ----------------
+    @staticmethod
+    def _detection_mode():
+        return CAMERA_DETECTION_MODE.get(CAMERA_INDEX, DEFAULT_DETECTION_MODE)
+
     def _process_loop(self):
+        tiled = self._detection_mode() == "tiled"
+        runtime_policy.pin_current_thread()
+        buffers = self._process_buffers = FrameBufferPool()
         try:
             while not self._stop_event.is_set():
                 frame = None
                 with self._frame_lock:
                     if self._latest_frame is not None:
-                        frame = self._latest_frame.copy()
+                        frame = buffers.get("frame", self._latest_frame.shape)
+                        np.copyto(frame, self._latest_frame)
                 if frame is None:
                     time.sleep(0.02)
                     continue
@@ -707,64 +822,75 @@ class MarkAttendancePage:
                 if self._frame_counter % max(1, PROCESS_EVERY_N_FRAMES) != 0:
                     time.sleep(0.003)
                     continue
+                buffers.frames += 1
 
                 try:
-                    # resize for recognition (smaller => faster)
-                    small_img = cv2.resize(frame, (0, 0), fx=FRAME_RESIZE_SCALE, fy=FRAME_RESIZE_SCALE)
-                    rgb_small = cv2.cvtColor(small_img, cv2.COLOR_BGR2RGB)
-
-                    faces = face_recognition.face_locations(rgb_small)
-                    if len(faces) != 1:
+                    if tiled:
+                        # full resolution so distant faces stay above the detector's minimum size
+                        rgb_small = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("rgb", frame.shape))
+                        faces = self._service.detect_tiled(rgb_small)
+                    else:
+                        # resize for recognition (smaller => faster)
+                        w, h = _scaled_size(frame, FRAME_RESIZE_SCALE)
+                        small_img = cv2.resize(frame, (w, h), dst=buffers.get("small", (h, w, 3)))
+                        rgb_small = cv2.cvtColor(small_img, cv2.COLOR_BGR2RGB, dst=buffers.get("rgb", (h, w, 3)))
+                        faces = self._service.detect(rgb_small)
+                    # single-face mode wants exactly one face; a tiled classroom frame has many
+                    if not faces or (len(faces) != 1 and not tiled):
                         self.last_seen.clear()
                         time.sleep(0.003)
                         continue
 
-                    encs = face_recognition.face_encodings(rgb_small, faces)
+                    encs = self._service.encode(rgb_small, faces)
                     if not encs:
                         self.last_seen.clear()
                         time.sleep(0.003)
                         continue
 
                     current_time = time.time()
+                    # one snapshot per frame; a reload swaps the service's reference, never this object
+                    gallery = self._service.gallery
 
                     for encodeFace, faceLoc in zip(encs, faces):
-                        matches = face_recognition.compare_faces(self.encodeListKnown, encodeFace, tolerance=FR_TOLERANCE)
-                        faceDis = face_recognition.face_distance(self.encodeListKnown, encodeFace)
-                        if len(faceDis) == 0:
+                        matched_name, best_distance = gallery.match(encodeFace, FR_TOLERANCE)
+                        if best_distance is None:
                             continue
 
-                        matchIndex = int(np.argmin(faceDis))
-                        best_distance = float(faceDis[matchIndex])
-                        is_match = bool(matches[matchIndex]) and (best_distance <= FR_TOLERANCE)
-
-                        if is_match:
-                            detected_name = self.classNames[matchIndex].upper()
+                        if matched_name:
+                            detected_name = matched_name.upper()
                             expected_name = (USER_FACE_MAP.get(self.student_username, "") or "").upper()
 
                             print(f"[DEBUG] Detected face: {detected_name}, Logged in as: {self.student_username}")
 
                             if ENFORCE_MAPPING and not expected_name:
-                                self.frame.after(0, lambda: _safe_show_warning(
-                                    "Access Denied",
-                                    f"No face mapping found for login '{self.student_username}'.")) 
+                                self._bus.publish(AccessDenied(
+                                    f"No face mapping found for login '{self.student_username}'."))
                                 self._stop_event.set()
                                 break
 
                             if expected_name and expected_name != detected_name:
-                                msg = f"Detected face: {detected_name}\nThis login is only for {self.student_username}."
-                                self.frame.after(0, lambda m=msg: _safe_show_warning("Access Denied", m))
+                                if tiled:
+                                    continue        # a classmate in the same frame, not an impostor
+                                self._bus.publish(AccessDenied(
+                                    f"Detected face: {detected_name}\nThis login is only for {self.student_username}."))
                                 self._stop_event.set()
                                 break
 
                             if detected_name not in self.last_seen:
                                 self.last_seen[detected_name] = current_time
                             elif (current_time - self.last_seen[detected_name]) >= self.detection_delay:
-                                # mark attendance on main thread to keep UI consistent
-                                self.frame.after(0, lambda dn=detected_name: self._mark_and_stop(dn))
+                                # the writer thread marks it; Tk only hears about the outcome
+                                self._bus.publish(AttendanceMatch(detected_name, self.student_username, best_distance))
                                 self._stop_event.set()
                                 break
                         else:
-                            self.last_seen.clear()
+                            if not tiled:
+                                self.last_seen.clear()
+                            if UNKNOWN_CAPTURE:
+                                try:
+                                    get_unknown_buffer().add(encodeFace, best_distance, rgb_small, faceLoc)
+                                except Exception as e:
+                                    print(f"[WARN] unknown face not captured: {e}")
                 except Exception as e:
                     print(f"[ERROR] process loop inner: {e}")
                     traceback.print_exc()
@@ -774,33 +900,55 @@ class MarkAttendancePage:
             print(f"[ERROR] process loop: {e}")
             traceback.print_exc()
         finally:
-            print("[INFO] Process loop ended.")
+            if buffers.frames:
+                print(f"[INFO] Process loop ended: {buffers.frames} frame(s) recognised, "
+                      f"{buffers.allocations_per_frame():.3f} buffer allocation(s)/frame.")
+            else:
+                print("[INFO] Process loop ended.")
+            if UNKNOWN_CAPTURE:
+                try:
+                    get_unknown_buffer().flush()
+                except Exception as e:
+                    print(f"[WARN] unknown face buffer not flushed: {e}")
 
-    # ---------------- Mark and force-stop ----------------
-    def _mark_and_stop(self, detected_name):
-        try:
-            self.mark_attendance(detected_name)
-        except Exception as e:
-            print(f"[ERROR] marking attendance in _mark_and_stop: {e}")
-        finally:
+    # ---------------- Mark result (Tk thread) ----------------
+    def _show_mark_result(self, result):
+        """Close the camera, then report a MarkResult produced by the writer thread."""
+        self._force_close_camera()
+        if result.status == "marked":
+            self.marked = True
+            _safe_show_info("Success", result.message)
+        elif result.status == "already":
+            _safe_show_info("Info", result.message)
+        else:
+            _safe_show_error("Error", result.message)
+        if result.last_info:
+            self._set_last_info_label(*result.last_info)
+        if result.status == "marked" and self.refresh_callback:
             try:
-                self._stop_event.set()
-                if self.cap:
-                    try:
-                        if getattr(self.cap, "isOpened", lambda: False)():
-                            self.cap.release()
-                    except Exception:
-                        pass
-                    self.cap = None
+                self.refresh_callback()
+            except Exception as e:
+                print(f"[WARN] Could not refresh view: {e}")
+
+    def _force_close_camera(self):
+        try:
+            self._stop_event.set()
+            if self.cap:
                 try:
-                    self.video_label.configure(image=None)
-                    self.video_label.image = None
+                    if getattr(self.cap, "isOpened", lambda: False)():
+                        self.cap.release()
                 except Exception:
                     pass
-                self.running = False
-                print("[INFO] Camera force-closed immediately after attendance.")
-            except Exception as e:
-                print(f"[WARN] _mark_and_stop cleanup error: {e}")
+                self.cap = None
+            try:
+                self.video_label.configure(image=None)
+                self.video_label.image = None
+            except Exception:
+                pass
+            self.running = False
+            print("[INFO] Camera force-closed immediately after attendance.")
+        except Exception as e:
+            print(f"[WARN] camera cleanup error: {e}")
 
     # ---------------- Stop recognition ----------------
     def stop_recognition(self, clear_label=True):
@@ -835,22 +983,46 @@ class MarkAttendancePage:
         print("[INFO] Camera stopped and released.")
 
     # ---------------- Mark attendance (CSV) ----------------
-    def mark_attendance(self, detected_name):
+    def mark_attendance(self, detected_name, callback=None):
+        """
+        Mark attendance for detected_name without blocking the caller.
+        The CSV check-and-append runs on the attendance writer thread. The returned
+        Future resolves to a MarkResult, which is also posted to the UI queue.
+        `callback(result)`, if given, runs on the writer thread (no Tk calls there).
+        """
+        future = get_attendance_writer().submit(self._write_attendance, detected_name)
+
+        def _done(f):
+            try:
+                result = f.result()
+            except Exception as e:
+                result = MarkResult("error", detected_name.title(), f"Failed to mark attendance: {e}", None)
+            self._bus.publish(result)
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"[WARN] mark_attendance callback failed: {e}")
+
+        future.add_done_callback(_done)
+        return future
+
+    def _write_attendance(self, detected_name):
         """
-        Mark attendance row. Enhancements:
+        Append the attendance row and return a MarkResult (with the refreshed last-attendance text).
+        Runs on the writer thread; no UI calls.
          - If student_info doesn't contain Registration/Department, attempt to read from profiles.json
          - already_present check is robust: checks by Registration (preferred) OR Username (if available)
         """
+        name = detected_name.title()
         if self.marked:
-            return
+            return MarkResult("already", name, f"{name} already marked present today.", None)
 
         # get Registration and Department from loaded encodings info (key = FULLNAME UPPER)
         student_id, dept = self.student_info.get(detected_name, ("Unknown", "Unknown"))
         username = self.student_username or "Unknown"
         csv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ATTENDANCE_CSV))
         now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        time_str = now.strftime("%H:%M:%S")
 
         # --- NEW: fallback to profiles.json if dept or registration unknown ---
         if (not student_id or str(student_id).strip() == "" or student_id == "Unknown") or (not dept or str(dept).strip() == "" or dept == "Unknown"):
@@ -863,73 +1035,24 @@ class MarkAttendancePage:
             except Exception:
                 pass
 
-        # ensure CSV header (use Registration No label)
-        if not os.path.exists(csv_path):
-            try:
-                with open(csv_path, "w", encoding="utf-8", newline="") as f:
-                    csv.writer(f).writerow(["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"])
-            except Exception as e:
-                _safe_show_error("Error", f"Could not create attendance CSV: {e}")
-                return
-
-        # already_present check: accept presence if either Registration (preferred) OR Username already has a present record for today
-        already_present = False
+        # final fallback: ensure non-empty fields written
+        write_sid = student_id if student_id and student_id != "Unknown" else ""
+        write_dept = dept if dept and dept != "Unknown" else ""
         try:
-            with open(csv_path, "r", encoding="utf-8", newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # normalize candidate values
-                    row_sid = (
-                        (row.get("Registration") or row.get("Registration No") or row.get("RegistrationNo")) or
-                        (row.get("StudentID") or row.get("studentid") or row.get("registration")) or
-                        ""
-                    )
-                    row_sid = str(row_sid).strip()
-                    row_uname = (row.get("Username") or row.get("username") or "").strip()
-                    row_date = (row.get("Date") or "").strip()
-                    if row_date != date_str:
-                        continue
-                    # check by Registration if we have one
-                    if student_id and student_id != "Unknown" and row_sid and row_sid == str(student_id).strip():
-                        already_present = True
-                        break
-                    # otherwise fallback to username match
-                    if username and row_uname and row_uname == str(username).strip():
-                        already_present = True
-                        break
-        except FileNotFoundError:
-            already_present = False
-        except Exception:
-            already_present = False
-
-        if already_present:
-            _safe_show_info("Info", f"{detected_name.title()} already marked present today.")
-            # refresh last info to show correct data
-            self.auto_fetch_last_attendance_info()
-            return
-
-        try:
-            # final fallback: ensure non-empty fields written
-            write_sid = student_id if student_id and student_id != "Unknown" else ""
-            write_dept = dept if dept and dept != "Unknown" else ""
-            with open(csv_path, "a", encoding="utf-8", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([write_sid, detected_name.title(), username, write_dept, date_str, time_str, "Present"])
-            self.marked = True
-            _safe_show_info("Success", f"Attendance marked for {detected_name.title()}")
-            self.auto_fetch_last_attendance_info()
-            print(f"[INFO] Attendance marked for {detected_name.title()} (Reg: {write_sid}, User: {username}, Dept: {write_dept})")
+            status = mark_present(csv_path, write_sid, name, username, write_dept,
+                                  now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S"))
         except Exception as e:
             print(f"[ERROR] could not write CSV: {e}")
             traceback.print_exc()
-            _safe_show_error("Error", f"Failed to mark attendance: {e}")
+            return MarkResult("error", name, f"Failed to mark attendance: {e}", None)
 
-        # refresh callback if present
-        if self.refresh_callback:
-            try:
-                self.refresh_callback()
-            except Exception as e:
-                print(f"[WARN] Could not refresh view: {e}")
+        if status == "marked":
+            self.marked = True
+            print(f"[INFO] Attendance marked for {name} (Reg: {write_sid}, User: {username}, Dept: {write_dept})")
+            message = f"Attendance marked for {name}"
+        else:
+            message = f"{name} already marked present today."
+        return MarkResult(status, name, message, self._compute_last_attendance_info())
 
 # ---------------------- Test harness ----------------------
 if __name__ == "__main__":
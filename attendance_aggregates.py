@@ -0,0 +1,336 @@
+"""
+attendance_aggregates.py
+
+Per-student attendance totals kept up to date as attendance is written.
+
+Every present row is counted under each identifier it carries: its username,
+its registration number and its lower-cased full name. A lookup unions the
+entries for the login username (as a username, a full name, or part of a
+username) and the registration number, which is how the dashboard counter has
+always matched rows. For every identifier it keeps
+ - the set of present days and their count (a present row whose date can't be
+   parsed counts once per distinct date text, as the counter always did),
+ - when they were last seen,
+ - the streak of consecutive class days ending at their latest present day,
+   and the longest streak (weekends don't break a streak, SKIP_WEEKENDS),
+ - present days per month.
+
+Updates come from two places and are idempotent (a day already counted is
+ignored), so seeing the same row twice is harmless:
+ - attendance_writer calls back after every row it writes,
+ - the attendance repository reports rows other tools appended to the CSV.
+
+The totals are saved to attendance_aggregates.json (a few seconds after the
+last change) together with the CSV's (size, mtime). On start the file is used
+as-is if the CSV hasn't changed since, otherwise the totals are rebuilt from
+one parse of the CSV. The dashboard counter is then a dictionary lookup.
+"""
+
+import os
+import json
+import threading
+from datetime import date, timedelta
+
+import attendance_writer
+from attendance_db import is_present_status
+from attendance_repository import get_attendance_repository, normalize_username
+from date_parsing import iso_date
+
+# ---------- Configuration ----------
+AGGREGATES_FILE = "attendance_aggregates.json"
+ATTENDANCE_CSV = "Attendance.csv"
+SKIP_WEEKENDS = True
+SAVE_DELAY_S = 3.0
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def next_class_day(day):
+    """The day after `day` that a streak must continue on (the following Monday after a Friday)."""
+    nxt = day + timedelta(days=1)
+    while SKIP_WEEKENDS and nxt.weekday() >= 5:
+        nxt += timedelta(days=1)
+    return nxt
+
+
+def row_keys(registration, full_name, username):
+    """Every identifier a row is counted under."""
+    keys = []
+    user = normalize_username(username)
+    if user:
+        keys.append("user:" + user)
+    reg = str(registration or "").strip()
+    if reg:
+        keys.append("reg:" + reg)
+    name = str(full_name or "").strip().lower()
+    if name:
+        keys.append("name:" + name)
+    return keys
+
+
+def lookup_keys(keys, username=None, registration=None):
+    """
+    The keys (of row_keys form) a student lookup unions: the username as a full
+    name or contained in a username, and the registration number.
+    """
+    user = normalize_username(username)
+    reg = str(registration or "").strip()
+    out = (["name:" + user] if user else []) + (["reg:" + reg] if reg else [])
+    if user:
+        out += [k for k in keys if k.startswith("user:") and user in k[5:]]
+    return out
+
+
+class StudentAggregate:
+    __slots__ = ("days", "undated", "months", "last_seen", "last_day", "tail_streak", "longest_streak")
+
+    def __init__(self):
+        self.days = set()           # date ordinals
+        self.undated = set()        # date texts of present rows that didn't parse as a date
+        self.months = {}            # "YYYY-MM" -> present days
+        self.last_seen = ""         # "YYYY-MM-DD HH:MM:SS"
+        self.last_day = None        # latest present date
+        self.tail_streak = 0        # streak ending at last_day
+        self.longest_streak = 0
+
+    @property
+    def present_days(self):
+        return len(self.days) + len(self.undated)
+
+    def current_streak(self, today=None):
+        """Streak still running today: 0 once a class day after last_day has passed without attendance."""
+        if self.last_day is None:
+            return 0
+        today = today or date.today()
+        return self.tail_streak if next_class_day(self.last_day) >= today else 0
+
+    def add(self, day, time_str=""):
+        """Count a present day. Returns True if it was new."""
+        stamp = f"{day.isoformat()} {time_str}".strip()
+        if stamp > self.last_seen:
+            self.last_seen = stamp
+        o = day.toordinal()
+        if o in self.days:
+            return False
+        self.days.add(o)
+        ym = day.isoformat()[:7]
+        self.months[ym] = self.months.get(ym, 0) + 1
+        if self.last_day is None or day > self.last_day:
+            extends = self.last_day is not None and next_class_day(self.last_day) == day
+            self.tail_streak = self.tail_streak + 1 if extends else 1
+            self.last_day = day
+            self.longest_streak = max(self.longest_streak, self.tail_streak)
+        else:
+            self._recompute_streaks()       # a back-dated row: rare, so just recount
+        return True
+
+    def add_undated(self, date_text):
+        """Count a present row whose date didn't parse, once per distinct text. Returns True if it was new."""
+        if date_text in self.undated:
+            return False
+        self.undated.add(date_text)
+        return True
+
+    def _recompute_months(self):
+        self.months = {}
+        for o in self.days:
+            ym = date.fromordinal(o).isoformat()[:7]
+            self.months[ym] = self.months.get(ym, 0) + 1
+
+    def _recompute_streaks(self):
+        run = longest = 0
+        prev = None
+        for o in sorted(self.days):
+            d = date.fromordinal(o)
+            run = run + 1 if prev is not None and next_class_day(prev) == d else 1
+            longest = max(longest, run)
+            prev = d
+        self.tail_streak, self.longest_streak, self.last_day = run, longest, prev
+
+    def to_json(self):
+        return {"days": sorted(self.days), "undated": sorted(self.undated), "last_seen": self.last_seen}
+
+    @classmethod
+    def from_json(cls, data):
+        agg = cls()
+        agg.days = set(int(o) for o in data.get("days", ()))
+        agg.undated = set(data.get("undated", ()))
+        agg.last_seen = data.get("last_seen", "")
+        agg._recompute_months()
+        agg._recompute_streaks()
+        return agg
+
+    @classmethod
+    def union(cls, aggs):
+        """One aggregate over the present days of several (the same student under different identifiers)."""
+        aggs = [a for a in aggs if a is not None]
+        if len(aggs) <= 1:
+            return aggs[0] if aggs else None
+        agg = cls()
+        for a in aggs:
+            agg.days |= a.days
+            agg.undated |= a.undated
+            agg.last_seen = max(agg.last_seen, a.last_seen)
+        agg._recompute_months()
+        agg._recompute_streaks()
+        return agg
+
+
+class AttendanceAggregates:
+    def __init__(self, csv_path, store_path):
+        self.csv_path = csv_path
+        self.store_path = store_path
+        self._lock = threading.RLock()
+        self._students = {}         # "user:<username>" / "reg:<registration>" / "name:<full name>" -> StudentAggregate
+        self._unions = {}           # (username, registration) -> student() result, dropped on any change
+        self._signature = None
+        self._save_timer = None
+        self.rebuilds = 0
+
+    # ---------------------- updates ----------------------
+    def _apply(self, registration, full_name, username, date_value, time_str, status):
+        if not is_present_status(status):
+            return False
+        text = str(date_value or "").strip()
+        if not text:
+            return False
+        iso = iso_date(text)
+        changed = False
+        for key in row_keys(registration, full_name, username):
+            agg = self._students.get(key)
+            if agg is None:
+                agg = self._students[key] = StudentAggregate()
+            if iso:
+                changed |= agg.add(date.fromisoformat(iso), str(time_str or "").strip())
+            else:
+                changed |= agg.add_undated(text.split(" ")[0])
+        if changed:
+            self._unions.clear()
+        return changed
+
+    def on_row_written(self, csv_path, row):
+        """attendance_writer listener: row is in ATTENDANCE_HEADER order."""
+        if os.path.abspath(csv_path) != self.csv_path:
+            return
+        reg, full, user, _dept, d, t, status = (list(row) + [""] * 7)[:7]
+        with self._lock:
+            self._apply(reg, full, user, d, t, status)
+            self._signature = _file_signature(self.csv_path)
+        self._schedule_save()
+
+    def on_records(self, records, reloaded):
+        """attendance repository subscriber: rows appended (or the whole file re-parsed)."""
+        with self._lock:
+            if reloaded and _file_signature(self.csv_path) == self._signature:
+                return          # the first parse of a file we already have totals for
+            if reloaded:
+                self._rebuild_from(records)
+            else:
+                for r in records:
+                    self._apply(r.registration, r.full_name, r.username, r.date_text, r.time, r.status)
+            self._signature = _file_signature(self.csv_path)
+        self._schedule_save()
+
+    def _rebuild_from(self, records):
+        self._students = {}
+        self._unions = {}
+        for r in records:
+            self._apply(r.registration, r.full_name, r.username, r.date_text, r.time, r.status)
+        self.rebuilds += 1
+
+    # ---------------------- persistence ----------------------
+    def load(self):
+        """Use the saved totals if the CSV is unchanged since they were saved; otherwise rebuild."""
+        sig = _file_signature(self.csv_path)
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == 2 and data.get("csv_signature") == sig and sig is not None:
+                with self._lock:
+                    self._students = {k: StudentAggregate.from_json(v) for k, v in data.get("students", {}).items()}
+                    self._unions = {}
+                    self._signature = sig
+                return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN] {AGGREGATES_FILE} unreadable ({e}); rebuilding")
+        table = get_attendance_repository(self.csv_path).snapshot()
+        with self._lock:
+            self._rebuild_from(table.records)
+            self._signature = sig
+        self.save()
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY_S, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            data = {"version": 2, "csv_signature": self._signature,
+                    "students": {k: a.to_json() for k, a in self._students.items()}}
+        tmp = self.store_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.store_path)
+        except Exception as e:
+            print(f"[WARN] could not save {AGGREGATES_FILE}: {e}")
+
+    # ---------------------- reads ----------------------
+    def student(self, username=None, registration=None):
+        """
+        StudentAggregate over every row matching the username (as a username, a
+        full name, or a substring of a username) or the registration number;
+        None if never present. Cached until the next change.
+        """
+        user = normalize_username(username)
+        reg = str(registration or "").strip()
+        with self._lock:
+            if (user, reg) in self._unions:
+                return self._unions[(user, reg)]
+            keys = lookup_keys(self._students, user, reg)
+            agg = self._unions[(user, reg)] = StudentAggregate.union(self._students.get(k) for k in keys)
+            return agg
+
+    def present_days(self, username=None, registration=None):
+        agg = self.student(username, registration)
+        return agg.present_days if agg else 0
+
+    def __len__(self):
+        return len(self._students)
+
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def get_attendance_aggregates(csv_path=None):
+    """
+    Process-wide aggregates for csv_path: loaded (or rebuilt) on first call, then
+    kept current from attendance_writer and the attendance repository.
+    """
+    csv_path = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    with _aggregates_lock:
+        agg = _aggregates.get(csv_path)
+        if agg is None:
+            store = os.path.join(os.path.dirname(csv_path), AGGREGATES_FILE)
+            agg = _aggregates[csv_path] = AttendanceAggregates(csv_path, store)
+            agg.load()
+            attendance_writer.add_write_listener(agg.on_row_written)
+            get_attendance_repository(csv_path).subscribe(agg.on_records)
+        return agg
@@ -0,0 +1,414 @@
+"""
+attendance_columns.py
+
+Columnar, dictionary-encoded copy of the attendance table for analytics.
+
+The repository keeps one AttendanceRecord (a namedtuple of strings) per row,
+which is what the record pages show, but filters and group-bys over it are
+Python loops, and the report paths that went through pandas first coerced
+every column to str. Here each row is a handful of fixed-width numbers:
+ - username / full name / registration / department: int32 codes into
+   per-column dictionaries (a few hundred distinct strings, stored once),
+ - date: int32 day number (days since 1970-01-01, NO_DAY if unparseable),
+ - status: one bit in a packed bitset.
+
+A substring search matches against the dictionaries (hundreds of strings)
+and then selects rows with one vectorized isin; the distinct-count group-bys
+(present students per day, present days per student, present per
+department) scatter the codes into a boolean grid and sum its rows/columns.
+The teacher dashboard's present-today card shows present_per_department; the
+record search uses search(); --report prints the per-day counts.
+
+Row i is record i of the repository table the columns were built from;
+get_attendance_columns() appends the rows the repository parsed since the
+last call and re-encodes after a rewrite. numpy is optional: without it
+get_attendance_columns() returns None and callers keep their record loops.
+
+    python attendance_columns.py --bench [--rows N]    # memory per million rows + query timings
+    python attendance_columns.py --report              # present per day / department from Attendance.csv
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import date, timedelta
+
+# ---------- Optional third-party imports (defensive) ----------
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from attendance_repository import AttendanceRecord, get_attendance_repository, normalize_username
+
+# ---------- Configuration ----------
+ATTENDANCE_CSV = "Attendance.csv"
+INITIAL_CAPACITY = 1024
+BENCH_ROWS = 1000000
+DENSE_GRID_LIMIT = 1 << 25     # cells of the day x student grid used for distinct-count group-bys
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+NO_DAY = -(2 ** 31)
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def day_number(d):
+    """int32 day number for a datetime.date (NO_DAY for None)."""
+    return d.toordinal() - EPOCH_ORDINAL if d else NO_DAY
+
+
+def day_from_number(n):
+    return date.fromordinal(int(n) + EPOCH_ORDINAL)
+
+
+class StringDictionary:
+    """Distinct strings of one column; code = position in `values`."""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+        self._lowered = None        # values lower-cased, built on the first substring search
+
+    def encode(self, s):
+        code = self._codes.get(s)
+        if code is None:
+            code = self._codes[s] = len(self.values)
+            self.values.append(s)
+            self._lowered = None
+        return code
+
+    def code(self, s):
+        """Code of s, or -1 if the column never had that value."""
+        return self._codes.get(s, -1)
+
+    def containing(self, needle):
+        """int32 array of the codes whose value contains needle (case-insensitive)."""
+        if self._lowered is None or len(self._lowered) != len(self.values):
+            self._lowered = [v.lower() for v in self.values]
+        needle = needle.lower()
+        return np.array([i for i, v in enumerate(self._lowered) if needle in v], dtype=np.int32)
+
+    def nbytes(self):
+        return sum(sys.getsizeof(v) for v in self.values) + sys.getsizeof(self._codes) + sys.getsizeof(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class AttendanceColumns:
+    """Growable int32 columns + a status bitset; append-only like the repository table."""
+
+    CODED = ("user", "name", "reg", "dept")
+
+    def __init__(self, records=()):
+        self.dicts = {c: StringDictionary() for c in self.CODED}
+        self._cols = {c: np.empty(0, dtype=np.int32) for c in self.CODED + ("day",)}
+        self._status = np.zeros(0, dtype=np.uint8)
+        self.n = 0
+        self.table = None           # repository table row i corresponds to
+        self.extend(records)
+
+    # ---------------------- building ----------------------
+    def _reserve(self, n):
+        cap = len(self._cols["day"])
+        if n <= cap:
+            return
+        cap = max(INITIAL_CAPACITY, cap)
+        while cap < n:
+            cap *= 2
+        for c, col in self._cols.items():
+            grown = np.empty(cap, dtype=np.int32)
+            grown[:self.n] = col[:self.n]
+            self._cols[c] = grown
+        bits = np.zeros((cap + 7) // 8, dtype=np.uint8)
+        bits[:len(self._status)] = self._status
+        self._status = bits
+
+    def _set_status(self, start, flags):
+        """Write the bits for rows start .. start+len(flags) (re-packs only the bytes they touch)."""
+        lo, hi = start // 8, (start + len(flags) + 7) // 8
+        seg = np.unpackbits(self._status[lo:hi])
+        seg[start - lo * 8:start - lo * 8 + len(flags)] = flags
+        self._status[lo:hi] = np.packbits(seg)
+
+    def extend(self, records):
+        records = list(records)
+        if not records:
+            return
+        start, k = self.n, len(records)
+        self._reserve(start + k)
+        enc = {c: self.dicts[c].encode for c in self.CODED}
+        self._cols["user"][start:start + k] = [enc["user"](r.username_norm) for r in records]
+        self._cols["name"][start:start + k] = [enc["name"](r.full_name) for r in records]
+        self._cols["reg"][start:start + k] = [enc["reg"](r.registration) for r in records]
+        self._cols["dept"][start:start + k] = [enc["dept"](r.department) for r in records]
+        self._cols["day"][start:start + k] = [day_number(r.date) for r in records]
+        self._set_status(start, np.array([r.present for r in records], dtype=np.uint8))
+        self.n = start + k
+
+    # ---------------------- columns ----------------------
+    def __len__(self):
+        return self.n
+
+    def column(self, name):
+        """int32 view of a coded column ("user", "name", "reg", "dept") or "day"."""
+        return self._cols[name][:self.n]
+
+    @property
+    def present(self):
+        """bool array, one per row (unpacked from the bitset)."""
+        return np.unpackbits(self._status, count=self.n).view(bool)
+
+    def nbytes(self):
+        """{part: bytes} for the resident data (columns at their current capacity, bitset, dictionaries)."""
+        out = {c: col.nbytes for c, col in self._cols.items()}
+        out["status"] = self._status.nbytes
+        for c, d in self.dicts.items():
+            out[f"{c}_dict"] = d.nbytes()
+        return out
+
+    # ---------------------- filters ----------------------
+    def mask(self, username=None, registration=None, department=None, start=None, end=None, present=None):
+        """bool mask of rows matching every given condition (dates inclusive, datetime.date)."""
+        m = np.ones(self.n, dtype=bool)
+        for col, value in (("user", normalize_username(username) if username else None),
+                           ("reg", str(registration).strip() if registration else None),
+                           ("dept", str(department).strip() if department else None)):
+            if value is not None:
+                m &= self.column(col) == self.dicts[col].code(value)
+        if start is not None or end is not None:
+            day = self.column("day")
+            m &= day != NO_DAY
+            if start is not None:
+                m &= day >= day_number(start)
+            if end is not None:
+                m &= day <= day_number(end)
+        if present is not None:
+            m &= self.present if present else ~self.present
+        return m
+
+    def contains(self, needle, columns=("reg", "name", "user")):
+        """bool mask of rows where any of `columns` contains needle (case-insensitive)."""
+        m = np.zeros(self.n, dtype=bool)
+        needle = (needle or "").strip()
+        if not needle:
+            return m
+        for c in columns:
+            codes = self.dicts[c].containing(needle)
+            if len(codes):
+                m |= np.isin(self.column(c), codes)
+        return m
+
+    def search(self, name_query="", reg_query=""):
+        """Row indices for AttendanceTable.search's rule: name in (full name, username) OR reg in (registration, username)."""
+        m = self.contains(name_query, ("name", "user")) | self.contains(reg_query, ("reg", "user"))
+        return np.flatnonzero(m)
+
+    def records(self, rows):
+        """Repository records for row indices."""
+        recs = self.table.records
+        return [recs[i] for i in rows]
+
+    # ---------------------- group-bys ----------------------
+    def _present_grid(self, mask=None):
+        """
+        (first day number, bool grid [day, user]) of who was present when, from the
+        present rows with a date and a username. Distinct (day, user) pairs fall out
+        of scattering into the grid, no sort; None if the grid would exceed
+        DENSE_GRID_LIMIT cells (then callers use np.unique instead).
+        """
+        day, user = self.column("day"), self.column("user")
+        m = self.present & (day != NO_DAY) & (user != self.dicts["user"].code(""))
+        if mask is not None:
+            m &= mask
+        day, user = day[m], user[m]
+        if not len(day):
+            return 0, np.zeros((0, len(self.dicts["user"])), dtype=bool)
+        first = int(day.min())
+        span, n_users = int(day.max()) - first + 1, len(self.dicts["user"])
+        if span * n_users > DENSE_GRID_LIMIT:
+            return None
+        grid = np.zeros((span, n_users), dtype=bool)
+        grid[day - first, user] = True
+        return first, grid
+
+    def _present_pairs(self, mask=None):
+        """Distinct (day, user) of present rows as two arrays (sort-based; for grids too big to allocate)."""
+        day, user = self.column("day"), self.column("user")
+        m = self.present & (day != NO_DAY) & (user != self.dicts["user"].code(""))
+        if mask is not None:
+            m &= mask
+        day = day[m].astype(np.int64)
+        first = int(day.min()) if len(day) else 0
+        keys = np.unique(((day - first) << 32) | user[m].astype(np.int64))
+        return (keys >> 32) + first, keys & 0xFFFFFFFF
+
+    def present_per_day(self, start=None, end=None):
+        """(dates, distinct present students) for each day with attendance in [start, end]."""
+        mask = self.mask(start=start, end=end) if (start or end) else None
+        dense = self._present_grid(mask)
+        if dense is not None:
+            first, grid = dense
+            counts = grid.sum(axis=1)
+            days = np.flatnonzero(counts)
+            return [day_from_number(first + d) for d in days], counts[days].tolist()
+        days, _users = self._present_pairs(mask)
+        uniq, counts = np.unique(days, return_counts=True)
+        return [day_from_number(d) for d in uniq], counts.tolist()
+
+    def present_days_per_user(self):
+        """{username: distinct present days}."""
+        dense = self._present_grid()
+        if dense is not None:
+            counts = dense[1].sum(axis=0)
+        else:
+            counts = np.bincount(self._present_pairs()[1], minlength=len(self.dicts["user"]))
+        return {self.dicts["user"].values[c]: int(counts[c]) for c in np.flatnonzero(counts)}
+
+    def present_per_department(self, day):
+        """{department: distinct students present on day}."""
+        m = self.mask(start=day, end=day, present=True)
+        m &= self.column("user") != self.dicts["user"].code("")
+        grid = np.zeros((len(self.dicts["dept"]), len(self.dicts["user"])), dtype=bool)
+        grid[self.column("dept")[m], self.column("user")[m]] = True
+        counts = grid.sum(axis=1)
+        return {self.dicts["dept"].values[c]: int(counts[c]) for c in np.flatnonzero(counts)}
+
+
+_columns = {}
+_columns_lock = threading.Lock()
+
+
+def get_attendance_columns(csv_path=None):
+    """
+    Columnar view of csv_path's attendance, brought up to date with the repository
+    on each call: rows appended since the last call are encoded, a rewritten file
+    is re-encoded. None without numpy.
+    """
+    if np is None:
+        return None
+    csv_path = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    table = get_attendance_repository(csv_path).snapshot()
+    with _columns_lock:
+        cols = _columns.get(csv_path)
+        if cols is None or cols.table.lineage is not table.lineage:
+            cols = AttendanceColumns()
+            _columns[csv_path] = cols
+        if cols.n < len(table.records):
+            cols.extend(table.records[cols.n:])
+        cols.table = table
+        return cols
+
+
+# ---------------------- Benchmark / report ----------------------
+def _synthetic_records(n_rows, n_students=400):
+    day0 = date.today() - timedelta(days=365)
+    depts = ("CSE", "ECE", "ME", "CE")
+    out = []
+    for i in range(n_rows):
+        s = i % n_students
+        d = day0 + timedelta(days=(i // n_students) % 365)
+        user = f"student{s}"
+        out.append(AttendanceRecord(f"REG{s:05d}", f"Student {s}", user, user, depts[s % 4],
+                                    d, d.isoformat(), "09:00:00", "Present", i % 7 != 0))
+    return out
+
+
+def _rows_as_dicts(records):
+    """What DictReader hands the old analytics code: one dict of str per row."""
+    return [{"Registration No": r.registration, "FullName": r.full_name, "Username": r.username,
+             "Department": r.department, "Date": r.date_text, "Time": r.time, "Status": r.status}
+            for r in records]
+
+
+def _deep_size(rows):
+    seen = set()
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row)
+        for v in row.values():
+            if id(v) not in seen:
+                seen.add(id(v))
+                total += sys.getsizeof(v)
+    return total
+
+
+def benchmark(n_rows=BENCH_ROWS):
+    if np is None:
+        print("numpy is required.")
+        return
+    records = _synthetic_records(n_rows)
+    t0 = time.perf_counter()
+    cols = AttendanceColumns(records)
+    t_build = time.perf_counter() - t0
+    per_m = 1e6 / n_rows
+    parts = cols.nbytes()
+    col_bytes = sum(parts.values())
+    exact = n_rows * (5 * 4) + (n_rows + 7) // 8 + sum(v for k, v in parts.items() if k.endswith("_dict"))
+    dict_bytes = _deep_size(_rows_as_dicts(records[:100000])) * (n_rows / min(n_rows, 100000))
+    print(f"{n_rows} rows, {len(cols.dicts['user'])} students; columns built in {t_build:.2f} s")
+    print(f"memory per 1M rows: columns {col_bytes * per_m / 2**20:7.1f} MiB (capacity) / "
+          f"{exact * per_m / 2**20:7.1f} MiB (exact) | list of dicts ~{dict_bytes * per_m / 2**20:7.1f} MiB")
+    for k, v in sorted(parts.items()):
+        print(f"  {k:<10} {v / 2**20:8.2f} MiB")
+
+    def timed(label, fn, py_fn):
+        t0 = time.perf_counter()
+        fn()
+        t_np = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        py_fn()
+        t_py = time.perf_counter() - t0
+        print(f"{label:<28} columns {t_np * 1000:8.1f} ms | records loop {t_py * 1000:8.1f} ms ({t_py / t_np:5.1f}x)")
+
+    def py_per_day():
+        per = {}
+        for r in records:
+            if r.present and r.date and r.username_norm:
+                per.setdefault(r.date, set()).add(r.username_norm)
+        return {d: len(u) for d, u in per.items()}
+
+    def py_per_user():
+        per = {}
+        for r in records:
+            if r.present and r.date and r.username_norm:
+                per.setdefault(r.username_norm, set()).add(r.date)
+        return {u: len(d) for u, d in per.items()}
+
+    def py_search():
+        return [i for i, r in enumerate(records) if "t12" in r.full_name.lower() or "t12" in r.username_norm]
+
+    timed("present students per day", lambda: cols.present_per_day(), py_per_day)
+    timed("present days per student", lambda: cols.present_days_per_user(), py_per_user)
+    timed("name search 't12'", lambda: cols.search("t12"), py_search)
+    assert dict(zip(*cols.present_per_day())) == py_per_day(), "per-day counts disagree"
+    assert cols.present_days_per_user() == py_per_user(), "per-student counts disagree"
+    assert cols.search("t12").tolist() == py_search(), "search disagrees"
+
+
+def report(csv_path=None):
+    cols = get_attendance_columns(csv_path)
+    if cols is None:
+        print("numpy is required.")
+        return
+    today = date.today()
+    dates, counts = cols.present_per_day(today - timedelta(days=13), today)
+    print(f"{len(cols)} rows, {len(cols.dicts['user'])} usernames")
+    print("present students, last 14 days:")
+    for d, c in zip(dates, counts):
+        print(f"  {d.isoformat()}  {c}")
+    print(f"present today by department: {cols.present_per_department(today) or '-'}")
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        n = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else BENCH_ROWS
+        benchmark(n)
+    elif "--report" in sys.argv:
+        report()
+    else:
+        print(__doc__)
@@ -0,0 +1,505 @@
+"""
+attendance_db.py
+
+SQLite attendance store (attendance.db, WAL mode).
+
+Attendance.csv is a flat log that every reader re-parses in full with its own
+column guessing. The store keeps the same rows in one normalized table:
+
+    attendance(id, registration, full_name, username, username_norm,
+               department, date, time, status, present)
+
+ - date is ISO YYYY-MM-DD (whatever the CSV held is parsed on import),
+ - username_norm is the lower-cased username every reader compares against,
+ - present is 1 when status is one of the "present" spellings the UI accepts,
+ - UNIQUE(registration, date) and UNIQUE(username_norm, date) reject a second
+   row for the same student on the same day. Missing ids are stored as NULL, so
+   a row without a registration number never collides on it. The two unique
+   indexes are also the (registration, date) / (username, date) lookup indexes.
+
+WAL lets the dashboard read while the attendance writer appends. Connections
+are per thread (sqlite3 connections are thread-bound); every query below is a
+fixed SQL string, so sqlite3's statement cache prepares it once per connection.
+
+With ATTENDANCE_BACKEND = "sqlite" (attendance_writer) these queries serve the
+record pages through active_attendance_db():
+    last_rows(limit)                  main._last_attendance_rows
+    present_dates_for(user, reg)      Face_Reconition_System.get_attendance_counts
+    timeseries_for(user)              main._attendance_timeseries_for_user
+    search(name, reg)                 Face_Reconition_System._populate_attendance_tree_filtered
+    all_rows()                        Face_Reconition_System._populate_attendance_tree
+    rows_for_user(user)               ViewAttendancePage._read_csv_prepare_rows
+    present_days_in_month(user, y, m) ViewAttendancePage._get_present_days
+    insert(...)                       attendance_writer.mark_present duplicate check
+The teacher KPIs and the live teacher table follow the CSV, which this backend
+still writes. count_rows / present_usernames_on / is_present are kept for the
+CLI and the benchmark.
+
+The table is synced from the CSV whenever get_attendance_db() sees the CSV's
+(size, mtime) differ from the last sync, so rows written by other tools (or
+before the switch to sqlite) are never missing.
+
+CSV compatibility:
+    python attendance_db.py --import [Attendance.csv]
+    python attendance_db.py --export [out.csv]
+    python attendance_db.py --bench [--rows N]     # queries vs the CSV scans
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from datetime import date, timedelta
+
+import attendance_writer
+from date_parsing import iso_date
+
+# ---------- Configuration ----------
+ATTENDANCE_DB = "attendance.db"
+ATTENDANCE_CSV = "Attendance.csv"
+ATTENDANCE_HEADER = ["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"]
+PRESENT_VALUES = {"present", "p", "1", "yes", "true", "y", "present✓", "present✔", "present✅"}
+BENCH_ROWS = 200000
+CSV_PROBE_BYTES = 64            # head / tail bytes kept with the synced CSV's signature to spot a rewrite
+
+# CSV header variants accepted on import (lower-cased), same spellings the readers look for
+_COLUMN_ALIASES = {
+    "registration": ("registration no", "registration", "registrationno", "registration_no", "reg no", "regno",
+                     "studentid", "student_id", "student id"),
+    "full_name": ("fullname", "full name", "full_name", "name"),
+    "username": ("username", "user", "user name", "user_name"),
+    "department": ("department", "dept", "course"),
+    "date": ("date", "day", "datetime", "timestamp"),
+    "time": ("time",),
+    "status": ("status", "presence", "state"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    id            INTEGER PRIMARY KEY,
+    registration  TEXT,
+    full_name     TEXT NOT NULL DEFAULT '',
+    username      TEXT NOT NULL DEFAULT '',
+    username_norm TEXT,
+    department    TEXT NOT NULL DEFAULT '',
+    date          TEXT NOT NULL,
+    time          TEXT NOT NULL DEFAULT '',
+    status        TEXT NOT NULL DEFAULT '',
+    present       INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_reg_date ON attendance(registration, date);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_user_date ON attendance(username_norm, date);
+CREATE INDEX IF NOT EXISTS ix_attendance_date ON attendance(date, present);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_INSERT = ("INSERT OR IGNORE INTO attendance "
+           "(registration, full_name, username, username_norm, department, date, time, status, present) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+_ROW_COLUMNS = "registration, full_name, username, department, date, time, status"
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def normalize_username(u):
+    return str(u or "").strip().lower()
+
+
+def is_present_status(status):
+    return str(status or "").strip().lower() in PRESENT_VALUES
+
+
+def resolve_columns(fieldnames):
+    lower = {str(h).strip().lower(): h for h in (fieldnames or [])}
+    cols = {}
+    for field, aliases in _COLUMN_ALIASES.items():
+        cols[field] = next((lower[a] for a in aliases if a in lower), None)
+    return cols
+
+
+def _file_signature(path):
+    """[size, mtime_ns, first CSV_PROBE_BYTES (hex), last CSV_PROBE_BYTES (hex)], or None if missing."""
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            head = f.read(CSV_PROBE_BYTES)
+            f.seek(max(0, st.st_size - CSV_PROBE_BYTES))
+            tail = f.read(CSV_PROBE_BYTES)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns, head.hex(), tail.hex()]
+
+
+def _appended_to(path, old, sig):
+    """True if the file (now `sig`) is the one `old` describes with rows appended, nothing rewritten."""
+    if old is None or len(old) < 4 or sig[0] <= old[0] or sig[2][:len(old[2])] != old[2]:
+        return False
+    with open(path, "rb") as f:
+        f.seek(max(0, old[0] - CSV_PROBE_BYTES))
+        return f.read(old[0] - max(0, old[0] - CSV_PROBE_BYTES)).hex() == old[3]
+
+
+def _record(registration, full_name, username, department, date_iso, time_str, status):
+    reg = str(registration or "").strip()
+    user = str(username or "").strip()
+    return (reg or None, str(full_name or "").strip(), user, normalize_username(user) or None,
+            str(department or "").strip(), date_iso, str(time_str or "").strip(),
+            str(status or "").strip(), 1 if is_present_status(status) else 0)
+
+
+class AttendanceDB:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._init_schema()
+
+    # ---------------------- connections ----------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---------------------- writes ----------------------
+    def insert(self, registration, full_name, username, department, date_str, time_str, status="Present"):
+        """
+        Add one row. Returns False (nothing written) if the student already has a row
+        for that day -- the unique indexes decide, so the check and the write are one step.
+        """
+        date_iso = iso_date(date_str)
+        if not date_iso:
+            raise ValueError(f"unparseable date {date_str!r}")
+        conn = self._conn()
+        with self._write_lock, conn:
+            cur = conn.execute(_INSERT, _record(registration, full_name, username, department,
+                                                date_iso, time_str, status))
+        return cur.rowcount == 1
+
+    def import_csv(self, csv_path):
+        """Load an Attendance.csv (any of the accepted header spellings). Returns (imported, skipped)."""
+        imported = skipped = 0
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            cols = resolve_columns(reader.fieldnames)
+
+            def value(row, field):
+                c = cols[field]
+                return (row.get(c) or "") if c else ""
+
+            batch = []
+            for row in reader:
+                raw_date = value(row, "date").strip()
+                date_iso = iso_date(raw_date)
+                if not date_iso:
+                    skipped += 1
+                    continue
+                time_str = value(row, "time")
+                if not time_str and " " in raw_date:
+                    time_str = raw_date.split(" ", 1)[1]
+                batch.append(_record(value(row, "registration"), value(row, "full_name"), value(row, "username"),
+                                     value(row, "department"), date_iso, time_str, value(row, "status")))
+        conn = self._conn()
+        with self._write_lock, conn:
+            before = conn.total_changes
+            conn.executemany(_INSERT, batch)
+            imported = conn.total_changes - before
+        skipped += len(batch) - imported
+        return imported, skipped
+
+    # ---------------------- CSV sync ----------------------
+    def _csv_signature(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'csv_signature'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_csv_synced(self, csv_path):
+        """Record that the CSV as it is now is fully in the table (the writer calls this after its own append)."""
+        sig = _file_signature(csv_path)
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_signature', ?)", (json.dumps(sig),))
+
+    def sync_csv(self, csv_path):
+        """
+        Bring the table in line with Attendance.csv if the CSV changed since the last sync
+        (written by another tool, or the database is new). Rows appended to the CSV are
+        imported (INSERT OR IGNORE, so rows already in the table are skipped); any other
+        change (shrunk, same size with a new mtime, or the head / the bytes before the
+        synced end differ) means it was rewritten, and the table is rebuilt from it.
+        Returns True if anything was imported.
+        """
+        sig = _file_signature(csv_path)
+        old = self._csv_signature()
+        if sig is None or sig == old:
+            return False
+        if old is not None and not _appended_to(csv_path, old, sig):
+            conn = self._conn()
+            with self._write_lock, conn:
+                conn.execute("DELETE FROM attendance")
+        imported, skipped = self.import_csv(csv_path)
+        self.mark_csv_synced(csv_path)
+        if imported:
+            print(f"[INFO] attendance.db synced from {os.path.basename(csv_path)}: "
+                  f"{imported} row(s), {skipped} skipped (duplicate or undated)")
+        return imported > 0
+
+    def export_csv(self, csv_path):
+        """Write every row as an Attendance.csv (original header, insertion order). Returns the row count."""
+        tmp = csv_path + ".tmp"
+        n = 0
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(ATTENDANCE_HEADER)
+            for reg, full, user, dept, d, t, st in self.all_rows():
+                w.writerow([reg or "", full, user, dept, d, t, st])
+                n += 1
+        os.replace(tmp, csv_path)
+        return n
+
+    # ---------------------- reads ----------------------
+    def count_rows(self):
+        return self._conn().execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+
+    def present_usernames_on(self, date_str):
+        """Normalized usernames marked present on date_str."""
+        rows = self._conn().execute(
+            "SELECT DISTINCT username_norm FROM attendance "
+            "WHERE date = ? AND present = 1 AND username_norm IS NOT NULL", (iso_date(date_str),))
+        return {r[0] for r in rows}
+
+    def distinct_usernames(self):
+        rows = self._conn().execute("SELECT DISTINCT username_norm FROM attendance WHERE username_norm IS NOT NULL")
+        return {r[0] for r in rows}
+
+    def last_rows(self, limit=5):
+        """Newest first: (registration, full_name, username, department, date, time, status)."""
+        return self._conn().execute(
+            f"SELECT {_ROW_COLUMNS} FROM attendance ORDER BY id DESC LIMIT ?", (int(limit),)).fetchall()
+
+    def present_dates_for(self, username, registration=None):
+        """
+        ISO dates the student was present: rows whose username contains the login
+        username, whose full name equals it, or whose registration matches.
+        """
+        user = normalize_username(username) or None
+        rows = self._conn().execute(
+            "SELECT date FROM attendance WHERE present = 1 AND instr(username_norm, ?1) > 0 "
+            "UNION SELECT date FROM attendance WHERE present = 1 AND lower(full_name) = ?1 "
+            "UNION SELECT date FROM attendance WHERE present = 1 AND registration = ?2",
+            (user, str(registration or "").strip() or None))
+        return {r[0] for r in rows}
+
+    def timeseries_for(self, username):
+        """[(iso_date, present 0/1)] in date order, one entry per day with any row."""
+        return self._conn().execute(
+            "SELECT date, MAX(present) FROM attendance WHERE username_norm = ? GROUP BY date ORDER BY date",
+            (normalize_username(username),)).fetchall()
+
+    def search(self, name_query="", reg_query=""):
+        """Rows whose name/username contains name_query OR registration/username contains reg_query."""
+        qn = "%" + str(name_query or "").strip().lower() + "%" if str(name_query or "").strip() else None
+        qr = "%" + str(reg_query or "").strip().lower() + "%" if str(reg_query or "").strip() else None
+        if not qn and not qr:
+            return []
+        return self._conn().execute(
+            f"SELECT {_ROW_COLUMNS} FROM attendance WHERE "
+            "(?1 IS NOT NULL AND (lower(full_name) LIKE ?1 OR username_norm LIKE ?1)) OR "
+            "(?2 IS NOT NULL AND (lower(registration) LIKE ?2 OR username_norm LIKE ?2)) ORDER BY id",
+            (qn, qr)).fetchall()
+
+    def rows_for_user(self, username):
+        return self._conn().execute(
+            f"SELECT {_ROW_COLUMNS} FROM attendance WHERE username_norm = ? ORDER BY date, time",
+            (normalize_username(username),)).fetchall()
+
+    def present_days_in_month(self, username, year, month):
+        """Day-of-month numbers the user was present in year/month."""
+        first = date(int(year), int(month), 1)
+        nxt = (first + timedelta(days=32)).replace(day=1)
+        rows = self._conn().execute(
+            "SELECT DISTINCT date FROM attendance WHERE username_norm = ? AND date >= ? AND date < ? AND present = 1",
+            (normalize_username(username), first.isoformat(), nxt.isoformat()))
+        return {int(r[0][8:10]) for r in rows}
+
+    def all_rows(self):
+        return self._conn().execute(f"SELECT {_ROW_COLUMNS} FROM attendance ORDER BY id").fetchall()
+
+    def is_present(self, date_str, registration=None, username=None):
+        """Same rule as the CSV duplicate check: registration OR username already has a row that day."""
+        reg = str(registration or "").strip() or None
+        user = normalize_username(username) or None
+        row = self._conn().execute(
+            "SELECT 1 FROM attendance WHERE date = ?1 AND registration = ?2 "
+            "UNION ALL SELECT 1 FROM attendance WHERE date = ?1 AND username_norm = ?3 LIMIT 1",
+            (iso_date(date_str), reg, user)).fetchone()
+        return row is not None
+
+    def explain(self, sql, params=()):
+        """Query plan lines (used by the benchmark to show which index a query takes)."""
+        return [r[-1] for r in self._conn().execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+_dbs = {}
+_dbs_lock = threading.Lock()
+
+
+def get_attendance_db(db_path=None, csv_path=None):
+    """
+    Process-wide AttendanceDB (attendance.db next to the CSV unless db_path is
+    given), synced with Attendance.csv on every call: a new
+    database imports the CSV, and rows another tool appended to the CSV since the
+    last sync are imported (one stat() when nothing changed).
+    """
+    csv_path = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    db_path = os.path.abspath(db_path or os.path.join(os.path.dirname(csv_path), ATTENDANCE_DB))
+    with _dbs_lock:
+        db = _dbs.get(db_path)
+        if db is None:
+            db = _dbs[db_path] = AttendanceDB(db_path)
+    db.sync_csv(csv_path)
+    return db
+
+
+def active_attendance_db(csv_path=None):
+    """The synced AttendanceDB when attendance_writer.ATTENDANCE_BACKEND is "sqlite", else None."""
+    if attendance_writer.ATTENDANCE_BACKEND != "sqlite":
+        return None
+    return get_attendance_db(csv_path=csv_path)
+
+
+# ---------------------- Benchmark ----------------------
+def _write_synthetic_csv(path, n_rows, n_students=400, seed=7):
+    import random
+    rnd = random.Random(seed)
+    day0 = date.today() - timedelta(days=n_rows // max(1, n_students) + 1)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(ATTENDANCE_HEADER)
+        written, d = 0, day0
+        while written < n_rows:
+            for s in rnd.sample(range(n_students), k=min(n_students, n_rows - written)):
+                status = "Present" if rnd.random() < 0.9 else "Absent"
+                w.writerow([f"D{220000000 + s}", f"Student {s}", f"student{s}", "CSE", d.isoformat(),
+                            f"{8 + s % 8:02d}:{s % 60:02d}:00", status])
+                written += 1
+            d += timedelta(days=1)
+
+
+def _csv_scan_counts(path, username):
+    """The CSV paths as they read today: one full DictReader pass per query."""
+    days = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if normalize_username(row.get("Username")) == username and is_present_status(row.get("Status")):
+                days.add(iso_date(row.get("Date")))
+    return days
+
+
+def _csv_scan_today(path, day):
+    out = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if (row.get("Date") or "").strip() == day and is_present_status(row.get("Status")):
+                out.add(normalize_username(row.get("Username")))
+    return out
+
+
+def _csv_scan_last(path, limit):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))[-limit:]
+
+
+def _csv_scan_month(path, username, year, month):
+    days = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if normalize_username(row.get("Username")) != username:
+                continue
+            d = iso_date(row.get("Date"))
+            if d and int(d[:4]) == year and int(d[5:7]) == month:
+                days.add(int(d[8:10]))
+    return days
+
+
+def benchmark(n_rows=BENCH_ROWS, repeats=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "Attendance.csv")
+        _write_synthetic_csv(csv_path, n_rows)
+        db = AttendanceDB(os.path.join(tmp, "attendance.db"))
+        t0 = time.perf_counter()
+        imported, skipped = db.import_csv(csv_path)
+        print(f"{n_rows} rows: import {time.perf_counter() - t0:.2f} s ({imported} imported, {skipped} skipped), "
+              f"CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, db {_db_bytes(db.path) / 1e6:.1f} MB")
+
+        last_day = db.last_rows(1)[0][4]
+        y, m = int(last_day[:4]), int(last_day[5:7])
+        cases = [
+            ("present days (student)", lambda: _csv_scan_counts(csv_path, "student7"),
+             lambda: db.present_dates_for("student7", "D220000007")),
+            ("present today", lambda: _csv_scan_today(csv_path, last_day),
+             lambda: db.present_usernames_on(last_day)),
+            ("last 5 rows", lambda: _csv_scan_last(csv_path, 5), lambda: db.last_rows(5)),
+            ("calendar month", lambda: _csv_scan_month(csv_path, "student7", y, m),
+             lambda: db.present_days_in_month("student7", y, m)),
+            ("duplicate check", lambda: _csv_scan_today(csv_path, last_day),
+             lambda: db.is_present(last_day, "D220000007", "student7")),
+        ]
+        print(f"{'query':<24} {'csv scan':>12} {'sqlite':>12} {'speed-up':>10}")
+        for name, scan, query in cases:
+            t_csv = _best_of(scan, max(1, repeats // 2))
+            t_db = _best_of(query, repeats)
+            print(f"{name:<24} {t_csv * 1000:9.1f} ms {t_db * 1000:9.3f} ms {t_csv / max(t_db, 1e-9):9.0f}x")
+        for line in db.explain("SELECT date FROM attendance WHERE present = 1 AND username_norm = ?", ("x",)):
+            print(f"  plan: {line}")
+        db.close()
+
+
+def _db_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def _best_of(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--import"]:
+        src = args[1] if len(args) > 1 else _here(ATTENDANCE_CSV)
+        imported, skipped = get_attendance_db().import_csv(src)
+        print(f"[INFO] imported {imported} row(s) from {src}, {skipped} skipped (duplicate or undated)")
+    elif args[:1] == ["--export"]:
+        dst = args[1] if len(args) > 1 else _here("Attendance.export.csv")
+        print(f"[INFO] exported {get_attendance_db().export_csv(dst)} row(s) to {dst}")
+    elif args[:1] == ["--bench"]:
+        n = int(args[args.index("--rows") + 1]) if "--rows" in args else BENCH_ROWS
+        benchmark(n)
+    else:
+        db = get_attendance_db()
+        print(f"{db.path}: {db.count_rows()} row(s)")
+        print("usage: python attendance_db.py --import [csv] | --export [csv] | --bench [--rows N]")
@@ -0,0 +1,350 @@
+"""
+attendance_repository.py
+
+One cached, typed view of Attendance.csv shared by every page.
+
+The dashboard counters, the graphs, the records tables and the calendar used
+to open and parse the CSV themselves, each with its own header guessing. They
+now ask the repository, which
+ - resolves the header once (the same column spellings the pages accepted),
+ - parses every row once into an AttendanceRecord (stripped strings, a
+   datetime.date, a present flag, the lower-cased username),
+ - keeps per-user and per-day indexes over the records,
+ - re-parses only when the file's (size, mtime) changes.
+
+Appends are read incrementally: the repository remembers the byte offset it
+has parsed up to and, when the file grows, parses only the new lines and
+publishes the table extended with them (same lineage, so records only ever
+grow along it; the previous table is left untouched for threads still reading
+it). The file is parsed from scratch only if it shrank or its header / the
+bytes just before the offset changed, i.e. it was rewritten (delete, edit,
+export-over). A file whose last row has no trailing newline still yields that
+row; if the next write continues that line instead of starting a new one, the
+file is re-parsed.
+Subscribers get every batch of new records, so a watcher refresh costs O(new
+rows) instead of a full re-read:
+
+    repo.subscribe(lambda records, reloaded: ...)
+"""
+
+import io
+import os
+import csv
+import threading
+import traceback
+from collections import namedtuple
+
+from attendance_db import ATTENDANCE_HEADER, PRESENT_VALUES, resolve_columns
+from date_parsing import ColumnDateParser
+
+# ---------- Configuration ----------
+ATTENDANCE_CSV = "Attendance.csv"
+TAIL_PROBE_BYTES = 64          # bytes before the parsed offset compared to detect a rewrite
+
+AttendanceRecord = namedtuple(
+    "AttendanceRecord",
+    "registration full_name username username_norm department date date_text time status present")
+# date: datetime.date or None; date_text: the CSV's date value (without a trailing time); present: bool
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def normalize_username(u):
+    return str(u or "").strip().lower()
+
+
+def _index(records, key, base=None):
+    """{key: tuple of records}; with base, a copy of it with records added (base is not modified)."""
+    added = {}
+    for r in records:
+        k = key(r)
+        if k:
+            added.setdefault(k, []).append(r)
+    out = dict(base) if base else {}
+    for k, rs in added.items():
+        out[k] = out.get(k, ()) + tuple(rs)
+    return out
+
+
+class AttendanceTable:
+    """
+    Parsed rows of the CSV plus per-user / per-day indexes. Never changed once
+    published: appended rows produce a new table (extended()) that shares the
+    untouched index entries and carries the same lineage; a rewrite starts a new one.
+    """
+
+    def __init__(self, records=(), _base=None):
+        if _base is None:
+            self.records = tuple(records)
+            self.by_user = _index(self.records, lambda r: r.username_norm)
+            self.by_date = _index(self.records, lambda r: r.date)
+            self.lineage = object()     # shared by every table extended from one full parse
+        else:
+            records = tuple(records)
+            self.records = _base.records + records
+            self.by_user = _index(records, lambda r: r.username_norm, _base.by_user)
+            self.by_date = _index(records, lambda r: r.date, _base.by_date)
+            self.lineage = _base.lineage
+
+    def extended(self, records):
+        """A new table with records appended (self is left as it was)."""
+        return AttendanceTable(records, _base=self) if records else self
+
+    def __len__(self):
+        return len(self.records)
+
+    # ---------------------- queries ----------------------
+    def last(self, limit=5):
+        """Newest first (file order is append order)."""
+        return list(reversed(self.records[-limit:])) if limit else []
+
+    def usernames(self):
+        return set(self.by_user)
+
+    def present_usernames_on(self, day):
+        return {r.username_norm or normalize_username(r.full_name)
+                for r in self.by_date.get(day, ()) if r.present and (r.username_norm or r.full_name)}
+
+    def for_user(self, username):
+        return list(self.by_user.get(normalize_username(username), ()))
+
+    def timeseries(self, username):
+        """{date: 0/1} for the user's days (1 if any row that day is a present one)."""
+        per_date = {}
+        for r in self.by_user.get(normalize_username(username), ()):
+            if r.date:
+                per_date[r.date] = max(per_date.get(r.date, 0), 1 if r.present else 0)
+        return per_date
+
+    def present_days_in_month(self, username, year, month):
+        return {r.date.day for r in self.by_user.get(normalize_username(username), ())
+                if r.present and r.date and r.date.year == year and r.date.month == month}
+
+    def search(self, name_query="", reg_query=""):
+        """Name substring (full name / username) OR registration substring (registration / username)."""
+        qn = (name_query or "").strip().lower()
+        qr = (reg_query or "").strip().lower()
+        if not qn and not qr:
+            return []
+        out = []
+        for r in self.records:
+            if (qn and (qn in r.full_name.lower() or qn in r.username_norm)) or \
+               (qr and (qr in r.registration.lower() or qr in r.username_norm)):
+                out.append(r)
+        return out
+
+
+class RowParser:
+    """Turns CSV rows (lists) into AttendanceRecords for one header."""
+
+    def __init__(self, header):
+        self.header = [str(h).strip() for h in (header or [])]
+        cols = resolve_columns(self.header)
+        self._idx = {f: (self.header.index(c) if c else None) for f, c in cols.items()}
+        self._dates = ColumnDateParser()
+
+    def _get(self, row, field):
+        i = self._idx[field]
+        return row[i].strip() if i is not None and i < len(row) and row[i] else ""
+
+    def _date_time(self, row):
+        raw_date = self._get(row, "date")
+        raw_time = self._get(row, "time")
+        if raw_date and not raw_time and " " in raw_date:
+            raw_date, _, raw_time = raw_date.partition(" ")
+        elif " " in raw_date:
+            raw_date = raw_date.split(" ")[0]
+        return raw_date, raw_time
+
+    def parse(self, rows):
+        rows = [r for r in rows if r]
+        stamps = [self._date_time(r) for r in rows]
+        self._dates.detect(d for d, _ in stamps)       # settle dd/mm vs mm/dd before reading the first rows
+        out = []
+        for row, (raw_date, raw_time) in zip(rows, stamps):
+            d = self._dates.parse(raw_date)
+            username = self._get(row, "username")
+            status = self._get(row, "status")
+            out.append(AttendanceRecord(
+                self._get(row, "registration"), self._get(row, "full_name"), username, normalize_username(username),
+                self._get(row, "department"), d, raw_date, raw_time, status, status.lower() in PRESENT_VALUES))
+        return out
+
+
+def records_from_rows(rows):
+    """AttendanceRecords for rows in ATTENDANCE_HEADER order (e.g. attendance_db query results)."""
+    return RowParser(ATTENDANCE_HEADER).parse([["" if v is None else str(v) for v in r] for r in rows])
+
+
+def parse_attendance_csv(path):
+    """Read the whole CSV into AttendanceRecords (empty list if it doesn't exist)."""
+    try:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            return RowParser(next(reader, [])).parse(reader)
+    except FileNotFoundError:
+        return []
+
+
+class AttendanceRepository:
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._table = None
+        self._parser = None
+        self._offset = 0            # bytes parsed (always at a line boundary)
+        self._header_bytes = b""
+        self._probe = b""           # the TAIL_PROBE_BYTES before _offset
+        self._open_tail = False     # the last row parsed had no newline yet (it ended the file)
+        self._mtime_ns = None
+        self._subscribers = []
+        self.parses = 0
+        self.tail_reads = 0
+
+    # ---------------------- subscribers ----------------------
+    def subscribe(self, callback):
+        """
+        callback(records, reloaded) after every refresh that found something:
+        the new records, or the whole table with reloaded=True after a full re-parse.
+        Runs on the thread that called refresh()/snapshot(). Returns an unsubscribe function.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _notify(self, records, reloaded):
+        for cb in list(self._subscribers):
+            try:
+                cb(records, reloaded)
+            except Exception as e:
+                print(f"[ERROR] attendance subscriber: {e}")
+                traceback.print_exc()
+
+    # ---------------------- reading ----------------------
+    def _rewritten(self, f, size):
+        """True if the bytes we already parsed are no longer what is on disk."""
+        if size < self._offset:
+            return True
+        f.seek(0)
+        if f.read(len(self._header_bytes)) != self._header_bytes:
+            return True
+        f.seek(self._offset - len(self._probe))
+        if f.read(len(self._probe)) != self._probe:
+            return True
+        # a newline-less last row we parsed must now be followed by a line break, not continued
+        return self._open_tail and f.read(1) not in (b"", b"\r", b"\n")
+
+    def _complete_row(self, line):
+        """True if a final line without a newline already holds a whole row (quotes closed, every column)."""
+        if line.count(b'"') % 2:
+            return False
+        row = next(csv.reader([line.decode("utf-8", errors="replace").rstrip("\r")]), [])
+        return len(row) >= max(1, len(self._parser.header))
+
+    def _consume(self, f, start, data):
+        """
+        Advance past the complete lines in data (read from `start`, up to EOF). A last
+        line without a newline counts if it is already a whole row (a file saved without
+        a trailing newline); otherwise it is half-written and waits.
+        """
+        end = data.rfind(b"\n") + 1
+        self._open_tail = end < len(data) and self._complete_row(data[end:])
+        if self._open_tail:
+            end = len(data)
+        self._offset = start + end
+        f.seek(max(0, self._offset - TAIL_PROBE_BYTES))
+        self._probe = f.read(self._offset - max(0, self._offset - TAIL_PROBE_BYTES))
+        return data[:end]
+
+    def _full_load(self, f):
+        f.seek(0)
+        raw = f.read()
+        first, sep, _ = raw.partition(b"\n")
+        header = next(csv.reader([first.decode("utf-8-sig", errors="replace").rstrip("\r")]), [])
+        self._parser = RowParser(header)
+        data = self._consume(f, 0, raw)
+        first, sep, body = data.partition(b"\n")
+        self._header_bytes = first + sep
+        records = self._parser.parse(csv.reader(io.StringIO(body.decode("utf-8", errors="replace"))))
+        self._table = AttendanceTable(records)
+        self.parses += 1
+        return records
+
+    def _read_tail(self, f):
+        start = self._offset
+        f.seek(start)
+        data = self._consume(f, start, f.read())
+        if not data:
+            return []
+        records = self._parser.parse(csv.reader(io.StringIO(data.decode("utf-8", errors="replace"))))
+        self._table = self._table.extended(records)
+        self.tail_reads += 1
+        return records
+
+    def refresh(self):
+        """
+        Bring the table up to date with the file. Returns the records added by this
+        call (all of them after a full re-parse); [] if nothing changed.
+        """
+        reloaded = False
+        with self._lock:
+            try:
+                st = os.stat(self.csv_path)
+            except OSError:
+                st = None
+            if st is None:
+                had_rows = bool(self._table and self._table.records)
+                self._table, self._offset, self._header_bytes, self._probe = AttendanceTable(), 0, b"", b""
+                self._open_tail = False
+                self._mtime_ns = None
+                records, reloaded = [], had_rows
+            elif self._table is not None and st.st_size == self._offset and st.st_mtime_ns == self._mtime_ns:
+                return []
+            else:
+                with open(self.csv_path, "rb") as f:
+                    if self._table is None or self._parser is None or self._rewritten(f, st.st_size):
+                        records, reloaded = self._full_load(f), True
+                    else:
+                        records = self._read_tail(f)
+                self._mtime_ns = st.st_mtime_ns
+            subscribers = bool(self._subscribers)
+        if subscribers and (records or reloaded):
+            self._notify(self._table.records if reloaded else records, reloaded)
+        return records
+
+    def snapshot(self):
+        """
+        The current AttendanceTable (new lines parsed, or re-parsed if the file was
+        rewritten). Safe to read from any thread: later refreshes publish a new table.
+        """
+        self.refresh()
+        return self._table
+
+    def current(self):
+        """The table as of the last refresh, without touching the file (None before the first read)."""
+        return self._table
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
+
+
+_repos = {}
+_repos_lock = threading.Lock()
+
+
+def get_attendance_repository(csv_path=None):
+    """Process-wide AttendanceRepository for csv_path (default: Attendance.csv next to this file)."""
+    key = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    with _repos_lock:
+        repo = _repos.get(key)
+        if repo is None:
+            repo = _repos[key] = AttendanceRepository(key)
+        return repo
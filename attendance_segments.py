@@ -0,0 +1,426 @@
+"""
+attendance_segments.py
+
+Date-partitioned, append-only attendance log.
+
+Instead of one ever-growing Attendance.csv, rows live in small CSV segments
+under attendance_segments/:
+ - one file per day (2025-11-05.csv) for the current month,
+ - one file per month (2025-10.csv) once the background compactor has merged
+   that month's day files,
+ - undated.csv for legacy rows whose date could not be parsed.
+
+manifest.json lists every segment with its date range and row count, so
+ - "today" reads exactly one segment,
+ - a range query opens only the segments that overlap it,
+ - the record count is a sum over the manifest, not a file scan.
+Any given day lives in exactly one segment: a row for a month that is already
+compacted is appended to the month file.
+
+Migration is transparent: the first time the store is opened next to a legacy
+Attendance.csv it is partitioned into segments. The CSV is kept (and appended
+to by the store, MIRROR_LEGACY_CSV) for readers that still parse it. Rows that
+other tools append to the CSV are picked up from the byte offset recorded in
+the manifest; a CSV that shrank or was rewritten (the bytes just before that
+offset no longer match the probe kept with it) is re-partitioned from scratch.
+
+    python attendance_segments.py            # migrate if needed, print the manifest
+    python attendance_segments.py --compact  # merge finished months now
+"""
+
+import os
+import io
+import csv
+import sys
+import json
+import threading
+from datetime import date, timedelta
+
+import attendance_writer
+from attendance_db import ATTENDANCE_HEADER, is_present_status, normalize_username, resolve_columns
+from date_parsing import iso_date
+
+# ---------- Configuration ----------
+SEGMENTS_DIR = "attendance_segments"
+MANIFEST_FILE = "manifest.json"
+UNDATED_SEGMENT = "undated"
+MIRROR_LEGACY_CSV = True
+COMPACT_INTERVAL_S = 3600
+LEGACY_PROBE_BYTES = 64        # bytes before the imported offset compared to detect a rewrite
+
+_FIELDS = ("registration", "full_name", "username", "department", "date", "time", "status")
+DATE_COL = ATTENDANCE_HEADER.index("Date")
+_NAME_COL = ATTENDANCE_HEADER.index("FullName")
+_USER_COL = ATTENDANCE_HEADER.index("Username")
+_STATUS_COL = ATTENDANCE_HEADER.index("Status")
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _read_probe(path, offset):
+    """Hex of the LEGACY_PROBE_BYTES before offset (what _sync_legacy compares to spot a rewrite)."""
+    start = max(0, offset - LEGACY_PROBE_BYTES)
+    try:
+        with open(path, "rb") as fb:
+            fb.seek(start)
+            return fb.read(offset - start).hex()
+    except OSError:
+        return None
+
+
+def _segment_key(day_iso, month_segments):
+    """Segment a row dated day_iso belongs to: its month file once compacted, else its day file."""
+    if not day_iso:
+        return UNDATED_SEGMENT
+    return day_iso[:7] if day_iso[:7] in month_segments else day_iso
+
+
+class SegmentStore:
+    def __init__(self, root, legacy_csv=None):
+        self.root = root
+        self.legacy_csv = legacy_csv
+        self._lock = threading.RLock()
+        self._manifest = None
+        os.makedirs(root, exist_ok=True)
+        self._compactor = None
+        self._stop = threading.Event()
+
+    # ---------------------- manifest ----------------------
+    def _manifest_path(self):
+        return os.path.join(self.root, MANIFEST_FILE)
+
+    def _load(self):
+        if self._manifest is not None:
+            return
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        except FileNotFoundError:
+            self._manifest = {"version": 1, "segments": {}, "legacy": None}
+            if self.legacy_csv and os.path.exists(self.legacy_csv):
+                self._migrate_legacy()
+            else:
+                self._save()
+        except Exception as e:
+            print(f"[WARN] {MANIFEST_FILE} unreadable ({e}); rebuilding segments")
+            self._rebuild()
+
+    def _save(self):
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._manifest_path())
+
+    def _month_segments(self):
+        return {k for k in self._manifest["segments"] if len(k) == 7}
+
+    # ---------------------- writing segments ----------------------
+    def _segment_path(self, key):
+        return os.path.join(self.root, key + ".csv")
+
+    def _append_rows(self, key, rows):
+        """Append rows to one segment (creating it with the header) and update its manifest entry."""
+        path = self._segment_path(key)
+        new = not os.path.exists(path)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            if new:
+                w.writerow(ATTENDANCE_HEADER)
+            w.writerows(rows)
+        seg = self._manifest["segments"].setdefault(key, {"rows": 0, "first": None, "last": None})
+        seg["rows"] += len(rows)
+        dates = [r[DATE_COL] for r in rows if key != UNDATED_SEGMENT]
+        if dates:
+            seg["first"] = min([d for d in (seg["first"], min(dates)) if d])
+            seg["last"] = max([d for d in (seg["last"], max(dates)) if d])
+
+    def _partition(self, rows):
+        """rows (header order, ISO dates) -> appended to their segments."""
+        months = self._month_segments()
+        by_key = {}
+        for r in rows:
+            by_key.setdefault(_segment_key(r[DATE_COL], months), []).append(r)
+        for key, chunk in by_key.items():
+            self._append_rows(key, chunk)
+
+    def _import_legacy(self, start_offset, header=None):
+        """Partition the legacy CSV from start_offset; returns (header, end_offset, rows) consumed."""
+        with open(self.legacy_csv, "rb") as fb:
+            fb.seek(start_offset)
+            data = fb.read()
+        end = data.rfind(b"\n") + 1           # a half-written last line is left for next time
+        text = data[:end].decode("utf-8", errors="replace")
+        if header is None:
+            first, _, text = text.partition("\n")
+            header = next(csv.reader([first]), [])
+        reader = csv.DictReader(io.StringIO(text), fieldnames=header)
+        cols = resolve_columns(header)
+        rows, undated = [], []
+        for row in reader:
+            out = [(row.get(cols[f]) or "").strip() if cols[f] else "" for f in _FIELDS]
+            d = iso_date(out[DATE_COL])
+            if d:
+                out[DATE_COL] = d
+                rows.append(out)
+            else:
+                undated.append(out)           # kept verbatim in the undated segment
+        self._partition(rows)
+        if undated:
+            self._append_rows(UNDATED_SEGMENT, undated)
+        return header, start_offset + end, len(rows) + len(undated)
+
+    def _migrate_legacy(self):
+        header, offset, n = self._import_legacy(0)
+        size, mtime_ns = _signature(self.legacy_csv)
+        self._manifest["legacy"] = {"path": os.path.basename(self.legacy_csv), "header": header,
+                                    "offset": offset, "mtime_ns": mtime_ns,
+                                    "probe": _read_probe(self.legacy_csv, offset)}
+        self._save()
+        print(f"[INFO] {os.path.basename(self.legacy_csv)} partitioned into "
+              f"{len(self._manifest['segments'])} segment(s) ({n} row(s))")
+
+    def _rebuild(self):
+        for name in os.listdir(self.root):
+            if name.endswith(".csv"):
+                os.remove(os.path.join(self.root, name))
+        self._manifest = {"version": 1, "segments": {}, "legacy": None}
+        if self.legacy_csv and os.path.exists(self.legacy_csv):
+            self._migrate_legacy()
+        else:
+            self._save()
+
+    def _sync_legacy(self):
+        """Pick up rows other tools appended to the legacy CSV; re-partition if it shrank or was rewritten."""
+        legacy = self._manifest.get("legacy")
+        if not self.legacy_csv or not legacy:
+            return
+        sig = _signature(self.legacy_csv)
+        if sig is None:
+            return
+        size, mtime_ns = sig
+        if size == legacy["offset"] and mtime_ns == legacy["mtime_ns"]:
+            return
+        probe = legacy.get("probe")
+        if (size < legacy["offset"] or (size == legacy["offset"] and mtime_ns != legacy["mtime_ns"])
+                or (probe is not None and _read_probe(self.legacy_csv, legacy["offset"]) != probe)):
+            print(f"[INFO] {legacy['path']} was rewritten; re-partitioning attendance segments")
+            self._rebuild()
+            return
+        _, offset, _ = self._import_legacy(legacy["offset"], header=legacy["header"])
+        legacy["offset"] = offset
+        legacy["mtime_ns"] = mtime_ns
+        legacy["probe"] = _read_probe(self.legacy_csv, offset)
+        self._save()
+
+    def _fresh(self):
+        self._load()
+        self._sync_legacy()
+
+    # ---------------------- public API ----------------------
+    def append(self, row):
+        """Append one row (ATTENDANCE_HEADER order) to its day segment, mirroring it to the legacy CSV."""
+        row = [str(v if v is not None else "").strip() for v in row]
+        row[DATE_COL] = iso_date(row[DATE_COL]) or row[DATE_COL]
+        with self._lock:
+            self._fresh()
+            if iso_date(row[DATE_COL]):
+                self._partition([row])
+            else:
+                self._append_rows(UNDATED_SEGMENT, [row])
+            legacy = self._manifest.get("legacy")
+            if MIRROR_LEGACY_CSV and self.legacy_csv:
+                new = not os.path.exists(self.legacy_csv)
+                with open(self.legacy_csv, "a", encoding="utf-8", newline="") as f:
+                    w = csv.writer(f)
+                    if new:
+                        w.writerow(ATTENDANCE_HEADER)
+                    w.writerow(row)
+                size, mtime_ns = _signature(self.legacy_csv)
+                if legacy is None:
+                    legacy = self._manifest["legacy"] = {"path": os.path.basename(self.legacy_csv),
+                                                         "header": list(ATTENDANCE_HEADER)}
+                legacy["offset"] = size
+                legacy["mtime_ns"] = mtime_ns
+                legacy["probe"] = _read_probe(self.legacy_csv, size)
+            self._save()
+
+    def segments_for(self, start=None, end=None):
+        """Segment keys whose date range overlaps [start, end] (ISO strings, None = open)."""
+        with self._lock:
+            self._fresh()
+            out = []
+            for key, seg in sorted(self._manifest["segments"].items()):
+                if key == UNDATED_SEGMENT:
+                    continue
+                if (end and seg["first"] and seg["first"] > end) or (start and seg["last"] and seg["last"] < start):
+                    continue
+                out.append(key)
+            return out
+
+    def _read_segment(self, key):
+        try:
+            with open(self._segment_path(key), "r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                return [r for r in reader if r]
+        except FileNotFoundError:
+            return []
+
+    def rows_between(self, start=None, end=None):
+        """Rows (header order, ISO dates) with start <= date <= end, oldest segment first."""
+        start = iso_date(start) if start else None
+        end = iso_date(end) if end else None
+        with self._lock:
+            out = []
+            for key in self.segments_for(start, end):
+                for r in self._read_segment(key):
+                    d = r[DATE_COL]
+                    if (not start or d >= start) and (not end or d <= end):
+                        out.append(r)
+            return out
+
+    def rows_on(self, day=None):
+        """Rows for one day (default today): reads that day's segment only."""
+        day = iso_date(day) if day else date.today().isoformat()
+        return self.rows_between(day, day)
+
+    def count_rows(self):
+        with self._lock:
+            self._fresh()
+            return sum(seg["rows"] for seg in self._manifest["segments"].values())
+
+    def present_usernames_on(self, day=None):
+        """Normalized usernames (full name when blank) with a present row on day (default today)."""
+        return {normalize_username(r[_USER_COL] or r[_NAME_COL]) for r in self.rows_on(day)
+                if is_present_status(r[_STATUS_COL]) and (r[_USER_COL] or r[_NAME_COL])}
+
+    def present_days_in_month(self, username, year, month):
+        """Day-of-month numbers the user was present in year/month (reads that month's segments only)."""
+        first = date(int(year), int(month), 1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        user = normalize_username(username)
+        return {int(r[DATE_COL][8:10]) for r in self.rows_between(first.isoformat(), last.isoformat())
+                if normalize_username(r[_USER_COL]) == user and is_present_status(r[_STATUS_COL])}
+
+    def manifest(self):
+        with self._lock:
+            self._fresh()
+            return json.loads(json.dumps(self._manifest))
+
+    # ---------------------- compaction ----------------------
+    def compact(self, before=None):
+        """
+        Merge the day segments of every month that ended before `before`
+        (default: the first day of the current month) into one month segment.
+        Returns the months compacted.
+        """
+        cutoff = (iso_date(before) if before else date.today().replace(day=1).isoformat())[:7]
+        with self._lock:
+            self._fresh()
+            segments = self._manifest["segments"]
+            by_month = {}
+            for key in segments:
+                if len(key) == 10 and key[:7] < cutoff:
+                    by_month.setdefault(key[:7], []).append(key)
+            for month, days in sorted(by_month.items()):
+                rows = self._read_segment(month) if month in segments else []
+                for key in sorted(days):
+                    rows.extend(self._read_segment(key))
+                rows.sort(key=lambda r: (r[DATE_COL], r[DATE_COL + 1]))
+                tmp = self._segment_path(month) + ".tmp"
+                with open(tmp, "w", encoding="utf-8", newline="") as f:
+                    w = csv.writer(f)
+                    w.writerow(ATTENDANCE_HEADER)
+                    w.writerows(rows)
+                os.replace(tmp, self._segment_path(month))
+                segments[month] = {"rows": len(rows), "first": rows[0][DATE_COL] if rows else None,
+                                   "last": rows[-1][DATE_COL] if rows else None}
+                for key in days:
+                    segments.pop(key, None)
+                self._save()
+                # the manifest no longer points at the day files; removing them is just cleanup
+                for key in days:
+                    try:
+                        os.remove(self._segment_path(key))
+                    except OSError:
+                        pass
+            self._remove_orphans()
+            return sorted(by_month)
+
+    def _remove_orphans(self):
+        known = set(self._manifest["segments"])
+        for name in os.listdir(self.root):
+            if name.endswith(".csv") and name[:-4] not in known:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    pass
+
+    def start_compactor(self, interval_s=COMPACT_INTERVAL_S):
+        """Run compact() now and then every interval_s on a daemon thread."""
+        if self._compactor is not None:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    months = self.compact()
+                    if months:
+                        print(f"[INFO] compacted attendance segments: {', '.join(months)}")
+                except Exception as e:
+                    print(f"[WARN] segment compaction failed: {e}")
+                self._stop.wait(interval_s)
+
+        self._compactor = threading.Thread(target=loop, name="attendance-compactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self):
+        self._stop.set()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_segment_store(legacy_csv=None, root=None, compactor=True):
+    """Process-wide SegmentStore for a legacy CSV (segments go in SEGMENTS_DIR next to it)."""
+    legacy_csv = os.path.abspath(legacy_csv or _here("Attendance.csv"))
+    root = os.path.abspath(root or os.path.join(os.path.dirname(legacy_csv), SEGMENTS_DIR))
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = SegmentStore(root, legacy_csv)
+            if compactor:
+                store.start_compactor()
+        return store
+
+
+def active_segment_store(csv_path=None):
+    """The SegmentStore when attendance_writer.ATTENDANCE_BACKEND is "segments", else None."""
+    if attendance_writer.ATTENDANCE_BACKEND != "segments":
+        return None
+    return get_segment_store(csv_path)
+
+
+if __name__ == "__main__":
+    store = get_segment_store(compactor=False)
+    if "--compact" in sys.argv:
+        print(f"compacted: {store.compact() or 'nothing to do'}")
+    elif "--rebuild" in sys.argv:
+        with store._lock:
+            store._load()
+            store._rebuild()
+    m = store.manifest()
+    for key, seg in sorted(m["segments"].items()):
+        print(f"  {key:<10} {seg['rows']:>7} row(s)  {seg['first']} .. {seg['last']}")
+    print(f"{store.count_rows()} row(s) in {len(m['segments'])} segment(s) under {store.root}")
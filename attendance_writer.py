@@ -0,0 +1,123 @@
+"""
+attendance_writer.py
+
+Background writer for Attendance.csv.
+
+Every attendance write goes through one process-wide writer thread, so
+ - the Tk thread never opens the CSV to mark someone present,
+ - two pages (or the kiosk and a teacher tool in the same process) can't
+   interleave their check-then-append on the same file.
+
+submit() returns a concurrent.futures.Future; callers attach a done-callback
+instead of waiting. Reads that must see every queued write (e.g. the
+"last attendance" panel right after marking) are submitted to the same writer.
+
+ATTENDANCE_BACKEND selects where mark_present records a row:
+ - "csv":    Attendance.csv, duplicates checked against the presence index,
+ - "sqlite": attendance.db (see attendance_db.py) as well: the presence index
+             and the database's unique (student, day) indexes both have to
+             accept the row. It is still appended to Attendance.csv, and the
+             database re-syncs from the CSV when another tool changed it, so
+             the two stay in step. The record pages read from the database.
+ - "segments": the day's segment under attendance_segments/ (see
+             attendance_segments.py), mirrored to Attendance.csv by the store.
+"""
+
+import os
+import csv
+import threading
+import concurrent.futures
+
+from presence_index import get_presence_index
+
+# ---------- Configuration ----------
+ATTENDANCE_HEADER = ["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"]
+ATTENDANCE_BACKEND = "csv"     # "csv" | "sqlite" | "segments"
+
+
+class AttendanceWriter:
+    def __init__(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="attendance-writer")
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn on the writer thread, after everything submitted before it. Returns a Future."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_write_listeners = []
+
+
+def add_write_listener(callback):
+    """
+    callback(csv_path, row) after every row mark_present writes (row in ATTENDANCE_HEADER order).
+    Runs on the writer thread; keep it short and don't raise.
+    """
+    if callback not in _write_listeners:
+        _write_listeners.append(callback)
+
+
+def remove_write_listener(callback):
+    if callback in _write_listeners:
+        _write_listeners.remove(callback)
+
+
+def _notify_written(csv_path, row):
+    for cb in list(_write_listeners):
+        try:
+            cb(csv_path, row)
+        except Exception as e:
+            print(f"[ERROR] attendance write listener: {e}")
+
+
+def get_attendance_writer():
+    """The process-wide AttendanceWriter (created on first call)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AttendanceWriter()
+        return _writer
+
+
+def mark_present(csv_path, student_id, full_name, username, dept, date_str, time_str):
+    """
+    Append a Present row unless the student already has one for date_str.
+    Presence is matched by Registration (preferred) OR Username.
+    Returns "marked" or "already"; raises OSError if the file can't be written.
+    Call it on the writer thread (see AttendanceWriter).
+    """
+    # ensure CSV header (use Registration No label)
+    if not os.path.exists(csv_path):
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(ATTENDANCE_HEADER)
+
+    # already_present check: accept presence if either Registration (preferred) OR Username already has a
+    # present record for today. A set lookup in the presence index, rebuilt only if the file changed under us.
+    sid = str(student_id or "").strip()
+    uname = str(username or "").strip()
+    index = get_presence_index(csv_path)
+    if index.is_present(date_str, sid, uname):
+        return "already"
+    db = None
+    if ATTENDANCE_BACKEND == "sqlite":
+        from attendance_db import get_attendance_db
+        db = get_attendance_db(csv_path=csv_path)      # synced with the CSV first, so the two agree
+        if not db.insert(sid, full_name, uname, dept, date_str, time_str, "Present"):
+            return "already"
+
+    row = [sid, full_name, username, dept, date_str, time_str, "Present"]
+    if ATTENDANCE_BACKEND == "segments":
+        from attendance_segments import get_segment_store
+        get_segment_store(csv_path).append(row)
+    else:
+        with open(csv_path, "a", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerow(row)
+        if db is not None:
+            db.mark_csv_synced(csv_path)
+    index.record(date_str, sid, uname)
+    _notify_written(csv_path, row)
+    return "marked"
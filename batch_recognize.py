@@ -0,0 +1,309 @@
+"""
+batch_recognize.py
+
+Offline attendance from a classroom photo folder or a recorded lecture.
+
+The live kiosk (MarkAttendancePage) recognises one student at a time from the
+webcam. This tool takes a directory of images or a video file instead:
+ - video frames are sampled every SAMPLE_EVERY_SECONDS (skipped frames are only
+   grabbed, never converted), images are read as they are,
+ - every sampled frame is detected + encoded + matched in a process pool
+   (dlib holds the GIL, so threads would not help),
+ - hits are tallied per student and one attendance row per student is emitted,
+   with the best match confidence and how often the student was seen.
+
+Library:
+    rows, stats = recognize_session("lecture.mp4")
+Standalone:
+    python batch_recognize.py PATH [--every SECONDS] [--workers N] [--date YYYY-MM-DD]
+                                   [--out rows.csv] [--append]
+
+--append adds the rows to Attendance.csv, skipping students already present that day.
+"""
+
+import os
+import sys
+import csv
+import time
+import concurrent.futures
+from collections import deque
+from datetime import datetime
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import face_recognition
+except Exception:
+    face_recognition = None
+
+from face_gallery import (
+    Gallery, load_gallery, load_students_by_username, is_enrollment_image, IMAGES_DIR,
+    PROBE_PROFILE, encode_faces, compatible_probe_profile,
+)
+import face_detection
+import attendance_writer
+
+# ---------- Configuration ----------
+ATTENDANCE_CSV = "Attendance.csv"
+ATTENDANCE_HEADER = ["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"]
+FR_TOLERANCE = 0.45                # same threshold as the live kiosk
+SAMPLE_EVERY_SECONDS = 2.0         # video: one frame every N seconds (an hour -> 1800 frames)
+MAX_FRAME_WIDTH = 1280             # sampled frames are shrunk to this before detection
+DETECT_UPSAMPLE = 1                # dlib upsampling; finds faces down to ~40 px at MAX_FRAME_WIDTH
+MIN_VIDEO_HITS = 2                 # video: a student must be matched in this many frames
+BATCH_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+MAX_IN_FLIGHT_PER_WORKER = 2       # bounds memory held by decoded frames waiting for a worker
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+
+
+def distance_to_confidence(distance, tolerance=FR_TOLERANCE):
+    """Map a face distance to 0..1: 1.0 for an identical encoding, 0.5 right at the tolerance."""
+    return max(0.0, min(1.0, 1.0 - 0.5 * distance / tolerance))
+
+
+def gallery_rows(gallery):
+    """The gallery's encodings as float64 rows for the workers (an int8 gallery is dequantized first)."""
+    rows = gallery.dequantize() if gallery.storage == "int8" else gallery.encodings
+    return np.asarray(rows, dtype=np.float64).reshape(len(gallery), -1)
+
+
+# ---------------------- Worker side ----------------------
+_worker_state = {}
+
+
+def _init_worker(encodings, names, backend, tolerance, profile):
+    _worker_state["gallery"] = Gallery.build(((n, "", "", e) for n, e in zip(names, encodings)), profile=profile)
+    _worker_state["probe_profile"] = compatible_probe_profile(PROBE_PROFILE, profile)
+    _worker_state["detector"] = face_detection.create_detector(backend)
+    _worker_state["tolerance"] = tolerance
+
+
+def _shrink(bgr):
+    h, w = bgr.shape[:2]
+    if w <= MAX_FRAME_WIDTH:
+        return bgr
+    scale = MAX_FRAME_WIDTH / float(w)
+    return cv2.resize(bgr, (MAX_FRAME_WIDTH, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _recognize_frame(job):
+    """job: (source_label, bgr frame or image path). Returns (source_label, [(name or None, distance)])."""
+    label, frame = job
+    if isinstance(frame, str):
+        frame = cv2.imread(frame)
+        if frame is None:
+            return label, None
+        frame = _shrink(frame)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    boxes = _worker_state["detector"].detect(rgb, upsample=DETECT_UPSAMPLE)
+    if not boxes:
+        return label, []
+    gallery = _worker_state["gallery"]
+    tolerance = _worker_state["tolerance"]
+    encs = encode_faces(rgb, boxes, _worker_state["probe_profile"])
+    return label, [gallery.match(enc, tolerance) for enc in encs]
+
+
+# ---------------------- Frame sources ----------------------
+def iter_image_jobs(image_dir):
+    for fname in sorted(os.listdir(image_dir)):
+        if is_enrollment_image(fname):
+            yield fname, os.path.join(image_dir, fname)
+
+
+def iter_video_jobs(video_path, every_s=SAMPLE_EVERY_SECONDS):
+    """Yield ("HH:MM:SS", frame) every `every_s` seconds of video. Frames in between are grab()-ed only."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {video_path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps * every_s)))
+        index = 0
+        while True:
+            if not cap.grab():
+                break
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                secs = int(index / fps)
+                yield f"{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}", _shrink(frame)
+            index += 1
+    finally:
+        cap.release()
+
+
+# ---------------------- Session tally ----------------------
+class SessionTally:
+    """Per-student hits for one session; turns into one deduplicated attendance row per student."""
+
+    def __init__(self):
+        self.seen = {}          # FULLNAME -> {"hits", "best_distance", "first_seen"}
+        self.frames = 0
+        self.faces = 0
+        self.unknown = 0
+
+    def add(self, label, matches):
+        self.frames += 1
+        for name, distance in matches:
+            self.faces += 1
+            if not name:
+                self.unknown += 1
+                continue
+            rec = self.seen.get(name)
+            if rec is None:
+                self.seen[name] = {"hits": 1, "best_distance": distance, "first_seen": label}
+            else:
+                rec["hits"] += 1
+                rec["best_distance"] = min(rec["best_distance"], distance)
+
+    def rows(self, info, min_hits=1, date_str=None, time_str=None, tolerance=FR_TOLERANCE):
+        """Attendance rows (ATTENDANCE_HEADER order) plus Confidence, Hits and FirstSeen, best match first."""
+        now = datetime.now()
+        date_str = date_str or now.strftime("%Y-%m-%d")
+        time_str = time_str or now.strftime("%H:%M:%S")
+        by_name = {str(s.get("full_name") or "").strip().upper(): u
+                   for u, s in load_students_by_username().items() if isinstance(s, dict)}
+        out = []
+        for name, rec in sorted(self.seen.items(), key=lambda kv: kv[1]["best_distance"]):
+            if rec["hits"] < min_hits:
+                continue
+            sid, dept = info.get(name, ("", ""))
+            out.append({
+                "Registration No": "" if sid == "Unknown" else sid,
+                "FullName": name.title(),
+                "Username": by_name.get(name, ""),
+                "Department": "" if dept == "Unknown" else dept,
+                "Date": date_str,
+                "Time": time_str,
+                "Status": "Present",
+                "Confidence": round(distance_to_confidence(rec["best_distance"], tolerance), 3),
+                "Hits": rec["hits"],
+                "FirstSeen": rec["first_seen"],
+            })
+        return out
+
+
+# ---------------------- Entry point ----------------------
+def recognize_session(path, every_s=SAMPLE_EVERY_SECONDS, workers=BATCH_WORKERS, gallery=None,
+                      backend=face_detection.DETECTOR_BACKEND, tolerance=FR_TOLERANCE,
+                      min_hits=None, date_str=None, time_str=None):
+    """
+    Recognise everyone in an image directory or video file.
+    Returns (rows, stats); rows as in SessionTally.rows().
+    """
+    if cv2 is None or np is None or face_recognition is None:
+        raise RuntimeError("opencv-python, numpy and face_recognition are required.")
+    gallery = gallery if gallery is not None else load_gallery(IMAGES_DIR)
+    if len(gallery) == 0:
+        raise RuntimeError(f"No known faces in '{IMAGES_DIR}'.")
+
+    is_video = os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+    if is_video:
+        jobs = iter_video_jobs(path, every_s)
+        min_hits = MIN_VIDEO_HITS if min_hits is None else min_hits
+    elif os.path.isdir(path):
+        jobs = iter_image_jobs(path)
+        min_hits = 1 if min_hits is None else min_hits
+    else:
+        raise ValueError(f"{path} is neither an image directory nor a video ({', '.join(VIDEO_EXTENSIONS)})")
+
+    tally = SessionTally()
+    t0 = time.perf_counter()
+    encodings = gallery_rows(gallery)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(encodings, list(gallery.names), backend, tolerance, gallery.profile)) as pool:
+        pending = deque()
+        limit = max(1, workers * MAX_IN_FLIGHT_PER_WORKER)
+        for job in jobs:
+            pending.append(pool.submit(_recognize_frame, job))
+            while len(pending) >= limit:
+                _collect(pending.popleft(), tally)
+        while pending:
+            _collect(pending.popleft(), tally)
+
+    rows = tally.rows(gallery.info, min_hits=min_hits, date_str=date_str, time_str=time_str, tolerance=tolerance)
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "frames": tally.frames,
+        "faces": tally.faces,
+        "unknown": tally.unknown,
+        "students": len(rows),
+        "elapsed_s": elapsed,
+        "fps": tally.frames / elapsed if elapsed > 0 else 0.0,
+    }
+    return rows, stats
+
+
+def _collect(future, tally):
+    try:
+        label, matches = future.result()
+    except Exception as e:
+        print(f"[ERROR] batch frame failed: {e}")
+        return
+    if matches is None:
+        print(f"[WARN] could not read {label}")
+        return
+    tally.add(label, matches)
+
+
+def write_rows(rows, out_path):
+    """Write the session rows, including the confidence columns, to their own CSV."""
+    fields = ATTENDANCE_HEADER + ["Confidence", "Hits", "FirstSeen"]
+    with open(out_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def append_to_attendance(rows, csv_path=None):
+    """
+    Mark every row present through attendance_writer.mark_present (on the shared writer
+    thread), so batch rows get the same duplicate check, backend (csv / sqlite / segments)
+    and write listeners as the kiosk. Returns rows written.
+    """
+    csv_path = csv_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), ATTENDANCE_CSV)
+    writer = attendance_writer.get_attendance_writer()
+    futures = [writer.submit(attendance_writer.mark_present, csv_path, r["Registration No"], r["FullName"],
+                             r["Username"], r["Department"], r["Date"], r["Time"])
+               for r in rows]
+    return sum(1 for f in futures if f.result() == "marked")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Mark attendance from a folder of photos or a lecture video.")
+    ap.add_argument("path", help="image directory or video file")
+    ap.add_argument("--every", type=float, default=SAMPLE_EVERY_SECONDS, help="video sampling interval in seconds")
+    ap.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    ap.add_argument("--min-hits", type=int, default=None, help="frames a student must be seen in")
+    ap.add_argument("--date", default=None, help="attendance date (default today)")
+    ap.add_argument("--out", default=None, help="write rows with confidences to this CSV")
+    ap.add_argument("--append", action="store_true", help=f"append rows to {ATTENDANCE_CSV}")
+    args = ap.parse_args()
+
+    try:
+        rows, stats = recognize_session(args.path, every_s=args.every, workers=args.workers,
+                                        min_hits=args.min_hits, date_str=args.date)
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    print(f"{stats['frames']} frame(s), {stats['faces']} face(s) ({stats['unknown']} unknown), "
+          f"{stats['students']} student(s) in {stats['elapsed_s']:.1f}s ({stats['fps']:.1f} frames/s)")
+    for r in rows:
+        print(f"  {r['FullName']:28} {r['Registration No']:12} conf {r['Confidence']:.2f}  "
+              f"hits {r['Hits']:4d}  first {r['FirstSeen']}")
+    if args.out:
+        write_rows(rows, args.out)
+        print(f"Rows written to {args.out}")
+    if args.append:
+        print(f"{append_to_attendance(rows)} row(s) appended to {ATTENDANCE_CSV}")
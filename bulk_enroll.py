@@ -0,0 +1,337 @@
+"""
+bulk_enroll.py
+
+Start-of-term bulk enrollment from a folder or .zip of ID photos.
+
+Every file must follow the FULLNAME_STUDENTID_DEPT.jpg convention that the
+gallery already parses (e.g. "SAMIR PRASAD_S101_CSE.jpg"). The import:
+ 1. validates the names and encodes the photos in a process pool; a photo must
+    contain exactly one face,
+ 2. records every result in a checkpoint (<source>.enroll-checkpoint.jsonl) as it
+    arrives, so an interrupted run resumes where it stopped,
+ 3. commits in one transaction: accepted photos + their encodings go into images/
+    and the students are added to / updated in students.json. If any step of the
+    commit fails, the files already moved are put back and students.json is left
+    untouched.
+
+Encodings are stored as sidecars (see face_gallery.encoding_cache_path), so the
+gallery watcher picks the new students up without decoding the photos again.
+
+    python bulk_enroll.py PHOTOS_DIR_OR_ZIP [--workers N] [--dry-run] [--report report.csv]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import zipfile
+import concurrent.futures
+from collections import Counter
+from datetime import datetime
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import face_recognition
+except Exception:
+    face_recognition = None
+
+from face_gallery import (
+    IMAGES_DIR, STUDENTS_JSON, GALLERY_RESIZE_SCALE,
+    TEMPLATE_PROFILE, is_enrollment_image, encoding_cache_path, encode_faces, load_students_by_username, _here,
+)
+
+# ---------- Configuration ----------
+ENROLL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHECKPOINT_SUFFIX = ".enroll-checkpoint.jsonl"
+MIN_FACE_PIXELS = 40          # smallest face side accepted, measured at GALLERY_RESIZE_SCALE
+
+
+def parse_strict(fname):
+    """(FULLNAME, student_id, dept) or raise ValueError naming what is wrong with the file name."""
+    base = os.path.splitext(os.path.basename(fname))[0]
+    parts = [p.strip() for p in base.split("_")]
+    if len(parts) != 3:
+        raise ValueError("name is not FULLNAME_STUDENTID_DEPT")
+    fullname, student_id, dept = parts
+    if not fullname or not student_id or not dept:
+        raise ValueError("empty name, student id or department")
+    return fullname.upper(), student_id, dept
+
+
+# ---------------------- Sources ----------------------
+def list_source(source):
+    """[(name, signature)] for every photo in a folder or zip; signature changes if the photo does."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            return [(i.filename, f"{i.file_size}:{i.CRC}") for i in zf.infolist()
+                    if not i.is_dir() and is_enrollment_image(i.filename)]
+    out = []
+    for entry in sorted(os.scandir(source), key=lambda e: e.name):
+        if entry.is_file() and is_enrollment_image(entry.name):
+            st = entry.stat()
+            out.append((entry.name, f"{st.st_size}:{st.st_mtime_ns}"))
+    return out
+
+
+_open_zips = {}   # per process: parsing the central directory once, not once per photo
+
+
+def read_source_bytes(source, name):
+    if source in _open_zips or zipfile.is_zipfile(source):
+        zf = _open_zips.get(source)
+        if zf is None:
+            zf = _open_zips[source] = zipfile.ZipFile(source)
+        return zf.read(name)
+    with open(os.path.join(source, name), "rb") as f:
+        return f.read()
+
+
+# ---------------------- Worker side ----------------------
+def _encode_job(job):
+    """job: (source, name). Returns a result dict; never raises."""
+    source, name = job
+    result = {"file": name}
+    try:
+        result["fullname"], result["student_id"], result["dept"] = parse_strict(name)
+    except ValueError as e:
+        result.update(status="rejected", reason=str(e))
+        return result
+    try:
+        data = read_source_bytes(source, name)
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            result.update(status="rejected", reason="unreadable image")
+            return result
+        if GALLERY_RESIZE_SCALE and GALLERY_RESIZE_SCALE != 1.0:
+            img = cv2.resize(img, (0, 0), fx=GALLERY_RESIZE_SCALE, fy=GALLERY_RESIZE_SCALE)
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        boxes = face_recognition.face_locations(rgb)
+        if len(boxes) != 1:
+            result.update(status="rejected", reason="no face" if not boxes else f"{len(boxes)} faces")
+            return result
+        top, right, bottom, left = boxes[0]
+        if min(bottom - top, right - left) < MIN_FACE_PIXELS:
+            result.update(status="rejected", reason="face too small")
+            return result
+        enc = encode_faces(rgb, boxes, TEMPLATE_PROFILE)
+        if not enc:
+            result.update(status="rejected", reason="face could not be encoded")
+            return result
+        result.update(status="ok", encoding=[float(x) for x in enc[0]])
+    except Exception as e:
+        result.update(status="rejected", reason=f"error: {e}")
+    return result
+
+
+# ---------------------- Checkpoint ----------------------
+def checkpoint_path(source):
+    return os.path.abspath(source).rstrip(os.sep) + CHECKPOINT_SUFFIX
+
+
+def load_checkpoint(path):
+    """{name: result} from a previous, interrupted run (a torn last line is ignored)."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            done[rec["file"]] = rec
+    return done
+
+
+# ---------------------- Commit ----------------------
+def _student_record(fullname, student_id, dept, existing=None):
+    rec = dict(existing or {})
+    rec.setdefault("username", student_id.lower())
+    rec.setdefault("password", "")
+    for k in ("email", "phone", "parent_phone", "course", "address", "profile_pic"):
+        rec.setdefault(k, "")
+    rec["student_id"] = student_id
+    rec["full_name"] = rec.get("full_name") or fullname.title()
+    rec["department"] = rec.get("department") or dept
+    rec["updated_at"] = datetime.utcnow().isoformat()
+    return rec
+
+
+def commit(source, accepted, images_dir=None, students_json=None):
+    """
+    Move the accepted photos (+ encoding sidecars) into images/ and merge the students
+    into students.json, all or nothing. Returns (new_students, updated_students).
+    """
+    images_dir = images_dir or _here(IMAGES_DIR)
+    students_json = students_json or _here(STUDENTS_JSON)
+    os.makedirs(images_dir, exist_ok=True)
+    staging = os.path.join(images_dir, f".bulk-staging-{os.getpid()}")
+    os.makedirs(staging, exist_ok=True)
+
+    students = load_students_by_username(students_json)
+    by_sid = {str(s.get("student_id") or "").strip(): u for u, s in students.items() if isinstance(s, dict)}
+    new, updated = 0, 0
+    for r in accepted:
+        username = by_sid.get(r["student_id"])
+        if username:
+            updated += 1
+        else:
+            username = r["student_id"].lower()
+            while username in students:
+                username += "_"
+            by_sid[r["student_id"]] = username
+            new += 1
+        students[username] = _student_record(r["fullname"], r["student_id"], r["dept"], students.get(username))
+        students[username]["username"] = username
+
+    moved, backups = [], []
+    try:
+        # stage everything first; nothing visible to the gallery yet
+        staged = []
+        for i, r in enumerate(accepted):
+            final = os.path.join(images_dir, os.path.basename(r["file"]))
+            img_tmp = os.path.join(staging, f"{i}.img")
+            with open(img_tmp, "wb") as f:
+                f.write(read_source_bytes(source, r["file"]))
+            enc_tmp = os.path.join(staging, f"{i}.npy")
+            with open(enc_tmp, "wb") as f:
+                np.save(f, np.asarray(r["encoding"], dtype=np.float64))
+            staged.append((img_tmp, final, enc_tmp, encoding_cache_path(final, GALLERY_RESIZE_SCALE, profile=TEMPLATE_PROFILE)))
+        students_tmp = students_json + ".tmp"
+        with open(students_tmp, "w", encoding="utf-8") as f:
+            json.dump(students, f, indent=2, ensure_ascii=False)
+
+        # publish: image before sidecar so the sidecar is never older than its image
+        for img_tmp, final, enc_tmp, enc_final in staged:
+            for src, dst in ((img_tmp, final), (enc_tmp, enc_final)):
+                if os.path.exists(dst):
+                    bak = os.path.join(staging, f"bak-{len(backups)}")
+                    os.replace(dst, bak)
+                    backups.append((bak, dst))
+                os.replace(src, dst)
+                moved.append(dst)
+            os.utime(enc_final)
+        os.replace(students_tmp, students_json)
+    except Exception:
+        for dst in reversed(moved):
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+        for bak, dst in reversed(backups):
+            try:
+                os.replace(bak, dst)
+            except OSError:
+                pass
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.remove(students_json + ".tmp")
+        except OSError:
+            pass
+    return new, updated
+
+
+# ---------------------- Entry point ----------------------
+def bulk_enroll(source, workers=ENROLL_WORKERS, dry_run=False, progress=True):
+    """Validate, encode and (unless dry_run) commit every photo in `source`. Returns a summary dict."""
+    if cv2 is None or np is None or face_recognition is None:
+        raise RuntimeError("opencv-python, numpy and face_recognition are required.")
+    t0 = time.perf_counter()
+    files = list_source(source)
+    ckpt = checkpoint_path(source)
+    previous = load_checkpoint(ckpt)
+    signatures = dict(files)
+    results = {n: r for n, r in previous.items() if n in signatures and r.get("signature") == signatures[n]}
+    todo = [n for n, _ in files if n not in results]
+    if progress and results:
+        print(f"[INFO] Resuming: {len(results)} photo(s) already processed, {len(todo)} to go.")
+
+    with open(ckpt, "a", encoding="utf-8") as log, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, r in enumerate(pool.map(_encode_job, ((source, n) for n in todo), chunksize=4), 1):
+            r["signature"] = signatures[r["file"]]
+            results[r["file"]] = r
+            log.write(json.dumps(r) + "\n")
+            if i % 50 == 0:
+                log.flush()
+                if progress:
+                    print(f"  {i}/{len(todo)} encoded")
+
+    # one photo per student: the last file name wins for a student id listed twice
+    accepted, reasons = {}, Counter()
+    for name, _ in files:
+        r = results[name]
+        if r["status"] != "ok":
+            reasons[r["reason"]] += 1
+            continue
+        if r["student_id"] in accepted:
+            reasons["duplicate student id"] += 1
+        accepted[r["student_id"]] = r
+
+    summary = {
+        "files": len(files),
+        "accepted": len(accepted),
+        "rejected": sum(reasons.values()),
+        "reasons": dict(reasons),
+        "results": [results[n] for n, _ in files],
+        "new_students": 0,
+        "updated_students": 0,
+        "committed": False,
+    }
+    if not dry_run and accepted:
+        summary["new_students"], summary["updated_students"] = commit(source, list(accepted.values()))
+        summary["committed"] = True
+        os.remove(ckpt)
+    summary["elapsed_s"] = time.perf_counter() - t0
+    return summary
+
+
+def write_report(summary, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["File", "Status", "FullName", "StudentID", "Department", "Reason"])
+        for r in summary["results"]:
+            w.writerow([r["file"], r["status"], r.get("fullname", ""), r.get("student_id", ""),
+                        r.get("dept", ""), r.get("reason", "")])
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Enroll students from a folder or zip of FULLNAME_STUDENTID_DEPT.jpg photos.")
+    ap.add_argument("source")
+    ap.add_argument("--workers", type=int, default=ENROLL_WORKERS)
+    ap.add_argument("--dry-run", action="store_true", help="validate and encode only; keep the checkpoint")
+    ap.add_argument("--report", default=None, help="write a per-file CSV report")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"[ERROR] {args.source} not found.")
+        sys.exit(1)
+    try:
+        s = bulk_enroll(args.source, workers=args.workers, dry_run=args.dry_run)
+    except Exception as e:
+        print(f"[ERROR] bulk enrollment failed: {e}")
+        sys.exit(1)
+    print(f"{s['files']} photo(s): {s['accepted']} accepted, {s['rejected']} rejected in {s['elapsed_s']:.1f}s")
+    for reason, n in sorted(s["reasons"].items(), key=lambda kv: -kv[1]):
+        print(f"  {n:5d}  {reason}")
+    if s["committed"]:
+        print(f"Committed: {s['new_students']} new student(s), {s['updated_students']} updated.")
+    elif args.dry_run:
+        print("Dry run: nothing written (re-run without --dry-run to commit; encodings are reused).")
+    if args.report:
+        write_report(s, args.report)
+        print(f"Report written to {args.report}")
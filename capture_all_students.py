@@ -1,12 +1,89 @@
 import cv2
 import os
+import queue
+import threading
+
+from face_gallery import encode_face_crop, save_cached_encoding, face_recognition
+
+DATASET_DIR = "dataset"
+IMAGES_PER_STUDENT = 10
+MIN_FACE_SIZE = (100, 100)
+JPEG_QUALITY = 95
+# perceptual-hash (dHash, 64 bit) distance at or below which a crop counts as a near-duplicate
+PHASH_MAX_DISTANCE = 10
+WRITE_QUEUE_SIZE = 16
+
+
+def dhash(gray, hash_size=8):
+    """64-bit difference hash of a grayscale crop: robust to small shifts, exposure and JPEG noise."""
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class CaptureWriter:
+    """
+    Background JPEG encoder / disk writer for captured face crops.
+    Each crop is also encoded with face_recognition and its encoding stored next
+    to the JPEG (<n>.jpg.<profile>.enc.npy, see encoding_cache_path), so the
+    gallery picks the student up without a separate training pass.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.saved = 0
+        self.encoded = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, path, crop):
+        self._queue.put((path, crop))
+
+    def close(self):
+        """Finish every queued crop, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, crop = item
+            try:
+                ok, buf = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                if not ok:
+                    print(f"[ERROR] ❌ Could not encode {path}")
+                    continue
+                with open(path, "wb") as f:
+                    f.write(buf.tobytes())
+                self.saved += 1
+                print(f"[✔] Saved {path}")
+                if face_recognition is not None:
+                    enc = encode_face_crop(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+                    if enc is not None:
+                        save_cached_encoding(path, enc, is_crop=True)
+                        self.encoded += 1
+                    else:
+                        print(f"[⚠️] No encoding for {path}; the gallery will retry it")
+            except Exception as e:
+                print(f"[ERROR] ❌ Writing {path}: {e}")
+
 
 def capture_dataset(username):
     """
     Capture 10 cropped face images for a given student username.
     Each student's images are stored in dataset/<username>/
+
+    Only frames with exactly one face are used, and a crop that looks almost the
+    same as one already kept (perceptual hash) is skipped, so the 10 images
+    cover different poses instead of 10 copies of consecutive frames.
     """
-    folder = os.path.join("dataset", username)
+    folder = os.path.join(DATASET_DIR, username)
     os.makedirs(folder, exist_ok=True)
 
     # Haar Cascade for face detection
@@ -20,36 +97,49 @@ def capture_dataset(username):
     print(f"\n[INFO] Capturing faces for '{username}'.")
     print("[INFO] Press 'q' anytime to quit early.\n")
 
+    writer = CaptureWriter()
+    hashes = []
     count = 0
-    while True:
-        ret, frame = cam.read()
-        if not ret:
-            break
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(100, 100))
-
-        for (x, y, w, h) in faces:
-            count += 1
-            face = frame[y:y+h, x:x+w]
-            save_path = os.path.join(folder, f"{count}.jpg")
-            cv2.imwrite(save_path, face)
-
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, f"{username} - {count}/10", (x, y-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-            print(f"[✔] Saved {save_path}")
-
-        cv2.imshow(f"Capturing Faces for {username}", frame)
-
-        # Stop when 10 images saved or 'q' pressed
-        if cv2.waitKey(1) & 0xFF == ord('q') or count >= 10:
-            break
-
-    cam.release()
-    cv2.destroyAllWindows()
-    print(f"[✅] Done capturing {count} images for {username}.\n")
+    skipped_dupes = 0
+    try:
+        while True:
+            ret, frame = cam.read()
+            if not ret:
+                break
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=MIN_FACE_SIZE)
+
+            if len(faces) == 1:
+                x, y, w, h = faces[0]
+                h_crop = dhash(gray[y:y+h, x:x+w])
+                if all(hamming(h_crop, prev) > PHASH_MAX_DISTANCE for prev in hashes):
+                    hashes.append(h_crop)
+                    count += 1
+                    # copy: the frame buffer is reused by the next cam.read()
+                    writer.submit(os.path.join(folder, f"{count}.jpg"), frame[y:y+h, x:x+w].copy())
+                    color = (0, 255, 0)
+                else:
+                    skipped_dupes += 1
+                    color = (0, 200, 255)
+                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+                cv2.putText(frame, f"{username} - {count}/{IMAGES_PER_STUDENT}", (x, y-10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            elif len(faces) > 1:
+                cv2.putText(frame, "Only one face in view, please", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+
+            cv2.imshow(f"Capturing Faces for {username}", frame)
+
+            # Stop when 10 images saved or 'q' pressed
+            if cv2.waitKey(1) & 0xFF == ord('q') or count >= IMAGES_PER_STUDENT:
+                break
+    finally:
+        cam.release()
+        cv2.destroyAllWindows()
+        writer.close()
+    print(f"[✅] Done capturing {writer.saved} images for {username} "
+          f"({writer.encoded} encoded, {skipped_dupes} near-duplicate frames skipped).\n")
 
 
 def capture_for_multiple_students():
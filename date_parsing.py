@@ -0,0 +1,286 @@
+"""
+date_parsing.py
+
+Shared date parsing for attendance data.
+
+Attendance dates are almost always ISO (2025-11-05, sometimes with a time);
+older files and hand-edited rows use dd/mm/yyyy and friends. The old per-page
+parsers tried up to eight strptime formats (each miss raises and catches an
+exception) and a couple of regexes for every value, on every query. Here:
+ - every distinct string is parsed once: a bounded LRU memo (DATE_CACHE_SIZE)
+   remembers the answer, and a column holds only a few hundred distinct dates,
+ - ISO YYYY-MM-DD[ HH:MM[:SS]] is sliced and int()-converted, no strptime;
+   only other spellings go through the format list,
+ - ColumnDateParser detects the format a column uses from its first values
+   and tries it first, which also settles dd/mm vs mm/dd for that column,
+ - anything no format fits goes to pandas' parser (day-first), if installed.
+An ambiguous slash date with no column to decide it is read day-first
+(05/01/2025 is 5 January), as main.py always did.
+
+    python date_parsing.py --bench [--rows N]    # legacy parser vs this one on an N-row CSV
+"""
+
+import os
+import re
+import csv
+import sys
+import time
+import tempfile
+from functools import lru_cache
+from datetime import datetime, date, timedelta
+
+# ---------- Configuration ----------
+DATE_CACHE_SIZE = 4096
+DETECT_SAMPLE = 20
+BENCH_ROWS = 1000000
+
+# tried in this order when a value isn't zero-padded ISO (dd/mm before mm/dd, as main.py always did)
+DATE_FORMATS = (
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%m/%d/%Y", "%Y/%m/%d", "%d %b %Y", "%d %B %Y",
+)
+DATETIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%m/%d/%Y %H:%M:%S",
+)
+_ISO_IN_TEXT = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_DMY_IN_TEXT = re.compile(r"(\d{2}/\d{2}/\d{4})")
+_YEAR_IN_TEXT = re.compile(r"\d{4}")
+
+
+def _iso_fast(s):
+    """datetime for 'YYYY-MM-DD' / 'YYYY-MM-DD HH:MM[:SS]' (or 'T' separator); None if s isn't that shape."""
+    if len(s) < 10 or s[4] != "-" or s[7] != "-":
+        return None
+    try:
+        y, m, d = int(s[0:4]), int(s[5:7]), int(s[8:10])
+        if len(s) == 10:
+            return datetime(y, m, d)
+        if s[10] in " T" and len(s) >= 16 and s[13] == ":":
+            sec = int(s[17:19]) if len(s) >= 19 and s[16] == ":" else 0
+            return datetime(y, m, d, int(s[11:13]), int(s[14:16]), sec)
+        return datetime(y, m, d)
+    except ValueError:
+        return None
+
+
+def _try_format(s, fmt):
+    try:
+        return datetime.strptime(s, fmt)
+    except ValueError:
+        return None
+
+
+def _parse_fallback(s):
+    """Last resort for spellings no format covers: pandas' parser, day-first. None without pandas."""
+    if not _YEAR_IN_TEXT.search(s):
+        return None         # a bare number or a word is not a date, whatever pandas makes of it
+    try:
+        import pandas as pd
+    except Exception:
+        return None
+    try:
+        ts = pd.to_datetime(s, dayfirst=True)
+    except Exception:
+        return None
+    if pd.isna(ts):
+        return None
+    return ts.to_pydatetime().replace(tzinfo=None)
+
+
+def _parse_slow(s):
+    """
+    The non-ISO path: known formats, then an ISO or dd/mm/yyyy date embedded in
+    the text, then the pandas fallback.
+    """
+    for fmt in DATETIME_FORMATS + DATE_FORMATS:
+        dt = _try_format(s, fmt)
+        if dt is not None:
+            return dt
+    m = _ISO_IN_TEXT.search(s)
+    if m:
+        dt = _iso_fast(m.group(1))
+        if dt is not None:
+            return dt
+    m = _DMY_IN_TEXT.search(s)
+    if m:
+        dt = _try_format(m.group(1), "%d/%m/%Y")
+        if dt is not None:
+            return dt
+    return _parse_fallback(s)
+
+
+def parse_datetime(value):
+    """datetime for any date spelling found in the attendance files (midnight if no time), else None."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    s = str(value).strip()
+    return _parse_text(s) if s else None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_text(s):
+    """Memoized per distinct string: a repeated date costs one dictionary lookup."""
+    dt = _iso_fast(s)
+    return dt if dt is not None else _parse_slow(s)
+
+
+def parse_date(value):
+    """datetime.date or None."""
+    dt = parse_datetime(value)
+    return dt.date() if dt is not None else None
+
+
+def iso_date(value):
+    """'YYYY-MM-DD' or None."""
+    dt = parse_datetime(value)
+    return dt.date().isoformat() if dt is not None else None
+
+
+def cache_info():
+    return _parse_text.cache_info()
+
+
+class ColumnDateParser:
+    """
+    Date parser for one column. The first DETECT_SAMPLE non-empty values pick the
+    format that parses all of them (ISO, or one of DATE_FORMATS / DATETIME_FORMATS);
+    after that each value is tried with that format first and only falls back to
+    the general parser if it doesn't fit. Results are memoized per column once the
+    format is settled. Callers holding a batch pass it to detect() before parsing,
+    so the sample rows themselves are read in the column's format; finish() settles
+    a column that ended before DETECT_SAMPLE values.
+    """
+
+    def __init__(self):
+        self.format = None          # "iso", a strptime format, or None (undecided / mixed)
+        self._samples = []
+        self._memo = {}
+
+    def _detect(self):
+        for fmt in ("iso",) + DATETIME_FORMATS + DATE_FORMATS:
+            if all((_iso_fast(s) if fmt == "iso" else _try_format(s, fmt)) is not None for s in self._samples):
+                self.format = fmt
+                break
+        self._samples = None
+        self._memo.clear()
+
+    def detect(self, values):
+        """Settle the format from the first DETECT_SAMPLE non-empty values (fewer if that's all there is)."""
+        if self._samples is None:
+            return
+        for v in values:
+            s = str(v or "").strip()
+            if s:
+                self._samples.append(s)
+                if len(self._samples) >= DETECT_SAMPLE:
+                    break
+        self.finish()
+
+    def finish(self):
+        """End of input: settle the format from the values seen so far."""
+        if self._samples:
+            self._detect()
+
+    def parse_datetime(self, value):
+        s = str(value or "").strip()
+        if not s:
+            return None
+        dt = self._memo.get(s)
+        if dt is not None or s in self._memo:
+            return dt
+        if self._samples is not None:
+            self._samples.append(s)
+            if len(self._samples) >= DETECT_SAMPLE:
+                self._detect()
+        dt = None
+        if self.format == "iso" or self.format is None:
+            dt = _iso_fast(s)
+        elif self.format:
+            dt = _try_format(s, self.format)
+        if dt is None:
+            dt = parse_datetime(s)
+        if self._samples is None and len(self._memo) < DATE_CACHE_SIZE:
+            self._memo[s] = dt         # not before detection: the format may still change the answer
+        return dt
+
+    def parse(self, value):
+        """datetime.date or None."""
+        dt = self.parse_datetime(value)
+        return dt.date() if dt is not None else None
+
+
+# ---------------------- Benchmark ----------------------
+def _legacy_parse(s):
+    """main._parse_date_str as it was: strptime per format, then two regexes."""
+    if not s:
+        return None
+    s = s.strip()
+    formats = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%m/%d/%Y", "%d %b %Y", "%Y/%m/%d", "%d %B %Y", "%Y-%m-%d %H:%M:%S")
+    for fmt in formats:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except Exception:
+            continue
+    m = re.search(r"(\d{4}-\d{2}-\d{2})", s)
+    if m:
+        try:
+            return datetime.strptime(m.group(1), "%Y-%m-%d").date()
+        except Exception:
+            pass
+    m2 = re.search(r"(\d{2}/\d{2}/\d{4})", s)
+    if m2:
+        try:
+            return datetime.strptime(m2.group(1), "%d/%m/%Y").date()
+        except Exception:
+            pass
+    return None
+
+
+def _write_bench_csv(path, n_rows, fmt):
+    day0 = date.today() - timedelta(days=365)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"])
+        for i in range(n_rows):
+            d = day0 + timedelta(days=(i // 400) % 365)
+            w.writerow([f"D{i % 400}", f"Student {i % 400}", f"student{i % 400}", "CSE",
+                        d.strftime(fmt), "09:00:00", "Present"])
+
+
+def _time_column(path, parse):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        values = [row[4] for row in reader]
+    t0 = time.perf_counter()
+    out = [parse(v) for v in values]
+    return time.perf_counter() - t0, out
+
+
+def benchmark(n_rows=BENCH_ROWS):
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, fmt in (("ISO YYYY-MM-DD", "%Y-%m-%d"), ("dd/mm/yyyy", "%d/%m/%Y"), ("dd Mon yyyy", "%d %b %Y")):
+            path = os.path.join(tmp, "bench.csv")
+            _write_bench_csv(path, n_rows, fmt)
+            _parse_text.cache_clear()
+            t_legacy, ref = _time_column(path, _legacy_parse)
+            t_shared, got = _time_column(path, parse_date)
+            col = ColumnDateParser()
+            t_column, got_col = _time_column(path, col.parse)
+            assert got == ref and got_col == ref, "parsers disagree"
+            print(f"{label:<16} {n_rows} rows: legacy {t_legacy:6.2f} s | parse_date {t_shared:6.2f} s "
+                  f"({t_legacy / t_shared:5.1f}x) | column parser [{col.format}] {t_column:6.2f} s "
+                  f"({t_legacy / t_column:5.1f}x)")
+        print(f"memo: {cache_info()}")
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        n = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else BENCH_ROWS
+        benchmark(n)
+    else:
+        for v in sys.argv[1:]:
+            print(f"{v!r} -> {parse_datetime(v)}")
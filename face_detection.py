@@ -0,0 +1,423 @@
+"""
+face_detection.py
+
+Face detector backends and tiled detection for wide, high-resolution classroom shots.
+
+Backends (DETECTOR_BACKEND, or create_detector(name)):
+ - "hog":  dlib HOG via face_recognition.face_locations (original behaviour)
+ - "haar": OpenCV Haar cascades, frontal + optional profile (fastest, least accurate)
+ - "dnn":  OpenCV DNN face detector on the CPU backend. Either the res10 SSD Caffe model
+           (DNN_CONFIG_PATH + DNN_MODEL_PATH) or, if DNN_MODEL_PATH ends in .onnx, YuNet
+           through cv2.FaceDetectorYN. Model files live in models/ (see DNN_MODEL_PATH).
+
+Shrinking a whole 4K lecture-hall frame to FRAME_RESIZE_SCALE makes back-row faces
+smaller than the HOG detector's ~80 px minimum, while running the detector on the
+full frame is far too slow. Tiled mode instead:
+ - cuts the full-resolution frame into overlapping tiles (overlap >= one face width,
+   so a face on a seam is whole in at least one tile),
+ - picks one per-tile scale so the total number of pixels fits the time budget,
+ - detects every tile in parallel in a process pool (dlib holds the GIL),
+ - maps the boxes back to frame coordinates and merges duplicates with NMS.
+
+Tiles that don't finish inside the budget are dropped for that frame rather
+than delaying the recognition loop; no more tile jobs than workers are ever
+queued, so a slow frame can't leave a backlog for the next one.
+
+Boxes everywhere are face_recognition style (top, right, bottom, left).
+
+Standalone:
+    python face_detection.py classroom.jpg [budget_seconds]
+    python face_detection.py --bench [FIXTURE_DIR]     # latency / recall of every backend
+"""
+
+import os
+import sys
+import abc
+import json
+import time
+import concurrent.futures
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+try:
+    import face_recognition
+except Exception:
+    face_recognition = None
+
+# ---------- Configuration ----------
+DETECTOR_BACKEND = "hog"         # "hog" | "haar" | "dnn"
+HAAR_MIN_SIZE = (30, 30)
+HAAR_INCLUDE_PROFILE = True      # also run the profile cascade (and its mirror) for turned heads
+MODELS_DIR = "models"
+DNN_CONFIG_PATH = os.path.join(MODELS_DIR, "deploy.prototxt")
+DNN_MODEL_PATH = os.path.join(MODELS_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+DNN_INPUT_SIZE = (300, 300)
+DNN_CONFIDENCE = 0.5
+FIXTURES_DIR = "images"          # default benchmark fixtures: one face per enrollment image
+FIXTURES_ANNOTATIONS = "faces.json"   # optional {"file.jpg": [[top, right, bottom, left], ...]}
+
+TILE_SIZE = 960                  # tile edge in full-resolution pixels
+TILE_OVERLAP = 160               # must be larger than the biggest face expected on a seam
+TILE_UPSAMPLE = 1                # dlib upsampling inside each tile (finds faces down to ~40 px)
+TILE_TIME_BUDGET_S = 0.6         # per-frame budget for the whole tiled pass
+# measured HOG throughput of one worker with upsample=1, used to size tiles for the budget
+HOG_PIXELS_PER_SECOND = 2_500_000
+NMS_IOU_THRESHOLD = 0.3
+TILE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+# ---------------- Detector backends ----------------
+class FaceDetector(abc.ABC):
+    """Interface: detect(rgb) -> [(top, right, bottom, left), ...] in rgb coordinates."""
+    name = ""
+
+    @abc.abstractmethod
+    def detect(self, rgb, upsample=0):
+        """Face boxes in rgb; `upsample` is a hint only the HOG backend uses."""
+
+
+class HogDetector(FaceDetector):
+    name = "hog"
+
+    def __init__(self):
+        if face_recognition is None:
+            raise RuntimeError("face_recognition is required for the 'hog' detector.")
+
+    def detect(self, rgb, upsample=1):
+        return face_recognition.face_locations(rgb, number_of_times_to_upsample=upsample)
+
+
+class HaarDetector(FaceDetector):
+    name = "haar"
+
+    def __init__(self, include_profile=HAAR_INCLUDE_PROFILE, min_size=HAAR_MIN_SIZE):
+        if cv2 is None:
+            raise RuntimeError("opencv-python is required for the 'haar' detector.")
+        self.frontal = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.profile = (cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_profileface.xml")
+                        if include_profile else None)
+        self.min_size = min_size
+
+    def detect(self, rgb, upsample=0):
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if upsample:
+            gray = cv2.resize(gray, (0, 0), fx=2 ** upsample, fy=2 ** upsample)
+        found = list(self.frontal.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=self.min_size))
+        if self.profile is not None:
+            found += list(self.profile.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=self.min_size))
+            # the profile cascade only knows one side; mirror the image for the other one
+            width = gray.shape[1]
+            for (x, y, w, h) in self.profile.detectMultiScale(cv2.flip(gray, 1), scaleFactor=1.1,
+                                                               minNeighbors=5, minSize=self.min_size):
+                found.append((width - x - w, y, w, h))
+        inv = 1.0 / (2 ** upsample)
+        boxes = [(int(y * inv), int((x + w) * inv), int((y + h) * inv), int(x * inv)) for (x, y, w, h) in found]
+        return non_max_suppression(boxes)
+
+
+class DnnDetector(FaceDetector):
+    name = "dnn"
+
+    def __init__(self, model_path=DNN_MODEL_PATH, config_path=DNN_CONFIG_PATH, confidence=DNN_CONFIDENCE):
+        if cv2 is None:
+            raise RuntimeError("opencv-python is required for the 'dnn' detector.")
+        if not os.path.exists(model_path):
+            raise RuntimeError(
+                f"DNN face model not found at '{model_path}'.\n"
+                "Place res10_300x300_ssd_iter_140000.caffemodel + deploy.prototxt (or a YuNet .onnx "
+                f"and set DNN_MODEL_PATH) in the '{MODELS_DIR}' folder."
+            )
+        self.confidence = confidence
+        self.yunet = None
+        self.net = None
+        if model_path.lower().endswith(".onnx"):
+            self.yunet = cv2.FaceDetectorYN.create(model_path, "", DNN_INPUT_SIZE, confidence,
+                                                   backend_id=cv2.dnn.DNN_BACKEND_OPENCV,
+                                                   target_id=cv2.dnn.DNN_TARGET_CPU)
+        else:
+            self.net = cv2.dnn.readNetFromCaffe(config_path, model_path)
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def detect(self, rgb, upsample=0):
+        h, w = rgb.shape[:2]
+        if self.yunet is not None:
+            self.yunet.setInputSize((w, h))
+            _, faces = self.yunet.detect(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+            if faces is None:
+                return []
+            return [(max(0, int(y)), min(w, int(x + fw)), min(h, int(y + fh)), max(0, int(x)))
+                    for x, y, fw, fh in faces[:, :4]]
+        blob = cv2.dnn.blobFromImage(rgb, 1.0, DNN_INPUT_SIZE, (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        out = self.net.forward()[0, 0]          # rows: [_, _, confidence, x0, y0, x1, y1]
+        out = out[out[:, 2] >= self.confidence]
+        boxes = []
+        for _, _, _, x0, y0, x1, y1 in out:
+            left, top = max(0, int(x0 * w)), max(0, int(y0 * h))
+            right, bottom = min(w, int(x1 * w)), min(h, int(y1 * h))
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+DETECTORS = {"hog": HogDetector, "haar": HaarDetector, "dnn": DnnDetector}
+
+
+def create_detector(name=DETECTOR_BACKEND):
+    try:
+        cls = DETECTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown detector backend '{name}' (choose from {', '.join(DETECTORS)})")
+    return cls()
+
+
+# one detector per worker process, created on the first tile it sees
+_worker_detectors = {}
+
+
+def _worker_detector(name):
+    det = _worker_detectors.get(name)
+    if det is None:
+        det = _worker_detectors[name] = create_detector(name)
+    return det
+
+
+# ---------------- Tiling ----------------
+def plan_tiles(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Return [(x0, y0, x1, y1), ...] overlapping tiles covering a width x height frame."""
+    tile_size = max(tile_size, overlap + 1)
+    step = tile_size - overlap
+
+    def _starts(length):
+        if length <= tile_size:
+            return [0]
+        starts = list(range(0, length - tile_size, step))
+        starts.append(length - tile_size)   # last tile flush with the edge
+        return starts
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in _starts(height) for x in _starts(width)]
+
+
+def budget_scale(width, height, tiles, workers=TILE_WORKERS, budget_s=TILE_TIME_BUDGET_S,
+                 pixels_per_second=HOG_PIXELS_PER_SECOND, upsample=TILE_UPSAMPLE):
+    """
+    Scale applied to every tile so the pass fits `budget_s`.
+    Upsampling multiplies the detector's work by ~4x per level.
+    """
+    work = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in tiles) * (4 ** upsample)
+    affordable = pixels_per_second * budget_s * workers
+    if work <= affordable:
+        return 1.0
+    return max(0.25, (affordable / work) ** 0.5)
+
+
+def box_iou(a, b):
+    top, right, bottom, left = a
+    top2, right2, bottom2, left2 = b
+    iw = min(right, right2) - max(left, left2)
+    ih = min(bottom, bottom2) - max(top, top2)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (right - left) * (bottom - top) + (right2 - left2) * (bottom2 - top2) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def non_max_suppression(boxes, iou_threshold=NMS_IOU_THRESHOLD):
+    """
+    Merge duplicate boxes (the same face seen by two overlapping tiles).
+    HOG boxes carry no score, so larger boxes win: a face cut by a seam is the smaller one.
+    """
+    kept = []
+    for box in sorted(boxes, key=lambda b: (b[1] - b[3]) * (b[2] - b[0]), reverse=True):
+        if all(box_iou(box, k) < iou_threshold for k in kept):
+            kept.append(box)
+    return kept
+
+
+def _detect_tile(job):
+    """Process-pool worker: detect faces in one tile and return boxes in frame coordinates."""
+    tile, x0, y0, scale, upsample, backend = job
+    if scale != 1.0:
+        tile = cv2.resize(tile, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    boxes = _worker_detector(backend).detect(tile, upsample)
+    inv = 1.0 / scale
+    return [(int(t * inv) + y0, int(r * inv) + x0, int(b * inv) + y0, int(l * inv) + x0)
+            for t, r, b, l in boxes]
+
+
+def _warm_worker(backend):
+    # load the detector models in the worker process before the first real frame
+    _worker_detector(backend).detect(np.zeros((64, 64, 3), dtype=np.uint8))
+    return os.getpid()
+
+
+def create_tile_pool(workers=TILE_WORKERS, backend=DETECTOR_BACKEND):
+    """Process pool for tiled detection with every worker's models pre-loaded."""
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    for _ in range(workers):
+        pool.submit(_warm_worker, backend)
+    return pool
+
+
+def detect_faces_tiled(rgb, pool, budget_s=TILE_TIME_BUDGET_S, tile_size=TILE_SIZE,
+                       overlap=TILE_OVERLAP, upsample=TILE_UPSAMPLE, workers=TILE_WORKERS,
+                       backend=DETECTOR_BACKEND, inflight=None):
+    """
+    Detect faces in a full-resolution RGB frame using overlapping tiles.
+    Returns (boxes, stats); boxes are in `rgb` coordinates.
+
+    At most `workers` tile jobs are in the pool at a time, and a tile is cut and
+    submitted only when a worker is free and the budget hasn't run out, so work
+    past the budget never piles up in the pool. A tile still running when the
+    budget ends can't be stopped; pass the same `inflight` set on every call and
+    the next frame counts it against its workers instead of queueing behind it.
+    """
+    t0 = time.perf_counter()
+    deadline = t0 + budget_s
+    h, w = rgb.shape[:2]
+    tiles = plan_tiles(w, h, tile_size, overlap)
+    scale = budget_scale(w, h, tiles, workers, budget_s, upsample=upsample)
+    inflight = set() if inflight is None else inflight
+
+    pending = list(tiles)
+    own = set()
+    boxes = []
+    while pending or own:
+        inflight.difference_update([f for f in inflight if f.done()])
+        while pending and len(inflight) < workers and time.perf_counter() < deadline:
+            x0, y0, x1, y1 = pending.pop(0)
+            f = pool.submit(_detect_tile, (np.ascontiguousarray(rgb[y0:y1, x0:x1]), x0, y0, scale, upsample, backend))
+            inflight.add(f)
+            own.add(f)
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or not inflight:
+            break
+        done, _ = concurrent.futures.wait(inflight, timeout=remaining,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for f in done & own:
+            own.discard(f)
+            try:
+                boxes.extend(f.result())
+            except Exception as e:
+                print(f"[WARN] tile detection failed: {e}")
+    for f in own:
+        f.cancel()
+
+    merged = non_max_suppression(boxes)
+    stats = {
+        "tiles": len(tiles),
+        "tiles_late": len(own) + len(pending),
+        "scale": scale,
+        "raw_boxes": len(boxes),
+        "faces": len(merged),
+        "elapsed_s": time.perf_counter() - t0,
+    }
+    return merged, stats
+
+
+# ---------------------- Benchmark ----------------------
+def _load_fixtures(fixture_dir):
+    """
+    Return [(path, gt_boxes or None)]. With faces.json the boxes are used for recall;
+    without it every image is assumed to contain exactly one face (enrollment photos).
+    """
+    annotations = {}
+    ann_path = os.path.join(fixture_dir, FIXTURES_ANNOTATIONS)
+    if os.path.exists(ann_path):
+        with open(ann_path, "r", encoding="utf-8") as f:
+            annotations = json.load(f)
+    out = []
+    for fname in sorted(os.listdir(fixture_dir)):
+        if fname.lower().endswith((".jpg", ".jpeg", ".png")):
+            gt = annotations.get(fname)
+            out.append((os.path.join(fixture_dir, fname), [tuple(b) for b in gt] if gt is not None else None))
+    return out
+
+
+def benchmark_detectors(fixture_dir=FIXTURES_DIR, backends=None, repeats=3, iou=0.3):
+    """Head-to-head latency and recall of each backend on a local fixture set. Returns a list of result dicts."""
+    fixtures = _load_fixtures(fixture_dir)
+    if not fixtures:
+        print(f"No fixture images in '{fixture_dir}'.")
+        return []
+    images = []
+    for p, gt in fixtures:
+        bgr = cv2.imread(p)
+        if bgr is not None:
+            images.append((cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), gt))
+    results = []
+    for name in backends or list(DETECTORS):
+        try:
+            det = create_detector(name)
+            det.detect(images[0][0])       # model load / first-call cost is not part of latency
+        except Exception as e:
+            print(f"[{name}] skipped: {e}")
+            continue
+        timings, found, expected, extra = [], 0, 0, 0
+        for rgb, gt in images:
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                boxes = det.detect(rgb)
+                timings.append(time.perf_counter() - t0)
+            if gt is None:
+                expected += 1
+                found += 1 if boxes else 0
+                extra += max(0, len(boxes) - 1)
+            else:
+                expected += len(gt)
+                hits = sum(1 for g in gt if any(box_iou(g, b) >= iou for b in boxes))
+                found += hits
+                extra += max(0, len(boxes) - hits)
+        timings.sort()
+        results.append({
+            "backend": name,
+            "mean_ms": 1000 * sum(timings) / len(timings),
+            "p95_ms": 1000 * timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+            "recall": found / expected if expected else 0.0,
+            "extra_boxes": extra,
+        })
+    print(f"{len(images)} fixture image(s) from '{fixture_dir}', {repeats} run(s) each")
+    print(f"{'backend':8} {'mean ms':>9} {'p95 ms':>9} {'recall':>8} {'extra':>6}")
+    for r in results:
+        print(f"{r['backend']:8} {r['mean_ms']:9.1f} {r['p95_ms']:9.1f} {r['recall']:8.1%} {r['extra_boxes']:6d}")
+    return results
+
+
+# ---------------------- Standalone check ----------------------
+if __name__ == "__main__":
+    if cv2 is None or np is None:
+        print("opencv-python and numpy are required.")
+        sys.exit(1)
+    if len(sys.argv) >= 2 and sys.argv[1] == "--bench":
+        benchmark_detectors(sys.argv[2] if len(sys.argv) > 2 else FIXTURES_DIR)
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        print("usage: python face_detection.py IMAGE [budget_seconds] | --bench [FIXTURE_DIR]")
+        sys.exit(1)
+    img = cv2.imread(sys.argv[1])
+    if img is None:
+        print(f"Could not read {sys.argv[1]}")
+        sys.exit(1)
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else TILE_TIME_BUDGET_S
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    pool = create_tile_pool()
+    try:
+        detect_faces_tiled(rgb, pool, budget_s=budget * 10)   # first pass waits for worker warm-up
+        boxes, stats = detect_faces_tiled(rgb, pool, budget_s=budget)
+    finally:
+        pool.shutdown(cancel_futures=True)
+    print(f"{img.shape[1]}x{img.shape[0]} [{DETECTOR_BACKEND}]: {stats['faces']} face(s), {stats['tiles']} tiles "
+          f"({stats['tiles_late']} over budget) at scale {stats['scale']:.2f} in {stats['elapsed_s']:.2f}s")
+    for b in boxes:
+        print("  ", b)
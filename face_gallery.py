@@ -0,0 +1,540 @@
+"""
+face_gallery.py
+
+Known-face gallery shared by the live kiosk and the offline tools.
+
+A Gallery is an immutable snapshot of the enrolled faces:
+ - encodings: (N, 128) array, one row per enrollment image
+ - names:     FULLNAME (upper case) for every row of `encodings`
+ - info:      FULLNAME -> (student_id, department)
+
+Snapshots are never modified in place; a reload builds a new Gallery and the
+owner swaps the reference, so readers holding the old snapshot keep working.
+
+GALLERY_STORAGE selects float64, float32 or int8-quantized encodings; the
+accuracy of each against float64 is reported by:
+    python face_gallery.py --quant-report [--synthetic N]
+
+Encodings are made with a named profile (ENCODING_PROFILES: landmark model +
+jitters). Templates use TEMPLATE_PROFILE, which the gallery records, and live
+probes are encoded with a profile compatible with it. Per-profile cost:
+    python face_gallery.py --profile-bench
+
+Enrollment images come from two places:
+ - images/FULLNAME_STUDENTID_DEPT.jpg (e.g. "SAMIR PRASAD_S101_CSE.jpg")
+ - dataset/<username>/<n>.jpg face crops written by capture_all_students.py;
+   the identity is looked up in students.json by username.
+An image with an up-to-date <image>.<profile>.enc.npy next to it is not decoded
+at all, so the jittered template profile is paid once per image.
+"""
+
+import os
+import json
+import traceback
+from collections import namedtuple
+
+# ---------- Optional third-party imports (defensive) ----------
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import face_recognition
+except Exception:
+    face_recognition = None
+
+# ---------- Configuration ----------
+IMAGES_DIR = "images"
+DATASET_DIRS = ("dataset",)       # per-username folders of cropped faces
+STUDENTS_JSON = "students.json"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+GALLERY_RESIZE_SCALE = 0.35   # enrollment images are encoded at the recognition scale
+ENCODING_SIZE = 128
+# In-memory encoding storage: "float64" (as returned by face_recognition, 1 KB/face),
+# "float32" (512 B/face) or "int8" (128 B/face, per-dimension scales, see QuantizedGallery)
+GALLERY_STORAGE = "float64"
+RERANK_TOP_K = 8              # int8 only: candidates re-scored in float; 0 disables the re-rank
+# Encodings computed at capture / bulk-enrollment time are stored next to the image
+# (<image>.<profile>.enc.npy, see encoding_cache_path) and reused by the gallery
+# instead of re-encoding the image.
+ENCODING_CACHE_SUFFIX = ".enc.npy"
+
+# Encoding profiles: landmark model ("small" = 5-point, "large" = 68-point) and
+# num_jitters (re-sample the face N times and average; ~N x slower, slightly more stable).
+# Probes and templates are only comparable when they use the same landmark model,
+# so every gallery records the profile its templates were made with.
+ENCODING_PROFILES = {
+    "kiosk-fast":            {"model": "small", "num_jitters": 1},    # face_recognition's own default
+    "kiosk-accurate":        {"model": "large", "num_jitters": 1},
+    "enroll-accurate":       {"model": "small", "num_jitters": 10},   # templates for kiosk-fast
+    "enroll-accurate-large": {"model": "large", "num_jitters": 10},   # templates for kiosk-accurate
+}
+TEMPLATE_PROFILE = "enroll-accurate"  # enrollment images (gallery, capture, bulk enroll, train_data); encoded once, cached
+PROBE_PROFILE = "kiosk-fast"      # used for live camera faces
+
+
+# One enrollment image on disk. `signature` is (mtime_ns, size) and changes whenever the file does.
+EnrollmentFile = namedtuple("EnrollmentFile", "path signature fullname student_id dept is_crop")
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(__file__), *parts)
+
+
+def parse_enrollment_filename(fname):
+    """Return (FULLNAME, student_id, dept) parsed from FULLNAME_STUDENTID_DEPT.jpg."""
+    base = os.path.splitext(os.path.basename(fname))[0]
+    parts = base.split("_")
+    if len(parts) >= 3:
+        fullname, student_id, dept = parts[:3]
+    else:
+        fullname, student_id, dept = parts[0], "Unknown", "Unknown"
+    return fullname.strip().upper(), student_id.strip(), dept.strip()
+
+
+def is_enrollment_image(fname):
+    return fname.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def load_students_by_username(path=None):
+    """students.json (or path) as {username: record} (a list-shaped file is keyed by each record's username)."""
+    p = path or _here(STUDENTS_JSON)
+    if not os.path.exists(p):
+        return {}
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {}
+    if isinstance(data, list):
+        data = {str(s.get("username") or "").strip(): s for s in data if isinstance(s, dict)}
+    return data if isinstance(data, dict) else {}
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def scan_enrollment_files(images_dir=IMAGES_DIR, dataset_dirs=DATASET_DIRS):
+    """
+    List every enrollment image currently on disk as {path: EnrollmentFile}.
+    Only stats files; nothing is decoded here, so it is cheap enough to poll.
+    """
+    found = {}
+    if images_dir and os.path.isdir(images_dir):
+        for entry in os.scandir(images_dir):
+            if not entry.is_file() or not is_enrollment_image(entry.name):
+                continue
+            try:
+                sig = _file_signature(entry.path)
+            except OSError:
+                continue
+            fullname, student_id, dept = parse_enrollment_filename(entry.name)
+            found[entry.path] = EnrollmentFile(entry.path, sig, fullname, student_id, dept, False)
+
+    students = None
+    for root in dataset_dirs or ():
+        if not os.path.isdir(root):
+            continue
+        for user_dir in os.scandir(root):
+            if not user_dir.is_dir():
+                continue
+            if students is None:
+                students = load_students_by_username()
+            rec = students.get(user_dir.name) or {}
+            fullname = str(rec.get("full_name") or user_dir.name).strip().upper()
+            student_id = str(rec.get("student_id") or "Unknown").strip()
+            dept = str(rec.get("department") or rec.get("course") or "Unknown").strip()
+            for entry in os.scandir(user_dir.path):
+                if not entry.is_file() or not is_enrollment_image(entry.name):
+                    continue
+                try:
+                    sig = _file_signature(entry.path)
+                except OSError:
+                    continue
+                found[entry.path] = EnrollmentFile(entry.path, sig, fullname, student_id, dept, True)
+    return found
+
+
+def profile_settings(profile=None):
+    """(model, num_jitters) for a named profile; unknown names fall back to kiosk-fast."""
+    p = ENCODING_PROFILES.get(profile or TEMPLATE_PROFILE)
+    if p is None:
+        print(f"[WARN] unknown encoding profile '{profile}', using kiosk-fast")
+        p = ENCODING_PROFILES["kiosk-fast"]
+    return p["model"], p["num_jitters"]
+
+
+def profiles_compatible(a, b):
+    """Encodings made with profiles a and b can be compared (same landmark model)."""
+    return profile_settings(a)[0] == profile_settings(b)[0]
+
+
+def compatible_probe_profile(probe_profile, template_profile):
+    """probe_profile if it matches the templates, else the fast profile with the templates' landmark model."""
+    if profiles_compatible(probe_profile, template_profile):
+        return probe_profile
+    model = profile_settings(template_profile)[0]
+    return min((n for n, p in ENCODING_PROFILES.items() if p["model"] == model),
+               key=lambda n: ENCODING_PROFILES[n]["num_jitters"])
+
+
+def encode_faces(rgb, boxes=None, profile=None):
+    """face_recognition.face_encodings with the profile's landmark model and jitters."""
+    model, jitters = profile_settings(profile)
+    return face_recognition.face_encodings(rgb, boxes, num_jitters=jitters, model=model)
+
+
+def encoding_cache_path(img_path, resize_scale=GALLERY_RESIZE_SCALE, is_crop=False, profile=None):
+    """
+    Sidecar file for a precomputed encoding. Full images depend on the resize scale, crops don't;
+    both depend on the encoding profile.
+    """
+    profile = profile or TEMPLATE_PROFILE
+    if is_crop:
+        return f"{img_path}.{profile}{ENCODING_CACHE_SUFFIX}"
+    return f"{img_path}.s{int(round((resize_scale or 1.0) * 100))}.{profile}{ENCODING_CACHE_SUFFIX}"
+
+
+def save_cached_encoding(img_path, encoding, resize_scale=GALLERY_RESIZE_SCALE, is_crop=False, profile=None):
+    """Store `encoding` next to the image; write the image first so the sidecar is the newer file."""
+    path = encoding_cache_path(img_path, resize_scale, is_crop, profile)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(encoding, dtype=np.float64))
+    os.replace(tmp, path)
+
+
+def load_cached_encoding(img_path, resize_scale=GALLERY_RESIZE_SCALE, is_crop=False, profile=None):
+    """The sidecar encoding if it exists and is not older than the image, else None."""
+    path = encoding_cache_path(img_path, resize_scale, is_crop, profile)
+    try:
+        if os.stat(path).st_mtime_ns < os.stat(img_path).st_mtime_ns:
+            return None
+        enc = np.load(path)
+    except (OSError, ValueError):
+        return None
+    return enc if enc.shape == (ENCODING_SIZE,) else None
+
+
+def encode_face_crop(rgb, profile=None):
+    """Encoding of an RGB face crop, using the whole crop as the face box (None if dlib rejects it)."""
+    h, w = rgb.shape[:2]
+    encs = encode_faces(rgb, [(0, w, h, 0)], profile)
+    return encs[0] if encs else None
+
+
+def encode_image_file(img_path, resize_scale=GALLERY_RESIZE_SCALE, is_crop=False, profile=None):
+    """
+    Read an image from disk and return the encoding of the first face found,
+    or None if the image can't be read or has no face.
+    Face crops (dataset/) are encoded at full size with the whole image as the face box.
+    A fresh sidecar encoding (see encoding_cache_path) is returned without decoding the image.
+    """
+    if np is not None:
+        cached = load_cached_encoding(img_path, resize_scale, is_crop, profile)
+        if cached is not None:
+            return cached
+    if cv2 is None or face_recognition is None:
+        return None
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"[WARN] Could not read image {img_path}")
+        return None
+    if is_crop:
+        return encode_face_crop(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), profile)
+    if resize_scale and resize_scale != 1.0:
+        img = cv2.resize(img, (0, 0), fx=resize_scale, fy=resize_scale)
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    encs = encode_faces(rgb, None, profile)
+    if not encs:
+        print(f"[WARN] No face found in {os.path.basename(img_path)}")
+        return None
+    return encs[0]
+
+
+class Gallery:
+    """
+    Immutable snapshot of known encodings. Use Gallery.build() to create one.
+    `profile` is the encoding profile the templates were made with.
+    """
+
+    def __init__(self, encodings, names, info, profile=None):
+        self.encodings = encodings
+        self.names = names
+        self.info = info
+        self.profile = profile or TEMPLATE_PROFILE
+
+    @classmethod
+    def empty(cls, profile=None):
+        enc = np.zeros((0, ENCODING_SIZE), dtype=np.float64) if np is not None else []
+        return Gallery(enc, [], {}, profile)
+
+    @classmethod
+    def build(cls, entries, storage=None, profile=None):
+        """
+        entries: iterable of (fullname, student_id, dept, encoding).
+        Later entries win for the per-name info.
+        storage: "float64" | "float32" | "int8" (default GALLERY_STORAGE).
+        profile: encoding profile of the entries (default TEMPLATE_PROFILE).
+        """
+        encs, names, info = [], [], {}
+        for fullname, student_id, dept, enc in entries:
+            if enc is None:
+                continue
+            encs.append(enc)
+            names.append(fullname)
+            info[fullname] = (student_id, dept)
+        if np is None:
+            return Gallery(encs, names, info, profile)
+        storage = storage or GALLERY_STORAGE
+        if storage == "int8":
+            return QuantizedGallery.from_float(np.asarray(encs, dtype=np.float32).reshape(-1, ENCODING_SIZE),
+                                               names, info, profile=profile)
+        dtype = np.float32 if storage == "float32" else np.float64
+        matrix = np.asarray(encs, dtype=dtype).reshape(-1, ENCODING_SIZE)
+        matrix.setflags(write=False)
+        return Gallery(matrix, names, info, profile)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def storage(self):
+        return str(getattr(self.encodings, "dtype", "float64"))
+
+    @property
+    def nbytes(self):
+        """Memory held by the encoding matrix (what has to sit in cache while matching)."""
+        return int(getattr(self.encodings, "nbytes", 0))
+
+    @property
+    def class_names(self):
+        """Distinct enrolled names (same order as first appearance)."""
+        return list(self.info.keys())
+
+    def distances(self, probe):
+        """Euclidean distance from probe to every gallery row (same metric as face_recognition.face_distance)."""
+        if len(self) == 0:
+            return np.empty((0,)) if np is not None else []
+        probe = np.asarray(probe, dtype=self.encodings.dtype)
+        return np.linalg.norm(self.encodings - probe, axis=1)
+
+    def match(self, probe, tolerance):
+        """
+        Return (name, distance) for the nearest gallery row, name is None when
+        the best distance is above tolerance (or the gallery is empty).
+        """
+        dists = self.distances(probe)
+        if len(dists) == 0:
+            return None, None
+        idx = int(np.argmin(dists))
+        best = float(dists[idx])
+        if best <= tolerance:
+            return self.names[idx], best
+        return None, best
+
+
+class QuantizedGallery(Gallery):
+    """
+    int8 gallery: codes[i, d] * scales[d] ~= encoding[i, d], with one scale per dimension.
+    128 bytes per face instead of 1 KB for float64.
+
+    Matching never dequantizes the whole matrix. With v = scales * probe,
+        |e_i - p|^2 = |e_i|^2 - 2 * (codes_i . v) + |p|^2
+    and codes_i . v is an int8 x int8 dot product accumulated in int32 after v
+    itself is quantized. The RERANK_TOP_K best candidates are then re-scored in
+    float against their dequantized rows, which removes the probe quantization error.
+    """
+
+    def __init__(self, codes, scales, row_sq, names, info, rerank_top_k=None, profile=None):
+        super().__init__(codes, names, info, profile)
+        self.scales = scales
+        self.row_sq = row_sq
+        self.rerank_top_k = RERANK_TOP_K if rerank_top_k is None else rerank_top_k
+
+    @classmethod
+    def from_float(cls, matrix, names, info, rerank_top_k=None, profile=None):
+        absmax = np.abs(matrix).max(axis=0) if len(matrix) else np.ones(ENCODING_SIZE, dtype=np.float32)
+        scales = (np.maximum(absmax, 1e-8) / 127.0).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+        decoded = codes.astype(np.float32) * scales
+        row_sq = np.einsum("ij,ij->i", decoded, decoded).astype(np.float32)
+        for arr in (codes, scales, row_sq):
+            arr.setflags(write=False)
+        return cls(codes, scales, row_sq, names, info, rerank_top_k, profile)
+
+    @property
+    def storage(self):
+        return "int8"
+
+    @property
+    def nbytes(self):
+        return int(self.encodings.nbytes + self.scales.nbytes + self.row_sq.nbytes)
+
+    def dequantize(self, rows=None):
+        codes = self.encodings if rows is None else self.encodings[rows]
+        return codes.astype(np.float32) * self.scales
+
+    def distances(self, probe):
+        """Approximate distances to every row, computed on the int8 codes."""
+        if len(self) == 0:
+            return np.empty((0,))
+        probe = np.asarray(probe, dtype=np.float32)
+        v = self.scales * probe
+        v_scale = max(float(np.abs(v).max()), 1e-12) / 127.0
+        v_codes = np.rint(v / v_scale).astype(np.int8)
+        dots = np.einsum("ij,j->i", self.encodings, v_codes, dtype=np.int32).astype(np.float32) * v_scale
+        sq = self.row_sq - 2.0 * dots + float(probe @ probe)
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def match(self, probe, tolerance):
+        dists = self.distances(probe)
+        if len(dists) == 0:
+            return None, None
+        k = min(self.rerank_top_k, len(dists))
+        if k > 0:
+            cand = np.argpartition(dists, k - 1)[:k]
+            exact = np.linalg.norm(self.dequantize(cand) - np.asarray(probe, dtype=np.float32), axis=1)
+            j = int(np.argmin(exact))
+            idx, best = int(cand[j]), float(exact[j])
+        else:
+            idx = int(np.argmin(dists))
+            best = float(dists[idx])
+        if best <= tolerance:
+            return self.names[idx], best
+        return None, best
+
+
+def load_gallery(path=IMAGES_DIR, resize_scale=GALLERY_RESIZE_SCALE, dataset_dirs=DATASET_DIRS, profile=None):
+    """Encode every enrollment image in `path` (and the dataset folders) and return a new Gallery."""
+    profile = profile or TEMPLATE_PROFILE
+    try:
+        os.makedirs(path, exist_ok=True)
+    except Exception:
+        pass
+
+    if cv2 is None or face_recognition is None or np is None:
+        print("[WARN] load_gallery skipped: cv2, numpy or face_recognition not available.")
+        return Gallery.empty(profile) if np is not None else Gallery([], [], {}, profile)
+
+    entries = []
+    files = scan_enrollment_files(path, dataset_dirs)
+    for p in sorted(files):
+        ef = files[p]
+        try:
+            enc = encode_image_file(p, resize_scale, ef.is_crop, profile)
+            if enc is not None:
+                entries.append((ef.fullname, ef.student_id, ef.dept, enc))
+        except Exception as e:
+            print(f"[ERROR] loading {os.path.basename(p)}: {e}")
+            traceback.print_exc()
+    return Gallery.build(entries, profile=profile)
+
+
+# ---------------------- Quantization accuracy report ----------------------
+def quantization_report(float_gallery_matrix, names, tolerance=0.45, noise=0.03, seed=0):
+    """
+    Compare float32 / int8 / int8+re-rank galleries against float64 on noisy copies of
+    the gallery rows (a probe of the same person never matches its template exactly).
+    """
+    rng = np.random.default_rng(seed)
+    base = np.asarray(float_gallery_matrix, dtype=np.float64)
+    probes = base + rng.normal(0.0, noise, base.shape)
+    info = {n: ("", "") for n in names}
+    ref = Gallery.build(((n, "", "", e) for n, e in zip(names, base)), storage="float64")
+
+    variants = [
+        ("float64", Gallery.build(((n, "", "", e) for n, e in zip(names, base)), storage="float64")),
+        ("float32", Gallery.build(((n, "", "", e) for n, e in zip(names, base)), storage="float32")),
+        ("int8", QuantizedGallery.from_float(base.astype(np.float32), names, info, rerank_top_k=0)),
+        ("int8+rerank", QuantizedGallery.from_float(base.astype(np.float32), names, info)),
+    ]
+    print(f"{len(base)} face(s), {len(probes)} probe(s), noise sigma {noise}")
+    print(f"{'storage':12} {'bytes/face':>10} {'shrink':>7} {'max |d err|':>12} {'top-1 agree':>12} {'decision agree':>15}")
+    ref_bytes = ref.nbytes
+    for label, g in variants:
+        errs, top1, decision = [], 0, 0
+        for p in probes:
+            rn, rd = ref.match(p, tolerance)
+            gn, gd = g.match(p, tolerance)
+            errs.append(abs(gd - rd))
+            top1 += int(np.argmin(ref.distances(p)) == np.argmin(g.distances(p)))
+            decision += int(rn == gn)
+        n = max(1, len(probes))
+        print(f"{label:12} {g.nbytes / max(1, len(g)):10.0f} {ref_bytes / max(1, g.nbytes):6.1f}x "
+              f"{max(errs):12.5f} {top1 / n:12.2%} {decision / n:15.2%}")
+
+
+# ---------------------- Encoding profile benchmark ----------------------
+def benchmark_profiles(images_dir=IMAGES_DIR, limit=20, profiles=None):
+    """
+    Per-profile encoding cost on enrollment images (face boxes detected once, outside the timing),
+    and how far each profile's encodings move from kiosk-fast's for the same face.
+    """
+    import time
+    if cv2 is None or face_recognition is None:
+        print("opencv-python and face_recognition are required.")
+        return []
+    faces = []
+    for p in sorted(scan_enrollment_files(images_dir, ())):
+        img = cv2.imread(p)
+        if img is None:
+            continue
+        img = cv2.resize(img, (0, 0), fx=GALLERY_RESIZE_SCALE, fy=GALLERY_RESIZE_SCALE)
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        boxes = face_recognition.face_locations(rgb)
+        if boxes:
+            faces.append((rgb, boxes[:1]))
+        if len(faces) >= limit:
+            break
+    if not faces:
+        print(f"No faces found in '{images_dir}'.")
+        return []
+    reference = [encode_faces(rgb, boxes, "kiosk-fast")[0] for rgb, boxes in faces]
+    results = []
+    for name in profiles or list(ENCODING_PROFILES):
+        encode_faces(faces[0][0], faces[0][1], name)      # landmark model load
+        t0 = time.perf_counter()
+        encs = [encode_faces(rgb, boxes, name)[0] for rgb, boxes in faces]
+        ms = 1000 * (time.perf_counter() - t0) / len(faces)
+        drift = float(np.mean([np.linalg.norm(a - b) for a, b in zip(encs, reference)]))
+        results.append({"profile": name, "ms_per_face": ms, "drift": drift})
+    model_of = {n: p["model"] for n, p in ENCODING_PROFILES.items()}
+    print(f"{len(faces)} face(s) from '{images_dir}'")
+    print(f"{'profile':22} {'model':6} {'jitters':>7} {'ms/face':>9} {'dist to kiosk-fast':>19}")
+    for r in results:
+        print(f"{r['profile']:22} {model_of[r['profile']]:6} {ENCODING_PROFILES[r['profile']]['num_jitters']:7d} "
+              f"{r['ms_per_face']:9.1f} {r['drift']:19.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    if np is None:
+        print("numpy is required.")
+        sys.exit(1)
+    args = sys.argv[1:]
+    if "--profile-bench" in args:
+        benchmark_profiles()
+        sys.exit(0)
+    if "--synthetic" in args:
+        n = int(args[args.index("--synthetic") + 1])
+        # face_recognition encodings are roughly N(0, 0.09) per dimension
+        matrix = np.random.default_rng(1).normal(0.0, 0.09, (n, ENCODING_SIZE))
+        names = [f"PERSON {i}" for i in range(n)]
+    else:
+        g = load_gallery()
+        if len(g) == 0:
+            print("No encodings in images/; use --synthetic N for a generated gallery.")
+            sys.exit(1)
+        matrix, names = g.encodings, g.names
+    if "--quant-report" in args or "--synthetic" in args:
+        quantization_report(matrix, names)
@@ -0,0 +1,161 @@
+"""
+gallery_watcher.py
+
+Keeps the known-face gallery in sync with the enrollment folders while the kiosk runs.
+
+A background thread polls images/ and the dataset folders (stat only, no decoding),
+encodes files that were added or changed since the last pass, evicts files that
+were removed, and publishes a brand new Gallery snapshot. Recognition never
+waits on this: the processing loop keeps matching against the previous snapshot
+until the new one is swapped in.
+
+Every reload reports its latency:
+ - encode time: how long the incremental re-encode took
+ - lag: time from the newest file modification to the new gallery being live
+"""
+
+import os
+import threading
+import time
+import traceback
+
+from face_gallery import (
+    Gallery, scan_enrollment_files, encode_image_file,
+    IMAGES_DIR, DATASET_DIRS, GALLERY_RESIZE_SCALE, TEMPLATE_PROFILE,
+)
+
+# ---------- Configuration ----------
+WATCH_INTERVAL_SECONDS = 2.0
+
+
+class GalleryWatcher:
+    def __init__(self, on_update, images_dir=IMAGES_DIR, dataset_dirs=DATASET_DIRS,
+                 resize_scale=GALLERY_RESIZE_SCALE, interval=WATCH_INTERVAL_SECONDS, profile=TEMPLATE_PROFILE):
+        """
+        on_update(gallery, stats) is called from the watcher thread every time the
+        set of encodings changes. `stats` is a dict with added/changed/removed
+        counts and the reload timings. Templates are encoded with `profile`.
+        """
+        self.on_update = on_update
+        self.images_dir = images_dir
+        self.dataset_dirs = dataset_dirs
+        self.resize_scale = resize_scale
+        self.interval = interval
+        self.profile = profile
+
+        # path -> (EnrollmentFile, encoding or None); replaced only by a run that hasn't been stopped
+        self._entries = {}
+        self._thread = None
+        self._stop_event = threading.Event()    # the current run's; each start() gets a fresh one
+        self._publish_lock = threading.RLock()  # stop() vs. a run about to publish
+        self._wake_event = threading.Event()
+        self._force_full = False
+        self.last_stats = None
+
+    # ---------------- Thread control ----------------
+    def start(self):
+        if self.is_running():
+            return
+        # a stopped run that is still finishing an encode keeps its own (set) event and exits
+        # without publishing, so it can't be revived by this one
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop the current run. Once this returns, that run publishes nothing more."""
+        with self._publish_lock:
+            self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        if self._thread is not None and not self._thread.is_alive():
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def request_reload(self, full=False):
+        """Wake the watcher now instead of waiting for the next poll; full=True re-encodes everything."""
+        if full:
+            self._force_full = True
+        self._wake_event.set()
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.sync(stop_event)
+            except Exception as e:
+                print(f"[ERROR] gallery watcher: {e}")
+                traceback.print_exc()
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+        print("[INFO] Gallery watcher stopped.")
+
+    # ---------------- Incremental sync ----------------
+    def sync(self, stop_event=None):
+        """One poll: diff the folders against the known entries and publish if anything changed."""
+        stop_event = stop_event or self._stop_event
+        t_scan = time.perf_counter()
+        if self._force_full:
+            self._force_full = False
+            known = {}
+            first_pass = True
+        else:
+            known = self._entries
+            first_pass = not known and self.last_stats is None
+
+        try:
+            os.makedirs(self.images_dir, exist_ok=True)
+        except Exception:
+            pass
+        on_disk = scan_enrollment_files(self.images_dir, self.dataset_dirs)
+
+        added = [p for p in on_disk if p not in known]
+        changed = [p for p in on_disk if p in known and known[p][0].signature != on_disk[p].signature]
+        removed = [p for p in known if p not in on_disk]
+        if not (added or changed or removed) and not first_pass:
+            return False
+
+        t_encode = time.perf_counter()
+        entries = {p: v for p, v in known.items() if p in on_disk and p not in changed}
+        for p in added + changed:
+            if stop_event.is_set():
+                return False
+            ef = on_disk[p]
+            try:
+                enc = encode_image_file(p, self.resize_scale, ef.is_crop, self.profile)
+            except Exception as e:
+                print(f"[ERROR] loading {os.path.basename(p)}: {e}")
+                enc = None
+            # keep failed files too, so they are retried only after they change again
+            entries[p] = (ef, enc)
+        encode_s = time.perf_counter() - t_encode
+
+        gallery = Gallery.build(
+            ((ef.fullname, ef.student_id, ef.dept, enc) for _, (ef, enc) in sorted(entries.items())),
+            profile=self.profile,
+        )
+
+        now = time.time()
+        touched = [on_disk[p].signature[0] / 1e9 for p in added + changed]
+        stats = {
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+            "images": len(gallery),
+            "scan_s": t_encode - t_scan,
+            "encode_s": encode_s,
+            "lag_s": (now - max(touched)) if (touched and not first_pass) else None,
+        }
+        with self._publish_lock:
+            if stop_event.is_set():
+                return False        # stopped while encoding: this run's results are dropped
+            self._entries = entries
+            self.last_stats = stats
+            self.on_update(gallery, stats)
+
+        lag = f", lag {stats['lag_s']:.2f}s" if stats["lag_s"] is not None else ""
+        print(f"[INFO] Gallery reload: +{stats['added']} ~{stats['changed']} -{stats['removed']} "
+              f"({stats['images']} image(s)) encode {encode_s:.2f}s{lag}")
+        return True
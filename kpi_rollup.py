@@ -0,0 +1,171 @@
+"""
+kpi_rollup.py
+
+Teacher dashboard KPIs kept current from write events instead of rescans.
+
+The dashboard shows total students, total attendance records, present today
+and absent today. Previously every 3 s tick re-read students.json and the whole
+attendance CSV (twice) on the Tk thread. The rollup keeps the numbers:
+ - records / present today move with the attendance repository's delta rows;
+   attendance_writer nudges the repository after each write, so a mark shows
+   up without waiting for a watcher tick,
+ - students.json is re-read only when its (size, mtime) changes,
+ - "today" rolls over at midnight from the repository's per-day index.
+With ATTENDANCE_BACKEND = "segments" the records count comes from the segment
+manifest and present today from today's segment (attendance_segments.py).
+
+snapshot() returns the current numbers plus a version that changes whenever
+any of them does, so the dashboard can skip redrawing when nothing happened.
+"""
+
+import os
+import json
+import threading
+from collections import namedtuple
+from datetime import date
+
+import attendance_writer
+from attendance_repository import get_attendance_repository, normalize_username
+from attendance_segments import active_segment_store
+
+# ---------- Configuration ----------
+ATTENDANCE_CSV = "Attendance.csv"
+STUDENTS_JSON = "students.json"
+
+KpiSnapshot = namedtuple("KpiSnapshot", "total_students total_records present_today absent_today present_pct version")
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def read_roster(path):
+    """(number of student entries, set of normalized usernames) from students.json."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return 0, set()
+    if isinstance(data, dict):
+        entries = [(s, k) for k, s in data.items()]
+    elif isinstance(data, list):
+        entries = [(s, None) for s in data]
+    else:
+        return 0, set()
+    usernames = set()
+    for s, key in entries:
+        if isinstance(s, dict):
+            u = s.get("username") or s.get("Username") or key
+            if u:
+                usernames.add(normalize_username(u))
+    return len(entries), usernames
+
+
+class KpiRollup:
+    def __init__(self, csv_path, students_json):
+        self.csv_path = csv_path
+        self.students_json = students_json
+        self._lock = threading.Lock()
+        self._repo = get_attendance_repository(csv_path)
+        self._roster_sig = None
+        self._student_entries = 0
+        self._roster = set()
+        self._seen_usernames = set()
+        self._records = 0
+        self._day = None
+        self._present = set()
+        self.version = 0
+
+    # ---------------------- updates ----------------------
+    def _reset_from(self, table):
+        self._records = len(table)
+        self._seen_usernames = table.usernames()
+        self._day = date.today()
+        self._present = table.present_usernames_on(self._day)
+        self.version += 1
+
+    def on_records(self, records, reloaded):
+        """attendance repository subscriber."""
+        with self._lock:
+            if reloaded:
+                self._reset_from(self._repo.current())
+                return
+            today = date.today()
+            for r in records:
+                if r.username_norm:
+                    self._seen_usernames.add(r.username_norm)
+                if r.present and r.date == today and (r.username_norm or r.full_name):
+                    self._present.add(r.username_norm or normalize_username(r.full_name))
+            self._records += len(records)
+            self.version += 1
+
+    def on_row_written(self, csv_path, row):
+        """attendance_writer listener: pull the new line through the repository (parses just that line)."""
+        if os.path.abspath(csv_path) == self.csv_path:
+            self._repo.refresh()
+
+    def _check_roster(self):
+        sig = _file_signature(self.students_json)
+        if sig != self._roster_sig:
+            self._roster_sig = sig
+            self._student_entries, self._roster = read_roster(self.students_json)
+            self.version += 1
+
+    def _check_day(self):
+        if self._day != date.today():
+            table = self._repo.current()
+            if table is not None:
+                self._reset_from(table)
+
+    # ---------------------- reads ----------------------
+    def snapshot(self, total_students_override=None, default_total_students=None):
+        """
+        Current KPIs. Cheap: two stat() calls and a few lengths (plus today's segment
+        on the segments backend). Absent today is
+        counted against the students.json usernames, else default_total_students,
+        else everyone seen in the CSV; total_students_override replaces all three.
+        """
+        self._repo.refresh()
+        store = active_segment_store(self.csv_path)
+        with self._lock:
+            self._check_roster()
+            self._check_day()
+            roster = len(self._roster) or default_total_students or max(1, len(self._seen_usernames))
+            if total_students_override is not None:
+                roster = int(total_students_override)
+            if store is not None:
+                records, present = store.count_rows(), len(store.present_usernames_on())
+            else:
+                records, present = self._records, len(self._present)
+            return KpiSnapshot(self._student_entries, records, present, max(0, roster - present),
+                               (present / roster) if roster else 0.0, self.version)
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_kpi_rollup(csv_path=None, students_json=None):
+    """Process-wide KpiRollup (subscribed to the repository and the attendance writer on first call)."""
+    csv_path = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    students_json = os.path.abspath(students_json or _here(STUDENTS_JSON))
+    key = (csv_path, students_json)
+    with _rollups_lock:
+        rollup = _rollups.get(key)
+        if rollup is None:
+            rollup = _rollups[key] = KpiRollup(csv_path, students_json)
+            repo = get_attendance_repository(csv_path)
+            repo.subscribe(rollup.on_records)
+            table = repo.snapshot()
+            with rollup._lock:
+                rollup._reset_from(table)
+            attendance_writer.add_write_listener(rollup.on_row_written)
+        return rollup
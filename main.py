@@ -3,7 +3,6 @@ import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="face_recognition_models")
 
 import os
-import csv
 import math
 import json
 import re
@@ -14,7 +13,10 @@ from datetime import datetime, date
 
 # Added imports for duplicate-guarding
 import threading
-import time
+
+# native thread limits (see runtime_policy.py) have to be set before matplotlib pulls in numpy
+import runtime_policy
+runtime_policy.apply_env_limits()
 
 # optional matplotlib for teacher graphs
 try:
@@ -41,7 +43,7 @@ except Exception:
 
 # attendance marking page
 try:
-    from attendance import MarkAttendancePage
+    from attendance import MarkAttendancePage, get_shared_recognition_service, CV2_AVAILABLE, FR_AVAILABLE
 except Exception:
     tb = traceback.format_exc()
     try:
@@ -50,6 +52,13 @@ except Exception:
         print("Failed to import attendance.py. Traceback:\n", tb)
     raise
 
+from attendance_repository import get_attendance_repository, records_from_rows
+from attendance_db import active_attendance_db
+from attendance_columns import get_attendance_columns
+from attendance_aggregates import get_attendance_aggregates
+from presence_bitmaps import get_presence_bitmaps
+from kpi_rollup import get_kpi_rollup
+
 # optional Pillow for profile images
 try:
     from PIL import Image, ImageTk
@@ -167,45 +176,6 @@ def _read_students_json():
 def _count_students():
     return len(_read_students_json())
 
-def _count_attendance_rows():
-    path = _here(CSV_FILENAME)
-    if not os.path.exists(path):
-        return 0
-    try:
-        with open(path, "r", newline="", encoding="utf-8") as f:
-            rows = list(csv.reader(f))
-            if not rows:
-                return 0
-            return max(0, len(rows) - 1)
-    except Exception:
-        return 0
-
-def _parse_date_str(s):
-    if not s:
-        return None
-    s = s.strip()
-    formats = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%m/%d/%Y", "%d %b %Y", "%Y/%m/%d", "%d %B %Y", "%Y-%m-%d %H:%M:%S")
-    for fmt in formats:
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            continue
-    # Try to extract ISO date substring
-    m = re.search(r"(\d{4}-\d{2}-\d{2})", s)
-    if m:
-        try:
-            return datetime.strptime(m.group(1), "%Y-%m-%d").date()
-        except Exception:
-            pass
-    # Try common dd/mm/yyyy patterns
-    m2 = re.search(r"(\d{2}/\d{2}/\d{4})", s)
-    if m2:
-        try:
-            return datetime.strptime(m2.group(1), "%d/%m/%Y").date()
-        except Exception:
-            pass
-    return None
-
 # ---------------- Username normalizer ----------------
 def _normalize_username(u):
     if not u:
@@ -215,149 +185,54 @@ def _normalize_username(u):
     except Exception:
         return str(u).strip()
 
-def _today_attendance_stats(project_root=None, csv_filename=None, students_json=None, total_students_override=None):
-    project_root = project_root or os.path.dirname(__file__)
-    csv_filename = csv_filename or CSV_FILENAME
-    students_json = students_json or STUDENTS_JSON
+def _total_students_fallback():
+    """TOTAL_STUDENTS, if set as an int, for when students.json lists nobody."""
+    value = globals().get("TOTAL_STUDENTS")
+    return value if isinstance(value, int) else None
 
-    csv_path = os.path.join(project_root, csv_filename)
-    today_str = date.today().isoformat()  # 'YYYY-MM-DD'
-
-    present_today_set = set()
-    all_usernames_seen = set()
-    if os.path.exists(csv_path):
-        try:
-            with open(csv_path, "r", newline="", encoding="utf-8") as fh:
-                reader = csv.DictReader(fh)
-                headers = [h.strip() for h in (reader.fieldnames or [])]
-                headers_l = [h.lower() for h in headers]
-
-                username_col = None
-                date_col = None
-                status_col = None
-                for cand in ("username", "user", "user name", "fullname", "fullName", "FullName", "Username"):
-                    if cand.lower() in headers_l:
-                        username_col = headers[headers_l.index(cand.lower())]
-                        break
-                for cand in ("date", "day", "Date", "timestamp", "Datetime"):
-                    if cand.lower() in headers_l:
-                        date_col = headers[headers_l.index(cand.lower())]
-                        break
-                for cand in ("status", "Status", "presence", "Presence"):
-                    if cand.lower() in headers_l:
-                        status_col = headers[headers_l.index(cand.lower())]
-                        break
-
-                present_values = {
-                    "present", "p", "1", "yes", "true", "y",
-                    "present✓", "present✔", "present✅"
-                }
-
-                for row in reader:
-                    username = (row.get(username_col) or "").strip() if username_col else (row.get(headers[0]) or "").strip()
-                    row_date = (row.get(date_col) or "").strip() if date_col else ""
-                    status = (row.get(status_col) or "").strip().lower() if status_col else ""
-
-                    if username:
-                        all_usernames_seen.add(_normalize_username(username))
-
-                    if row_date and " " in row_date:
-                        row_date = row_date.split(" ")[0]
-
-                    if row_date == today_str and status in present_values:
-                        present_today_set.add(_normalize_username(username))
-        except Exception:
-            present_today_set = set()
-
-    present_today = len(present_today_set)
-
-    total_students = None
-    sj_path = os.path.join(project_root, students_json)
-    if os.path.exists(sj_path):
-        try:
-            with open(sj_path, "r", encoding="utf-8") as fh:
-                data = json.load(fh)
-
-            usernames = set()
-            if isinstance(data, dict):
-                for key, s in data.items():
-                    if isinstance(s, dict):
-                        u = s.get("username") or s.get("Username") or key
-                        if u:
-                            usernames.add(_normalize_username(u))
-            elif isinstance(data, list):
-                for s in data:
-                    if isinstance(s, dict):
-                        u = s.get("username") or s.get("Username")
-                        if u:
-                            usernames.add(_normalize_username(u))
-
-            if usernames:
-                total_students = len(usernames)
-        except Exception:
-            total_students = None
-
-    if total_students_override is not None:
-        try:
-            total_students = int(total_students_override)
-        except Exception:
-            pass
-
-    if total_students is None:
-        if "TOTAL_STUDENTS" in globals() and isinstance(globals().get("TOTAL_STUDENTS"), int):
-            total_students = globals().get("TOTAL_STUDENTS")
-        else:
-            total_students = max(1, len(all_usernames_seen))
-
-    absent_today = max(0, total_students - present_today)
-    present_pct = (present_today / total_students) if total_students else 0.0
-
-    return present_today, absent_today, present_pct
+def _present_by_department_text(csv_path):
+    """'CSE 12 · ECE 8' for today's present students (columnar group-by, attendance_columns.py); '' without numpy."""
+    try:
+        cols = get_attendance_columns(csv_path)
+        if cols is None:
+            return ""
+        counts = cols.present_per_department(date.today())
+    except Exception as e:
+        print("[WARN] department breakdown failed:", e)
+        return ""
+    return " · ".join(f"{dept or '-'} {n}" for dept, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
 
 def _last_attendance_rows(limit=5):
     csv_path = _here(CSV_FILENAME)
     if not os.path.exists(csv_path):
         return []
     try:
-        with open(csv_path, "r", newline="", encoding="utf-8") as f:
-            reader = list(csv.DictReader(f))
-            if not reader:
-                return []
-            last = reader[-limit:]
-            out = []
-            for row in reversed(last):
-                raw_username = (row.get("Username") or row.get("username") or row.get("User") or row.get("user") or "").strip()
-                if not raw_username and len(row) > 0:
-                    for v in row.values():
-                        if v and str(v).strip():
-                            raw_username = str(v).strip()
-                            break
-
-                d = row.get("Date") or row.get("date") or ""
-                t = row.get("Time") or row.get("time") or ""
-                parsed_date = _parse_date_str(d)
+        out = []
+        db = active_attendance_db(csv_path)
+        recs = records_from_rows(db.last_rows(limit)) if db else get_attendance_repository(csv_path).snapshot().last(limit)
+        for rec in recs:
+            raw_username = rec.username
+            if not raw_username:
+                raw_username = next((v for v in (rec.registration, rec.full_name, rec.department) if v), "")
+            parsed_time = None
+            try:
+                parsed_time = datetime.strptime(rec.time, "%H:%M:%S").time()
+            except Exception:
                 parsed_time = None
-                try:
-                    parsed_time = datetime.strptime(t, "%H:%M:%S").time()
-                except Exception:
-                    parsed_time = None
-                if parsed_date and parsed_time:
-                    dt_str = datetime.combine(parsed_date, parsed_time).strftime("%Y-%m-%d %H:%M:%S")
-                elif parsed_date:
-                    dt_str = parsed_date.isoformat()
-                elif d:
-                    dt_str = d
-                else:
-                    dt_str = (row.get("Timestamp") or row.get("timestamp") or "").strip() or ""
-                normalized = _normalize_username(raw_username)
-                out.append({
-                    "username": raw_username,
-                    "username_norm": normalized,
-                    "status": (row.get("Status") or row.get("status") or "").strip(),
-                    "datetime": dt_str,
-                    "raw": row
-                })
-            return out
+            if rec.date and parsed_time:
+                dt_str = datetime.combine(rec.date, parsed_time).strftime("%Y-%m-%d %H:%M:%S")
+            elif rec.date:
+                dt_str = rec.date.isoformat()
+            else:
+                dt_str = rec.date_text
+            out.append({
+                "username": raw_username,
+                "username_norm": _normalize_username(raw_username),
+                "status": rec.status,
+                "datetime": dt_str,
+                "raw": rec._asdict()
+            })
+        return out
     except Exception:
         return []
 
@@ -444,40 +319,18 @@ def _attendance_timeseries_for_user(username: str):
     csv_path = _here(CSV_FILENAME)
     if not os.path.exists(csv_path):
         return [], [], []
-    present_values = {"present", "p", "1", "yes", "true", "y", "present✓", "present✔", "present✅"}
-    per_date = {}
     try:
-        with open(csv_path, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            fields = [h.strip() for h in (reader.fieldnames or [])]
-            hdr = {k.lower(): k for k in fields}
-            col_user = hdr.get("username", "Username")
-            col_status = hdr.get("status", "Status")
-            col_date = hdr.get("date", "Date")
-            for row in reader:
-                user_val = (row.get(col_user) or "").strip()
-                if user_val != (username or ""):
-                    if _normalize_username(user_val) != _normalize_username(username):
-                        continue
-                status_val = (row.get(col_status) or "").strip().lower()
-                date_val = (row.get(col_date) or "").strip()
-                parsed = _parse_date_str(date_val)
-                if not parsed:
-                    m = re.search(r"(\d{4}-\d{2}-\d{2})", date_val or "")
-                    if m:
-                        try:
-                            parsed = datetime.strptime(m.group(1), "%Y-%m-%d").date()
-                        except Exception:
-                            parsed = None
-                if not parsed: continue
-                flag = 1 if (status_val in present_values) else 0
-                per_date[parsed] = max(per_date.get(parsed, 0), flag)
+        db = active_attendance_db(csv_path)
+        if db:
+            series = db.timeseries_for(username)
+            dates_sorted, daily_present = [date.fromisoformat(d) for d, _ in series], [p for _, p in series]
+        else:
+            # per-student day bitmaps (presence_bitmaps.py), kept current on every mark
+            dates_sorted, daily_present = get_presence_bitmaps(csv_path).series(username)
     except Exception:
         return [], [], []
-    if not per_date:
+    if not dates_sorted:
         return [], [], []
-    dates_sorted = sorted(per_date.keys())
-    daily_present = [per_date[d] for d in dates_sorted]
     cum = 0
     cum_pct = []
     for v in daily_present:
@@ -486,6 +339,15 @@ def _attendance_timeseries_for_user(username: str):
         cum_pct.append(pct)
     return dates_sorted, daily_present, cum_pct
 
+def _attendance_streaks_for_user(username: str, student_id: str = ""):
+    """(current, longest) run of present class days from the presence bitmaps; (0, 0) if unavailable."""
+    try:
+        bitmaps = get_presence_bitmaps(_here(CSV_FILENAME))
+        return bitmaps.current_streak(username, student_id), bitmaps.longest_streak(username, student_id)
+    except Exception as e:
+        print("[WARN] attendance streaks unavailable:", e)
+        return 0, 0
+
 # --------------- UI class ----------------
 class Face_Reconition_System:
     def __init__(self, root, authenticated=False, user_role=None, username=None, student_id=None):
@@ -510,8 +372,10 @@ class Face_Reconition_System:
         # teacher KPI autos-refresh state (used by periodic updater)
         self._teacher_kpi_job = None
         self._teacher_kpi_widgets = {}
+        self._kpi_version = None        # KpiSnapshot.version last drawn
         # CSV watcher to detect external attendance writes and refresh KPIs (teacher view)
-        self._csv_mtime = None
+        self._csv_pending_rows = 0      # rows appended since the KPIs were last refreshed (set by _on_csv_rows)
+        self._csv_unsubscribe = None
         self._csv_watcher_job = None
         self._csv_watcher_interval_ms = 2000  # check every 2s (adjust as desired)
         # UI element for visual refresh timestamp and toast
@@ -523,10 +387,6 @@ class Face_Reconition_System:
         self._encodings_loaded = False
         self.encodings = None
 
-        # short-term cache for attendance lookups to avoid duplicate CSV reads (TTL in seconds)
-        self._attendance_cache = {}   # username -> {'ts': float, 'result': (present_count, total_classes)}
-        self._attendance_cache_ttl = 1.0  # seconds (tweak if needed)
-
         if not authenticated:
             from User_Authentication import User_Authentication
             self.clear_root()
@@ -552,6 +412,16 @@ class Face_Reconition_System:
         self.setup_sidebar()
         self.setup_main_frame()
         self.select_menu("Dashboard")
+        self._start_model_warmup()
+
+    def _start_model_warmup(self):
+        # students mark attendance from this session: load the face models now, not on "Start Camera"
+        if self.user_role != "Student" or not (CV2_AVAILABLE and FR_AVAILABLE):
+            return
+        try:
+            get_shared_recognition_service().warm_up()
+        except Exception as e:
+            print(f"[WARN] Could not start model warm-up: {e}")
 
     def _init_ttk_theme_once(self, root):
         try:
@@ -579,6 +449,9 @@ class Face_Reconition_System:
                 if getattr(self, "_csv_watcher_job", None):
                     self.root.after_cancel(self._csv_watcher_job)
                     self._csv_watcher_job = None
+                if getattr(self, "_csv_unsubscribe", None):
+                    self._csv_unsubscribe()
+                    self._csv_unsubscribe = None
             except Exception:
                 pass
             # cancel toast if running
@@ -588,6 +461,7 @@ class Face_Reconition_System:
                     self._kpi_toast_job = None
             except Exception:
                 pass
+            self._close_pages()
             self.root.destroy()
         except Exception:
             os._exit(0)
@@ -790,123 +664,19 @@ class Face_Reconition_System:
             print(f"[Attendance] CSV not found at {csv_path}")
             return 0, TOTAL_CLASSES
 
+        # maintained on every write (attendance_aggregates.py), so this is a lookup, not a scan
         try:
-            now = time.time()
-            cache = self._attendance_cache.get(username)
-            if cache and (now - cache.get("ts", 0.0)) < self._attendance_cache_ttl:
-                return cache.get("result", (0, TOTAL_CLASSES))
-        except Exception:
-            pass
-
-        def norm(v):
-            try:
-                return str(v).strip().lower()
-            except Exception:
-                return (v or "").strip().lower()
-
-        target_norm = norm(username)
-        target_student_id = (self.student_id or "").strip()
-
-        present_values = {"present", "p", "1", "yes", "true", "y", "present✓", "present✔", "present✅"}
-
-        matched_rows = []
-        user_present_dates = set()
-
-        try:
-            with open(csv_path, "r", newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                headers = [h.strip() for h in (reader.fieldnames or [])]
-                hdr_l = [h.lower() for h in headers]
-
-                col_user = None
-                col_fullname = None
-                col_reg = None
-                col_date = None
-                col_status = None
-
-                for cand in ("username","user","user name","user_name","udid","Username"):
-                    if cand.lower() in hdr_l:
-                        col_user = headers[hdr_l.index(cand.lower())]
-                        break
-                for cand in ("fullname","full name","name","FullName","Full Name"):
-                    if cand.lower() in hdr_l:
-                        col_fullname = headers[hdr_l.index(cand.lower())]
-                        break
-                for cand in ("registration no","registration_no","reg no","regno","registration","student_id","student id","Registration No"):
-                    if cand.lower() in hdr_l:
-                        col_reg = headers[hdr_l.index(cand.lower())]
-                        break
-                for cand in ("date","day","Date","timestamp","Datetime"):
-                    if cand.lower() in hdr_l:
-                        col_date = headers[hdr_l.index(cand.lower())]
-                        break
-                for cand in ("status","Status","presence","Presence"):
-                    if cand.lower() in hdr_l:
-                        col_status = headers[hdr_l.index(cand.lower())]
-                        break
-
-                for r in reader:
-                    raw_user = (r.get(col_user) or r.get(headers[0]) or "").strip() if col_user or headers else ""
-                    raw_fullname = (r.get(col_fullname) or "").strip() if col_fullname else ""
-                    raw_reg = (r.get(col_reg) or "").strip() if col_reg else ""
-                    raw_date = (r.get(col_date) or "").strip() if col_date else ""
-                    raw_status = (r.get(col_status) or "").strip().lower() if col_status else ""
-
-                    matched = False
-                    if raw_user and norm(raw_user) == target_norm and target_norm:
-                        matched = True
-                        match_by = "username"
-                    elif raw_fullname and norm(raw_fullname) == target_norm and target_norm:
-                        matched = True
-                        match_by = "fullname"
-                    elif target_student_id and raw_reg and raw_reg == target_student_id:
-                        matched = True
-                        match_by = "registration"
-                    elif raw_user and target_norm and target_norm in norm(raw_user):
-                        matched = True
-                        match_by = "username_contains"
-                    else:
-                        match_by = None
-
-                    if matched:
-                        matched_rows.append({"raw_user": raw_user, "raw_fullname": raw_fullname, "raw_reg": raw_reg,
-                                             "date": raw_date, "status": raw_status, "match_by": match_by})
-
-                        parsed = None
-                        try:
-                            parsed_dt = _parse_date_str(raw_date)
-                            if parsed_dt:
-                                parsed = parsed_dt.isoformat()
-                        except Exception:
-                            parsed = None
-                        if not parsed:
-                            if raw_date and " " in raw_date:
-                                parsed = raw_date.split(" ")[0].strip()
-                            else:
-                                parsed = raw_date or ""
-
-                        if raw_status in present_values:
-                            user_present_dates.add(parsed)
-
+            db = active_attendance_db(csv_path)
+            if db:
+                present_count = len(db.present_dates_for(username, (self.student_id or "").strip()))
+            else:
+                aggregates = get_attendance_aggregates(csv_path)
+                get_attendance_repository(csv_path).refresh()     # pull in rows other tools appended
+                present_count = aggregates.present_days(username, (self.student_id or "").strip())
         except Exception as e:
-            print("[Attendance] Error reading CSV:", e)
+            print("[Attendance] Error reading attendance totals:", e)
             return 0, TOTAL_CLASSES
 
-        print(f"[Attendance DEBUG] login username='{username}' normalized='{target_norm}' student_id='{target_student_id}'")
-        if matched_rows:
-            print(f"[Attendance DEBUG] Found {len(matched_rows)} matched CSV row(s). Sample:")
-            for i, mr in enumerate(matched_rows[:6]):
-                print(f"  #{i+1}: match_by={mr['match_by']} reg='{mr['raw_reg']}' user='{mr['raw_user']}' full='{mr['raw_fullname']}' date='{mr['date']}' status='{mr['status']}'")
-        else:
-            print("[Attendance DEBUG] No matching CSV rows found for this user.")
-
-        present_count = len([d for d in user_present_dates if d])
-
-        try:
-            self._attendance_cache[username] = {"ts": time.time(), "result": (present_count, TOTAL_CLASSES)}
-        except Exception:
-            pass
-
         return present_count, TOTAL_CLASSES
 
     # ---------- small helper to create KPI card used across teacher/student ----------
@@ -1304,9 +1074,11 @@ class Face_Reconition_System:
                 # teacher KPI row
                 stats_wrap = ctk.CTkFrame(frame, fg_color="transparent"); stats_wrap.pack(fill="x", padx=16, pady=(12,18))
                 stats_wrap.grid_columnconfigure((0,1,2,3), weight=1)
-                total_students = _count_students()
-                total_records = _count_attendance_rows()
-                present_today, absent_today, present_pct = _today_attendance_stats()
+                kpis = get_kpi_rollup(_here(CSV_FILENAME), _here(STUDENTS_JSON)).snapshot(
+                    default_total_students=_total_students_fallback())
+                self._kpi_version = kpis.version
+                total_students, total_records = kpis.total_students, kpis.total_records
+                absent_today, present_pct = kpis.absent_today, kpis.present_pct
                 pct_text = f"{round(present_pct*100)}%"
                 def _big_card(parent, emoji, color, title, value):
                     c = ctk.CTkFrame(parent, fg_color=self.card_bg, corner_radius=14)
@@ -1323,6 +1095,8 @@ class Face_Reconition_System:
                 k1_frame, k1_val = _big_card(stats_wrap, "🎒", "#F59E0B", "Total Students", total_students); k1_frame.grid(row=0,column=0, padx=6, pady=6, sticky="nsew")
                 k2_frame, k2_val = _big_card(stats_wrap, "🗂️", "#60A5FA", "Attendance Records", total_records); k2_frame.grid(row=0,column=1, padx=6, pady=6, sticky="nsew")
                 k3_frame, k3_val = _big_card(stats_wrap, "📈", "#34D399", "Today's Present %", pct_text); k3_frame.grid(row=0,column=2, padx=6,pady=6, sticky="nsew")
+                k3_dept = ctk.CTkLabel(k3_frame, text=_present_by_department_text(_here(CSV_FILENAME)), font=("Segoe UI", 10), text_color=self.text_secondary)
+                k3_dept.pack(anchor="w", padx=8, pady=(0,8))
                 k4_frame, k4_val = _big_card(stats_wrap, "❌", "#F87171", "Today's Absent", absent_today); k4_frame.grid(row=0,column=3, padx=6,pady=6, sticky="nsew")
 
                 refresh_wrap = ctk.CTkFrame(frame, fg_color="transparent")
@@ -1357,6 +1131,7 @@ class Face_Reconition_System:
                 self._teacher_kpi_widgets["total_students"] = k1_val
                 self._teacher_kpi_widgets["attendance_records"] = k2_val
                 self._teacher_kpi_widgets["present_pct"] = k3_val
+                self._teacher_kpi_widgets["present_by_dept"] = k3_dept
                 self._teacher_kpi_widgets["absent_today"] = k4_val
 
                 try:
@@ -1415,7 +1190,8 @@ class Face_Reconition_System:
                 c1 = self._stat_card_small(kpi_wrap, "🏫", "#64748b", "Total Classes", total, subtitle="Term target baseline")
                 c1.grid(row=0, column=0, sticky="nsew", padx=8, pady=8)
 
-                c2 = self._stat_card_small(kpi_wrap, "🙋🏻‍♂️", "#10B981", "Present (Unique Days)", present_count, subtitle="Unique dates marked present", sparkline=recent_trend)
+                streak, best_streak = _attendance_streaks_for_user(self.username, (self.student_id or "").strip())
+                c2 = self._stat_card_small(kpi_wrap, "🙋🏻‍♂️", "#10B981", "Present (Unique Days)", present_count, subtitle=f"Unique dates marked present · streak {streak} (best {best_streak})", sparkline=recent_trend)
                 c2.grid(row=0, column=1, sticky="nsew", padx=8, pady=8)
 
                 c3 = self._stat_card_small(kpi_wrap, "❗", "#F59E0B", "Absent (Derived)", absent_derived, subtitle="Based on fixed total classes")
@@ -1797,21 +1573,44 @@ class Face_Reconition_System:
         if self.user_role != "Teacher":
             return
 
-        total_students = _count_students()
-        total_records = _count_attendance_rows()
-        present_today, absent_today, present_pct = _today_attendance_stats()
-        pct_text = f"{round(present_pct*100)}%"
+        # cached rollup (kpi_rollup.py): nothing is re-read unless a file changed
+        try:
+            kpis = get_kpi_rollup(_here(CSV_FILENAME), _here(STUDENTS_JSON)).snapshot(
+                default_total_students=_total_students_fallback())
+        except Exception as e:
+            print("[WARN] KPI rollup failed:", e)
+            kpis = None
+        if kpis is not None and (kpis.version != self._kpi_version or show_toast):
+            self._draw_teacher_kpis(kpis, show_toast)
+
+        try:
+            if self._teacher_kpi_job:
+                self.root.after_cancel(self._teacher_kpi_job)
+                self._teacher_kpi_job = None
+        except Exception:
+            pass
+
+        if schedule_next:
+            try:
+                self._teacher_kpi_job = self.root.after(interval_ms, lambda: self.update_teacher_kpis(True, interval_ms))
+            except Exception:
+                self._teacher_kpi_job = None
 
+    def _draw_teacher_kpis(self, kpis, show_toast=False):
+        self._kpi_version = kpis.version
+        pct_text = f"{round(kpis.present_pct*100)}%"
         try:
             w = self._teacher_kpi_widgets
             if "total_students" in w:
-                w["total_students"].configure(text=str(total_students))
+                w["total_students"].configure(text=str(kpis.total_students))
             if "attendance_records" in w:
-                w["attendance_records"].configure(text=str(total_records))
+                w["attendance_records"].configure(text=str(kpis.total_records))
             if "present_pct" in w:
                 w["present_pct"].configure(text=pct_text)
+            if "present_by_dept" in w:
+                w["present_by_dept"].configure(text=_present_by_department_text(_here(CSV_FILENAME)))
             if "absent_today" in w:
-                w["absent_today"].configure(text=str(absent_today))
+                w["absent_today"].configure(text=str(kpis.absent_today))
             try:
                 if self._kpi_last_refreshed_label:
                     self._kpi_last_refreshed_label.configure(text=f"Last refreshed: {datetime.now().strftime('%H:%M:%S')}")
@@ -1822,19 +1621,6 @@ class Face_Reconition_System:
         except Exception:
             pass
 
-        try:
-            if self._teacher_kpi_job:
-                self.root.after_cancel(self._teacher_kpi_job)
-                self._teacher_kpi_job = None
-        except Exception:
-            pass
-
-        if schedule_next:
-            try:
-                self._teacher_kpi_job = self.root.after(interval_ms, lambda: self.update_teacher_kpis(True, interval_ms))
-            except Exception:
-                self._teacher_kpi_job = None
-
     def _show_kpi_toast(self, text, duration_ms=1300):
         try:
             if getattr(self, "_kpi_toast_label", None):
@@ -1876,43 +1662,35 @@ class Face_Reconition_System:
         except Exception:
             pass
 
+    def _on_csv_rows(self, records, reloaded):
+        # repository subscriber: may run on any thread that refreshed the snapshot, so only count here
+        self._csv_pending_rows += max(1, len(records)) if reloaded else len(records)
+
     def _check_csv_mtime(self):
+        # parse only the lines appended since the last tick; rows another page's read already
+        # picked up were counted by _on_csv_rows
         try:
-            csv_path = _here(CSV_FILENAME)
-            if not os.path.exists(csv_path):
-                self._csv_mtime = None
-            else:
-                try:
-                    m = os.path.getmtime(csv_path)
-                except Exception:
-                    m = None
-                if self._csv_mtime is None:
-                    self._csv_mtime = m
-                else:
-                    if m and self._csv_mtime != m:
-                        self._csv_mtime = m
-                        try:
-                            self.update_teacher_kpis(schedule_next=False, show_toast=True)
-                        except Exception:
-                            pass
-            try:
-                self._csv_watcher_job = self.root.after(self._csv_watcher_interval_ms, self._check_csv_mtime)
-            except Exception:
-                self._csv_watcher_job = None
+            get_attendance_repository(_here(CSV_FILENAME)).refresh()
+            if self._csv_pending_rows:
+                self._csv_pending_rows = 0
+                self.update_teacher_kpis(schedule_next=False, show_toast=True)
         except Exception:
-            try:
-                self._csv_watcher_job = self.root.after(self._csv_watcher_interval_ms, self._check_csv_mtime)
-            except Exception:
-                self._csv_watcher_job = None
+            pass
+        try:
+            self._csv_watcher_job = self.root.after(self._csv_watcher_interval_ms, self._check_csv_mtime)
+        except Exception:
+            self._csv_watcher_job = None
 
     def _start_csv_watcher(self):
         try:
             if self.user_role == "Teacher" and getattr(self, "_csv_watcher_job", None) is None:
                 try:
-                    csv_path = _here(CSV_FILENAME)
-                    self._csv_mtime = os.path.getmtime(csv_path) if os.path.exists(csv_path) else None
+                    repo = get_attendance_repository(_here(CSV_FILENAME))
+                    repo.refresh()
+                    if self._csv_unsubscribe is None:
+                        self._csv_unsubscribe = repo.subscribe(self._on_csv_rows)
                 except Exception:
-                    self._csv_mtime = None
+                    self._csv_unsubscribe = None
                 self._csv_watcher_job = self.root.after(self._csv_watcher_interval_ms, self._check_csv_mtime)
         except Exception:
             pass
@@ -2066,54 +1844,10 @@ class Face_Reconition_System:
             return
 
         try:
-            with open(path, "r", newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                fieldnames = [h.strip() for h in (reader.fieldnames or [])]
-                lower = [h.lower() for h in fieldnames]
-                for row in reader:
-                    raw_date = ""
-                    raw_time = ""
-                    # pick date/time
-                    for cand in ("date","day","timestamp"):
-                        if cand in lower:
-                            raw_date = row.get(fieldnames[lower.index(cand)], "") or ""
-                            break
-                    for cand in ("time","timestamp"):
-                        if cand in lower:
-                            raw_time = row.get(fieldnames[lower.index(cand)], "") or ""
-                            break
-                    # fallback split timestamp
-                    if raw_date and not raw_time and isinstance(raw_date, str) and " " in raw_date:
-                        parts = raw_date.split(" ")
-                        raw_date = parts[0]
-                        raw_time = parts[1] if len(parts) > 1 else ""
-                    raw_user = ""
-                    raw_full = ""
-                    raw_status = ""
-                    raw_reg = ""
-                    # find user/full/reg/status columns
-                    for cand in ("username","user","user name","user_name","Username","User"):
-                        if cand in row and row.get(cand):
-                            raw_user = str(row.get(cand)).strip()
-                            break
-                    for cand in ("fullname","full name","name","FullName"):
-                        if cand in row and row.get(cand):
-                            raw_full = str(row.get(cand)).strip()
-                            break
-                    for cand in ("registration","registration no","regno","reg no","student_id","student id","Registration No"):
-                        if cand in row and row.get(cand):
-                            raw_reg = str(row.get(cand)).strip()
-                            break
-                    for cand in ("status","presence","Status","Presence"):
-                        if cand in row and row.get(cand):
-                            raw_status = str(row.get(cand)).strip()
-                            break
-                    if not raw_user:
-                        for v in row.values():
-                            if v and str(v).strip():
-                                raw_user = str(v).strip()
-                                break
-                    treeview.insert("", "end", values=(raw_date, raw_time, raw_user, raw_full, raw_reg, raw_status))
+            db = active_attendance_db(path)
+            for rec in (records_from_rows(db.all_rows()) if db else get_attendance_repository(path).snapshot().records):
+                raw_user = rec.username or rec.registration or rec.full_name
+                treeview.insert("", "end", values=(rec.date_text, rec.time, raw_user, rec.full_name, rec.registration, rec.status))
         except Exception as e:
             print("[Records] Failed populating attendance tree:", e)
 
@@ -2130,82 +1864,19 @@ class Face_Reconition_System:
         if not os.path.exists(path):
             return
 
-        qn = (name_query or "").strip().lower()
-        qr = (reg_query or "").strip().lower()
-
         try:
-            with open(path, "r", newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                fieldnames = [h.strip() for h in (reader.fieldnames or [])]
-                lower = [h.lower() for h in fieldnames]
-
-                # heuristics: identify candidate column names
-                date_col = None; time_col = None; user_col = None; full_col = None; reg_col = None; status_col = None
-                for cand in ("date","day","timestamp"):
-                    if cand in lower:
-                        date_col = fieldnames[lower.index(cand)]
-                        break
-                for cand in ("time","timestamp"):
-                    if cand in lower:
-                        time_col = fieldnames[lower.index(cand)]
-                        break
-                for cand in ("username","user","user name","user_name","Username","User"):
-                    if cand in lower and user_col is None:
-                        user_col = fieldnames[lower.index(cand)]
-                for cand in ("fullname","full name","name","FullName"):
-                    if cand in lower:
-                        full_col = fieldnames[lower.index(cand)]
-                        break
-                for cand in ("registration","registration no","regno","reg no","student_id","student id","Registration No"):
-                    if cand in lower:
-                        reg_col = fieldnames[lower.index(cand)]
-                        break
-                for cand in ("status","presence","Status","Presence"):
-                    if cand in lower:
-                        status_col = fieldnames[lower.index(cand)]
-                        break
-
-                for row in reader:
-                    raw_date = (row.get(date_col) or "") if date_col else ""
-                    raw_time = (row.get(time_col) or "") if time_col else ""
-                    # fallback splitting
-                    if raw_date and not raw_time and isinstance(raw_date, str) and " " in raw_date:
-                        parts = raw_date.split(" ")
-                        raw_date = parts[0]; raw_time = parts[1] if len(parts) > 1 else ""
-                    raw_user = (row.get(user_col) or "").strip() if user_col else ""
-                    raw_full = (row.get(full_col) or "").strip() if full_col else ""
-                    raw_reg = (row.get(reg_col) or "").strip() if reg_col else ""
-                    raw_status = (row.get(status_col) or "").strip() if status_col else ""
-
-                    # fallback attempts to pull values if heuristics didn't find columns
-                    if not raw_user:
-                        for key in row:
-                            val = row.get(key)
-                            if val and str(val).strip():
-                                raw_user = str(val).strip()
-                                break
-                    if not raw_full:
-                        # try to find something that looks like a full name (two words)
-                        for key in row:
-                            val = row.get(key)
-                            if val and isinstance(val, str) and len(val.split()) >= 2:
-                                raw_full = val.strip()
-                                break
-
-                    norm_user = (raw_user or "").lower()
-                    norm_full = (raw_full or "").lower()
-                    norm_reg = (raw_reg or "").lower()
-
-                    matches = False
-                    if qn:
-                        if qn in norm_full or qn in norm_user:
-                            matches = True
-                    if qr:
-                        if qr in norm_reg or qr in norm_user:
-                            matches = True
-
-                    if matches:
-                        treeview.insert("", "end", values=(raw_date, raw_time, raw_user, raw_full, raw_reg, raw_status))
+            # indexed query on the sqlite backend, else a columnar search (attendance_columns.py) when numpy is available
+            db = active_attendance_db(path)
+            cols = None if db else get_attendance_columns(path)
+            if db:
+                matches = records_from_rows(db.search(name_query, reg_query))
+            elif cols is not None:
+                matches = cols.records(cols.search(name_query, reg_query))
+            else:
+                matches = get_attendance_repository(path).snapshot().search(name_query, reg_query)
+            for rec in matches:
+                raw_user = rec.username or rec.registration or rec.full_name
+                treeview.insert("", "end", values=(rec.date_text, rec.time, raw_user, rec.full_name, rec.registration, rec.status))
         except Exception as e:
             print("[Records] Filtered populate failed:", e)
 
@@ -2257,8 +1928,19 @@ class Face_Reconition_System:
         except Exception:
             pass
 
+    def _close_pages(self):
+        # pages holding shared resources (camera, recognition service) release them here
+        for page_obj in list(self.cached_pages.values()):
+            close = getattr(page_obj, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
     def logout(self):
         from User_Authentication import User_Authentication
+        self._close_pages()
         self.clear_root()
         self._init_ttk_theme_once(self.root)
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
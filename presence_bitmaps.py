@@ -0,0 +1,334 @@
+"""
+presence_bitmaps.py
+
+One bit per calendar day for every student: the month calendar, the graphs'
+daily series and attendance streaks answered with integer bit operations.
+
+Rows are keyed like attendance_aggregates (user:/reg:/name:, row_keys); each
+key has two bitmaps, stored as Python ints where bit i is day `origin + i`:
+ - present: at least one present row that day,
+ - seen: any row that day (present or not), for the graphs' daily series.
+origin is TERM_START if set, otherwise the earliest attendance date; a row
+dated before it moves the origin back (every bitmap is shifted once). A term
+of ~200 days is ~25 bytes per bitmap.
+
+Queries are masks and popcounts:
+ - present days in a month: (present >> first-day bit) & month mask,
+ - streaks: runs of present | weekend-mask (SKIP_WEEKENDS, as in
+   attendance_aggregates), counting only the present bits of a run (shown on
+   the student dashboard, over the same keys the present-days count unions),
+ - daily series for the graphs: the set bits of seen, flagged from present.
+
+Like attendance_aggregates, bits are set on every row attendance_writer writes
+and every row the attendance repository reports (setting a bit twice is a
+no-op). The bitmaps are saved to presence_bitmaps.json a few seconds after
+the last change together with the CSV's (size, mtime), and reused on start if
+the CSV hasn't changed since; otherwise they are rebuilt from one parse.
+"""
+
+import os
+import json
+import threading
+from datetime import date, timedelta
+
+import attendance_aggregates
+import attendance_writer
+from attendance_db import is_present_status
+from attendance_aggregates import lookup_keys, row_keys
+from attendance_repository import get_attendance_repository, normalize_username
+from date_parsing import parse_date
+
+# ---------- Configuration ----------
+BITMAPS_FILE = "presence_bitmaps.json"
+ATTENDANCE_CSV = "Attendance.csv"
+TERM_START = None           # "YYYY-MM-DD" to pin bit 0 to the first day of term; None: earliest attendance date
+SAVE_DELAY_S = 3.0
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+if hasattr(int, "bit_count"):
+    def popcount(x):
+        return x.bit_count()
+else:
+    def popcount(x):
+        return bin(x).count("1")
+
+
+def _ones(n):
+    return (1 << n) - 1 if n > 0 else 0
+
+
+def _bit_positions(x):
+    """Indices of the set bits of x, lowest first."""
+    out = []
+    while x:
+        low = x & -x
+        out.append(low.bit_length() - 1)
+        x ^= low
+    return out
+
+
+def _trailing_ones(x):
+    return ((x ^ (x + 1)) >> 1).bit_length()
+
+
+class StudentBitmap:
+    __slots__ = ("present", "seen")
+
+    def __init__(self, present=0, seen=0):
+        self.present = present
+        self.seen = seen
+
+
+class PresenceBitmaps:
+    def __init__(self, csv_path, store_path):
+        self.csv_path = csv_path
+        self.store_path = store_path
+        self._lock = threading.RLock()
+        self._students = {}         # "user:<username>" / "reg:<registration>" / "name:<full name>" -> StudentBitmap
+        self.origin = date.fromisoformat(TERM_START) if TERM_START else None
+        self._weekend_cache = (None, 0, 0)      # (origin, nbits, mask)
+        self._signature = None
+        self._save_timer = None
+        self.rebuilds = 0
+
+    # ---------------------- bit positions ----------------------
+    def bit_of(self, day):
+        """Bit index of a date (negative before origin, None before anything was recorded)."""
+        return None if self.origin is None else (day - self.origin).days
+
+    def day_of(self, bit):
+        return self.origin + timedelta(days=bit)
+
+    def _rebase(self, day):
+        """Move origin back to `day`, shifting every bitmap."""
+        shift = (self.origin - day).days
+        for bm in self._students.values():
+            bm.present <<= shift
+            bm.seen <<= shift
+        self.origin = day
+
+    def _weekends(self, nbits):
+        """Mask of the Saturday/Sunday bits among the first nbits (0 unless SKIP_WEEKENDS)."""
+        if not attendance_aggregates.SKIP_WEEKENDS or self.origin is None or nbits <= 0:
+            return 0
+        origin, cached_bits, mask = self._weekend_cache
+        if origin == self.origin and cached_bits >= nbits:
+            return mask & _ones(nbits)
+        week = 0
+        for i in range(7):
+            if (self.origin.weekday() + i) % 7 >= 5:
+                week |= 1 << i
+        mask, width = week, 7
+        while width < nbits:
+            mask |= mask << width
+            width *= 2
+        self._weekend_cache = (self.origin, width, mask)
+        return mask & _ones(nbits)
+
+    # ---------------------- updates ----------------------
+    def _apply(self, registration, full_name, username, day, present):
+        keys = row_keys(registration, full_name, username)
+        if not keys or day is None:
+            return False
+        if self.origin is None:
+            self.origin = day
+        elif day < self.origin:
+            self._rebase(day)
+        bit = 1 << (day - self.origin).days
+        changed = False
+        for key in keys:
+            bm = self._students.get(key)
+            if bm is None:
+                bm = self._students[key] = StudentBitmap()
+            before = (bm.present, bm.seen)
+            bm.seen |= bit
+            if present:
+                bm.present |= bit
+            changed |= (bm.present, bm.seen) != before
+        return changed
+
+    def on_row_written(self, csv_path, row):
+        """attendance_writer listener: row is in ATTENDANCE_HEADER order."""
+        if os.path.abspath(csv_path) != self.csv_path:
+            return
+        reg, full, user, _dept, d, _t, status = (list(row) + [""] * 7)[:7]
+        with self._lock:
+            self._apply(reg, full, user, parse_date(d), is_present_status(status))
+            self._signature = _file_signature(self.csv_path)
+        self._schedule_save()
+
+    def on_records(self, records, reloaded):
+        """attendance repository subscriber: rows appended (or the whole file re-parsed)."""
+        with self._lock:
+            if reloaded and _file_signature(self.csv_path) == self._signature:
+                return          # the first parse of a file we already have bitmaps for
+            if reloaded:
+                self._rebuild_from(records)
+            else:
+                for r in records:
+                    self._apply(r.registration, r.full_name, r.username, r.date, r.present)
+            self._signature = _file_signature(self.csv_path)
+        self._schedule_save()
+
+    def _rebuild_from(self, records):
+        self._students = {}
+        self.origin = date.fromisoformat(TERM_START) if TERM_START else None
+        for r in records:
+            self._apply(r.registration, r.full_name, r.username, r.date, r.present)
+        self.rebuilds += 1
+
+    # ---------------------- persistence ----------------------
+    def load(self):
+        """Use the saved bitmaps if the CSV is unchanged since they were saved; otherwise rebuild."""
+        sig = _file_signature(self.csv_path)
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if (data.get("version") == 2 and data.get("csv_signature") == sig and sig is not None
+                    and data.get("term_start") == TERM_START):
+                with self._lock:
+                    self.origin = date.fromisoformat(data["origin"]) if data.get("origin") else None
+                    self._students = {u: StudentBitmap(int(p, 16), int(s, 16))
+                                      for u, (p, s) in data.get("students", {}).items()}
+                    self._signature = sig
+                return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN] {BITMAPS_FILE} unreadable ({e}); rebuilding")
+        table = get_attendance_repository(self.csv_path).snapshot()
+        with self._lock:
+            self._rebuild_from(table.records)
+            self._signature = sig
+        self.save()
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY_S, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            data = {"version": 2, "csv_signature": self._signature, "term_start": TERM_START,
+                    "origin": self.origin.isoformat() if self.origin else None,
+                    "students": {u: [format(bm.present, "x"), format(bm.seen, "x")]
+                                 for u, bm in self._students.items()}}
+        tmp = self.store_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.store_path)
+        except Exception as e:
+            print(f"[WARN] could not save {BITMAPS_FILE}: {e}")
+
+    # ---------------------- reads ----------------------
+    def bitmap(self, username):
+        """(present, seen) ints for a username; (0, 0) if it has no rows."""
+        with self._lock:
+            bm = self._students.get("user:" + normalize_username(username))
+            return (bm.present, bm.seen) if bm else (0, 0)
+
+    def student_bitmap(self, username=None, registration=None):
+        """(present, seen) over every key the present-days count matches (attendance_aggregates.lookup_keys)."""
+        present = seen = 0
+        with self._lock:
+            for key in lookup_keys(self._students, username, registration):
+                bm = self._students.get(key)
+                if bm is not None:
+                    present |= bm.present
+                    seen |= bm.seen
+        return present, seen
+
+    def month_bits(self, username, year, month):
+        """Present bits of one month, bit 0 = the 1st (what the calendar grid renders)."""
+        with self._lock:
+            if self.origin is None:
+                return 0
+            first = date(year, month, 1)
+            days = ((first + timedelta(days=32)).replace(day=1) - first).days
+            lo = self.bit_of(first)
+            present = self.bitmap(username)[0]
+            month = (present >> lo) if lo >= 0 else (present << -lo)
+            return month & _ones(days)
+
+    def present_days_in_month(self, username, year, month):
+        """{day of month} the student was present."""
+        return {i + 1 for i in _bit_positions(self.month_bits(username, year, month))}
+
+    def series(self, username):
+        """(sorted dates with any row, 0/1 present flags) for the graphs."""
+        with self._lock:
+            present, seen = self.bitmap(username)
+            bits = _bit_positions(seen)
+            return [self.day_of(b) for b in bits], [(present >> b) & 1 for b in bits]
+
+    def current_streak(self, username, registration=None, today=None):
+        """Consecutive class days present up to today (today doesn't break it until a row for it is absent)."""
+        with self._lock:
+            present, seen = self.student_bitmap(username, registration)
+            if not present:
+                return 0
+            t = self.bit_of(today or date.today())
+            if t < 0:
+                return 0
+            present &= _ones(t + 1)
+            pending = 0 if (seen >> t) & 1 else 1 << t
+            covered = present | self._weekends(t + 1) | pending
+            gaps = ~covered & _ones(t + 1)
+            run = _ones(t + 1) & ~_ones(gaps.bit_length())
+            return popcount(present & run)
+
+    def longest_streak(self, username, registration=None):
+        """Longest run of present class days."""
+        with self._lock:
+            present = self.student_bitmap(username, registration)[0]
+            x = present | self._weekends(present.bit_length())
+            x &= _ones(present.bit_length())
+            best = 0
+            while x:
+                start = (x & -x).bit_length() - 1
+                run = _ones(_trailing_ones(x >> start)) << start
+                best = max(best, popcount(present & run))
+                x &= ~run
+            return best
+
+    def __len__(self):
+        return len(self._students)
+
+
+_bitmaps = {}
+_bitmaps_lock = threading.Lock()
+
+
+def get_presence_bitmaps(csv_path=None):
+    """
+    Process-wide presence bitmaps for csv_path: loaded (or rebuilt) on first call,
+    then kept current from attendance_writer and the attendance repository (each
+    call first picks up rows appended to the CSV since the last one).
+    """
+    csv_path = os.path.abspath(csv_path or _here(ATTENDANCE_CSV))
+    with _bitmaps_lock:
+        bitmaps = _bitmaps.get(csv_path)
+        if bitmaps is None:
+            store = os.path.join(os.path.dirname(csv_path), BITMAPS_FILE)
+            bitmaps = _bitmaps[csv_path] = PresenceBitmaps(csv_path, store)
+            bitmaps.load()
+            attendance_writer.add_write_listener(bitmaps.on_row_written)
+            get_attendance_repository(csv_path).subscribe(bitmaps.on_records)
+    get_attendance_repository(csv_path).refresh()      # rows other tools appended reach on_records
+    return bitmaps
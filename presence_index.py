@@ -0,0 +1,118 @@
+"""
+presence_index.py
+
+In-memory index of who is already present on which day.
+
+Keys are (date, "reg", registration) and (date, "user", username). The index is
+built once by streaming Attendance.csv, updated in place by the writer after
+every append, and rebuilt only when the file was changed by someone else
+(its (size, mtime) no longer matches what the index last saw). The duplicate
+check in attendance_writer.mark_present is then a set lookup, whatever the
+length of the history.
+"""
+
+import os
+import csv
+import threading
+
+# column name variants accepted for the registration / username columns (same as the original scan)
+REG_COLUMNS = ("Registration", "Registration No", "RegistrationNo", "StudentID", "studentid", "registration")
+USER_COLUMNS = ("Username", "username")
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _row_reg(row):
+    for c in REG_COLUMNS:
+        v = row.get(c)
+        if v:
+            return str(v).strip()
+    return ""
+
+
+class PresenceIndex:
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._keys = set()
+        self._signature = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _reload(self):
+        keys = set()
+        try:
+            with open(self.csv_path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    date = (row.get("Date") or "").strip()
+                    if not date:
+                        continue
+                    reg = _row_reg(row)
+                    if reg:
+                        keys.add((date, "reg", reg))
+                    user = (row.get("Username") or row.get("username") or "").strip()
+                    if user:
+                        keys.add((date, "user", user))
+        except FileNotFoundError:
+            pass
+        self._keys = keys
+        self._signature = _file_signature(self.csv_path)
+        self._loaded = True
+        self.reloads += 1
+
+    def _ensure_fresh(self):
+        if not self._loaded or _file_signature(self.csv_path) != self._signature:
+            self._reload()
+
+    def is_present(self, date_str, registration=None, username=None):
+        """True if registration (preferred) or username already has a row for date_str."""
+        with self._lock:
+            self._ensure_fresh()
+            reg = str(registration or "").strip()
+            user = str(username or "").strip()
+            return bool((reg and (date_str, "reg", reg) in self._keys) or
+                        (user and (date_str, "user", user) in self._keys))
+
+    def record(self, date_str, registration=None, username=None):
+        """
+        Note a row this process just appended. The new file signature is taken as
+        ours, so our own append does not force a rebuild.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._reload()
+                return
+            reg = str(registration or "").strip()
+            user = str(username or "").strip()
+            if reg:
+                self._keys.add((date_str, "reg", reg))
+            if user:
+                self._keys.add((date_str, "user", user))
+            self._signature = _file_signature(self.csv_path)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def __len__(self):
+        return len(self._keys)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_presence_index(csv_path):
+    """Process-wide PresenceIndex for csv_path."""
+    key = os.path.abspath(csv_path)
+    with _indexes_lock:
+        idx = _indexes.get(key)
+        if idx is None:
+            idx = _indexes[key] = PresenceIndex(key)
+        return idx
@@ -0,0 +1,131 @@
+"""
+recognition_events.py
+
+In-process event bus between the recognition threads, the storage writer and Tk.
+
+The capture / processing threads never touch Tk or the CSV themselves; they
+publish typed events and carry on:
+ - storage events (AttendanceMatch) go to a bounded queue drained by a
+   dedicated writer thread,
+ - everything else goes to a bounded, coalescing UI queue that the Tk thread
+   drains on a timer. Only the newest PreviewFrame / StatusText is kept, so a
+   busy UI skips stale previews instead of building a backlog of callbacks.
+
+publish() never blocks: a full queue drops the oldest coalescable event (UI) or
+reports the loss (storage) instead of making the recognition loop wait.
+"""
+
+import queue
+import threading
+import traceback
+from collections import deque, namedtuple
+
+# ---------- Configuration ----------
+UI_QUEUE_SIZE = 64
+STORAGE_QUEUE_SIZE = 64
+UI_POLL_MS = 30
+STORAGE_POLL_S = 0.5      # how often an idle writer thread checks whether the bus was closed
+
+# ---------- Events ----------
+PreviewFrame = namedtuple("PreviewFrame", "image")                    # Tk/CTk image for the video label
+StatusText = namedtuple("StatusText", "text color")
+AccessDenied = namedtuple("AccessDenied", "message")
+CameraError = namedtuple("CameraError", "message")
+AttendanceMatch = namedtuple("AttendanceMatch", "name username distance")   # confirmed face -> mark it
+MarkResult = namedtuple("MarkResult", "status name message last_info")      # status: marked | already | error
+
+COALESCED_EVENTS = (PreviewFrame, StatusText)
+STORAGE_EVENTS = (AttendanceMatch,)
+
+
+class CoalescingQueue:
+    """
+    Bounded FIFO where an event of a coalesced type replaces the pending one of the same type.
+    put() never blocks; get_all() returns and clears everything pending.
+    """
+
+    def __init__(self, maxsize=UI_QUEUE_SIZE, coalesce=COALESCED_EVENTS):
+        self.maxsize = maxsize
+        self.coalesce = coalesce
+        self._items = deque()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, event):
+        with self._lock:
+            if isinstance(event, self.coalesce):
+                for i, pending in enumerate(self._items):
+                    if type(pending) is type(event):
+                        del self._items[i]
+                        self.dropped += 1
+                        break
+            if len(self._items) >= self.maxsize:
+                # make room: oldest coalescable event first, otherwise the oldest event
+                victim = next((i for i, e in enumerate(self._items) if isinstance(e, self.coalesce)), 0)
+                del self._items[victim]
+                self.dropped += 1
+            self._items.append(event)
+
+    def get_all(self):
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RecognitionEventBus:
+    """
+    One bus per attendance page.
+    storage_handler(event) runs on the bus's writer thread for every storage event;
+    UI events are read by the Tk thread with drain_ui().
+    """
+
+    def __init__(self, storage_handler, ui_size=UI_QUEUE_SIZE, storage_size=STORAGE_QUEUE_SIZE):
+        self.ui = CoalescingQueue(ui_size)
+        self._storage = queue.Queue(maxsize=storage_size)
+        self._storage_handler = storage_handler
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._storage_loop, daemon=True)
+        self._writer.start()
+
+    def publish(self, event):
+        if isinstance(event, STORAGE_EVENTS):
+            try:
+                self._storage.put_nowait(event)
+            except queue.Full:
+                print(f"[ERROR] storage queue full, dropped {event}")
+                self.ui.put(MarkResult("error", getattr(event, "name", ""), "Attendance writer is busy; try again.", None))
+        else:
+            self.ui.put(event)
+
+    def drain_ui(self):
+        return self.ui.get_all()
+
+    def close(self):
+        """Let the writer finish what is queued, then stop it. Never blocks (called on the Tk thread)."""
+        self._closed.set()
+        try:
+            self._storage.put_nowait(None)      # wakes an idle writer; if the queue is full it sees the flag later
+        except queue.Full:
+            pass
+
+    def _storage_loop(self):
+        while True:
+            try:
+                event = self._storage.get(timeout=STORAGE_POLL_S)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+            if event is None:
+                if self._closed.is_set() and self._storage.empty():
+                    return
+                continue
+            try:
+                self._storage_handler(event)
+            except Exception as e:
+                print(f"[ERROR] storage handler: {e}")
+                traceback.print_exc()
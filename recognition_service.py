@@ -0,0 +1,325 @@
+"""
+recognition_service.py
+
+Process-wide recognition service shared by every MarkAttendancePage.
+
+The service owns the known-face gallery, the face detector / encoder calls and
+the background workers that (re)build the gallery. Pages subscribe to it instead
+of loading their own copy of the encodings:
+
+    service = get_recognition_service()
+    service.acquire(on_gallery_changed)     # first acquire starts warm-up
+    ...
+    service.release(on_gallery_changed)     # last release schedules shutdown
+
+Shutdown is deferred by IDLE_SHUTDOWN_SECONDS so a kiosk that logs one student
+out and the next one in keeps its warm gallery instead of re-encoding images/.
+
+While acquired, a GalleryWatcher keeps the gallery in sync with images/ and the
+dataset folders, so newly enrolled photos are picked up without a restart.
+
+Detection goes through the backend chosen by face_detection.DETECTOR_BACKEND
+(dlib HOG, OpenCV Haar or OpenCV DNN). Faces are encoded with PROBE_PROFILE, or
+with a compatible profile if the gallery's templates use another landmark model.
+
+warm_up() loads the detector / landmark / encoder models and runs one dummy
+inference through each on a background thread, so the first real frame after
+"Start Camera" runs at steady-state speed.
+"""
+
+import threading
+import time
+import traceback
+
+from face_gallery import (
+    Gallery, IMAGES_DIR, DATASET_DIRS, GALLERY_RESIZE_SCALE, PROBE_PROFILE,
+    encode_faces, compatible_probe_profile,
+)
+from gallery_watcher import GalleryWatcher
+import face_detection
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import face_recognition
+except Exception:
+    face_recognition = None
+
+# ---------- Configuration ----------
+IDLE_SHUTDOWN_SECONDS = 15 * 60   # keep the gallery warm this long after the last page is released
+# dummy frame used for warm-up: 1280x720 camera frame at the 0.35 recognition scale
+WARMUP_FRAME_SIZE = (448, 252)
+
+
+class RecognitionService:
+    def __init__(self, images_dir=IMAGES_DIR, resize_scale=GALLERY_RESIZE_SCALE, dataset_dirs=DATASET_DIRS,
+                 detector_backend=face_detection.DETECTOR_BACKEND):
+        self.images_dir = images_dir
+        self.resize_scale = resize_scale
+        self.detector_backend = detector_backend
+        self._detector = None
+        self.probe_profile = PROBE_PROFILE
+        self._profile_warned = None
+
+        self._lock = threading.RLock()
+        # serializes start-up in acquire() against tear-down; never taken by the watcher thread,
+        # so shutdown can join it without the publish path waiting on us
+        self._lifecycle_lock = threading.Lock()
+        self._refcount = 0
+        self._subscribers = []
+        self._gallery = Gallery.empty()
+        self._generation = 0
+        self._published = threading.Condition(self._lock)
+        self._ready = threading.Event()
+        self._shutdown_timer = None
+        self._warmup_thread = None
+        self._tile_pool = None
+        self._tile_inflight = set()     # tile jobs still running, shared across frames
+        self._warm = threading.Event()
+        self.warm_up_stats = None
+        self._watcher = GalleryWatcher(self._on_watcher_update, images_dir=images_dir,
+                                       dataset_dirs=dataset_dirs, resize_scale=resize_scale)
+
+    # ---------------- Reference counting ----------------
+    def acquire(self, callback=None):
+        """
+        Register a user of the service. The first user triggers the gallery load.
+        `callback(gallery)` is invoked (from a worker thread) whenever a new
+        gallery snapshot is published.
+        """
+        with self._lifecycle_lock:
+            with self._lock:
+                self._refcount += 1
+                if self._shutdown_timer is not None:
+                    self._shutdown_timer.cancel()
+                    self._shutdown_timer = None
+                if callback is not None and callback not in self._subscribers:
+                    self._subscribers.append(callback)
+                ready = self._ready.is_set()
+            self._watcher.start()
+        if callback is not None and ready:
+            self._notify_one(callback, self._gallery)
+        return self
+
+    def release(self, callback=None):
+        with self._lock:
+            if callback is not None and callback in self._subscribers:
+                self._subscribers.remove(callback)
+            if self._refcount == 0:
+                return
+            self._refcount -= 1
+            if self._refcount == 0 and self._shutdown_timer is None:
+                self._shutdown_timer = threading.Timer(IDLE_SHUTDOWN_SECONDS, self._idle_shutdown)
+                self._shutdown_timer.daemon = True
+                self._shutdown_timer.start()
+
+    @property
+    def refcount(self):
+        return self._refcount
+
+    def _idle_shutdown(self):
+        # the count is re-checked and the service torn down under the lifecycle lock,
+        # so an acquire() can't slip in between and be handed a service being shut down
+        with self._lifecycle_lock:
+            with self._lock:
+                self._shutdown_timer = None
+                if self._refcount > 0:
+                    return
+            self._shutdown()
+
+    def shutdown(self):
+        """Drop the gallery and stop background work. The next acquire() reloads."""
+        with self._lifecycle_lock:
+            self._shutdown()
+
+    def _shutdown(self):
+        self._watcher.stop()
+        # forget the per-file encodings too, so the next start re-encodes from scratch
+        self._watcher.request_reload(full=True)
+        with self._lock:
+            if self._tile_pool is not None:
+                self._tile_pool.shutdown(wait=False, cancel_futures=True)
+                self._tile_pool = None
+                self._tile_inflight = set()
+            if self._shutdown_timer is not None:
+                self._shutdown_timer.cancel()
+                self._shutdown_timer = None
+            self._gallery = Gallery.empty()
+            self._ready.clear()
+        print("[INFO] Recognition service shut down.")
+
+    # ---------------- Gallery ----------------
+    @property
+    def gallery(self):
+        """Current gallery snapshot (never mutated; safe to use without locking)."""
+        return self._gallery
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def last_reload_stats(self):
+        """Timings of the most recent gallery reload (see GalleryWatcher)."""
+        return self._watcher.last_stats
+
+    def reload(self, images_dir=None, wait=False, timeout=None):
+        """Re-encode every enrollment image in the background and publish the result."""
+        with self._lock:
+            if images_dir and images_dir != self.images_dir:
+                self.images_dir = images_dir
+                self._watcher.images_dir = images_dir
+            generation = self._generation
+        self._watcher.request_reload(full=True)
+        self._watcher.start()
+        if wait:
+            with self._published:
+                self._published.wait_for(lambda: self._generation > generation, timeout)
+
+    def _on_watcher_update(self, gallery, stats):
+        self.publish(gallery)
+
+    def publish(self, gallery):
+        """Atomically swap in a new gallery snapshot and notify subscribers."""
+        with self._lock:
+            self._gallery = gallery
+            self._generation += 1
+            self._ready.set()
+            self._published.notify_all()
+            subscribers = list(self._subscribers)
+        for cb in subscribers:
+            self._notify_one(cb, gallery)
+
+    @staticmethod
+    def _notify_one(callback, gallery):
+        try:
+            callback(gallery)
+        except Exception as e:
+            print(f"[WARN] gallery subscriber failed: {e}")
+
+    # ---------------- Model warm-up ----------------
+    def warm_up(self, preload_gallery=True):
+        """
+        Load the detector, landmark and encoder models and run a dummy inference
+        through each on a background thread. Safe to call more than once.
+        With preload_gallery the gallery load starts too (held for the idle period).
+        """
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self._warm_up_worker, daemon=True)
+                self._warmup_thread.start()
+        if preload_gallery:
+            self.acquire()
+            self.release()
+        return self._warmup_thread
+
+    def is_warm(self):
+        return self._warm.is_set()
+
+    def wait_warm(self, timeout=None):
+        return self._warm.wait(timeout)
+
+    def _warm_up_worker(self):
+        global face_recognition
+        stats = {}
+        t_start = time.perf_counter()
+        try:
+            t0 = time.perf_counter()
+            if face_recognition is None:
+                import face_recognition as _fr
+                face_recognition = _fr
+            stats["load_models_s"] = time.perf_counter() - t0
+
+            w, h = WARMUP_FRAME_SIZE
+            dummy = np.zeros((h, w, 3), dtype=np.uint8)
+            box = [(h // 4, w // 2 + h // 4, h - h // 4, w // 2 - h // 4)]
+
+            t0 = time.perf_counter()
+            self.detect(dummy)
+            stats["detector_s"] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            face_recognition.face_landmarks(dummy, box)
+            stats["landmarks_s"] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            self.encode(dummy, box)
+            stats["encoder_s"] = time.perf_counter() - t0
+        except Exception as e:
+            print(f"[WARN] model warm-up failed: {e}")
+            traceback.print_exc()
+            return
+        stats["total_s"] = time.perf_counter() - t_start
+        self.warm_up_stats = stats
+        self._warm.set()
+        print("[INFO] Model warm-up done in {total_s:.2f}s (load {load_models_s:.2f}s, detector {detector_s:.2f}s, "
+              "landmarks {landmarks_s:.2f}s, encoder {encoder_s:.2f}s)".format(**stats))
+
+    # ---------------- Detection / encoding ----------------
+    @property
+    def detector(self):
+        """The configured detector backend; falls back to dlib HOG if it can't be created."""
+        if self._detector is None:
+            with self._lock:
+                if self._detector is None:
+                    try:
+                        self._detector = face_detection.create_detector(self.detector_backend)
+                    except Exception as e:
+                        print(f"[WARN] detector '{self.detector_backend}' unavailable, using 'hog': {e}")
+                        self.detector_backend = "hog"
+                        self._detector = face_detection.create_detector("hog")
+        return self._detector
+
+    def detect(self, rgb):
+        """Face boxes as (top, right, bottom, left) tuples in `rgb` coordinates."""
+        return self.detector.detect(rgb)
+
+    def detect_tiled(self, rgb, budget_s=face_detection.TILE_TIME_BUDGET_S):
+        """
+        Tiled detection on a full-resolution frame (wide classroom cameras).
+        The worker processes are created on first use and owned by the service.
+        """
+        with self._lock:
+            if self._tile_pool is None:
+                self._tile_pool = face_detection.create_tile_pool(backend=self.detector.name)
+            pool, inflight = self._tile_pool, self._tile_inflight
+        boxes, stats = face_detection.detect_faces_tiled(rgb, pool, budget_s=budget_s, backend=self.detector.name,
+                                                         inflight=inflight)
+        if stats["tiles_late"]:
+            print(f"[WARN] tiled detection: {stats['tiles_late']}/{stats['tiles']} tile(s) over the "
+                  f"{budget_s:.2f}s budget were skipped")
+        return boxes
+
+    def encode(self, rgb, boxes):
+        return encode_faces(rgb, boxes, self.effective_probe_profile())
+
+    def effective_probe_profile(self, gallery=None):
+        """The probe profile, switched to one matching the gallery's landmark model if they differ."""
+        gallery = gallery or self._gallery
+        profile = compatible_probe_profile(self.probe_profile, gallery.profile)
+        if profile != self.probe_profile and self._profile_warned != gallery.profile:
+            self._profile_warned = gallery.profile
+            print(f"[WARN] probe profile '{self.probe_profile}' is incompatible with the gallery's "
+                  f"'{gallery.profile}' templates; encoding probes with '{profile}'")
+        return profile
+
+
+# ---------------- Process-wide singleton ----------------
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_recognition_service(images_dir=IMAGES_DIR, resize_scale=GALLERY_RESIZE_SCALE,
+                            detector_backend=face_detection.DETECTOR_BACKEND):
+    """Return the process-wide RecognitionService (created on first call)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RecognitionService(images_dir=images_dir, resize_scale=resize_scale,
+                                          detector_backend=detector_backend)
+        return _service
@@ -0,0 +1,226 @@
+"""
+runtime_policy.py
+
+Native thread-count and CPU-affinity policy for the recognition kiosk.
+
+OpenCV, dlib and the NumPy BLAS each start their own thread pool, sized to the
+number of cores, on top of the capture, processing and Tk threads. On a 4-core
+kiosk they fight over the same cores and the per-frame latency spikes. The
+policy caps them:
+ - cv2_threads:      cv2.setNumThreads (OpenCV's internal parallel_for pool)
+ - blas_threads:     OMP/OpenBLAS/MKL/... thread limits. These are read when NumPy
+                     loads, so apply_env_limits() must run before the first
+                     `import numpy`; later changes need threadpoolctl (optional).
+ - recognition_cpus: CPU ids the recognition (processing) thread is pinned to,
+                     None = no pinning. Linux pins the thread itself; elsewhere
+                     psutil (optional) pins the whole process.
+
+The policy comes from THREAD_POLICY, overridden by thread_policy.json when it
+exists. The benchmark sweeps the combinations on this host (each in a fresh
+subprocess, since BLAS limits can't change after import) and can save the best:
+
+    python runtime_policy.py --bench [--save]
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import itertools
+import subprocess
+
+# ---------- Configuration ----------
+POLICY_FILE = "thread_policy.json"
+THREAD_POLICY = {
+    "cv2_threads": 2,
+    "blas_threads": 1,
+    "recognition_cpus": None,
+}
+BLAS_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                 "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+BENCH_FRAMES = 30
+
+_applied = {}
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def load_policy():
+    """THREAD_POLICY with the saved benchmark recommendation (thread_policy.json) on top."""
+    policy = dict(THREAD_POLICY)
+    try:
+        with open(_here(POLICY_FILE), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        policy.update({k: v for k, v in saved.items() if k in THREAD_POLICY})
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[WARN] ignoring {POLICY_FILE}: {e}")
+    return policy
+
+
+def apply_env_limits(policy=None):
+    """Set the BLAS thread limits. Only effective before NumPy is imported (see threadpoolctl fallback)."""
+    policy = policy or load_policy()
+    n = policy.get("blas_threads")
+    if not n:
+        return
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(n))
+    if "numpy" in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+            _applied["blas_limiter"] = threadpool_limits(limits=int(n), user_api="blas")
+        except Exception:
+            if "blas_late" not in _applied:
+                _applied["blas_late"] = True
+                print("[WARN] numpy was imported before the thread policy; BLAS limit not applied "
+                      "(install threadpoolctl or import runtime_policy earlier).")
+    _applied["blas_threads"] = n
+
+
+def apply_native_limits(cv2=None, policy=None):
+    """cv2.setNumThreads from the policy (call once OpenCV is imported)."""
+    policy = policy or load_policy()
+    n = policy.get("cv2_threads")
+    if cv2 is not None and n is not None:
+        try:
+            cv2.setNumThreads(int(n))
+            _applied["cv2_threads"] = n
+        except Exception as e:
+            print(f"[WARN] cv2.setNumThreads failed: {e}")
+
+
+def apply_startup_policy(cv2=None):
+    """Everything that can be applied at import time; returns the effective policy."""
+    policy = load_policy()
+    apply_env_limits(policy)
+    apply_native_limits(cv2, policy)
+    return policy
+
+
+def pin_current_thread(cpus=None):
+    """
+    Pin the calling thread to `cpus` (default: policy recognition_cpus).
+    Returns True if pinned. Call it at the top of the worker thread's loop.
+    """
+    if cpus is None:
+        cpus = load_policy().get("recognition_cpus")
+    if not cpus:
+        return False
+    cpus = set(int(c) for c in cpus)
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            # Linux: a thread id targets just this thread
+            os.sched_setaffinity(threading.get_native_id(), cpus)
+            return True
+        import psutil
+        psutil.Process().cpu_affinity(sorted(cpus))
+        return True
+    except Exception as e:
+        print(f"[WARN] CPU affinity not applied: {e}")
+        return False
+
+
+def applied_policy():
+    return dict(_applied)
+
+
+# ---------------------- Benchmark ----------------------
+def _bench_child(cv2_threads, blas_threads, cpus):
+    """Runs in a fresh interpreter: apply the policy, then time the recognition pipeline under capture load."""
+    policy = {"cv2_threads": cv2_threads, "blas_threads": blas_threads, "recognition_cpus": cpus}
+    for var in BLAS_ENV_VARS:
+        os.environ[var] = str(blas_threads)     # the host's own settings must not mask the sweep
+    apply_env_limits(policy)
+    import numpy as np
+    import cv2
+    import face_recognition
+    apply_native_limits(cv2, policy)
+
+    frame = None
+    images = _here("images")
+    if os.path.isdir(images):
+        for name in sorted(os.listdir(images)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                frame = cv2.imread(os.path.join(images, name))
+                if frame is not None:
+                    break
+    frame = cv2.resize(frame, (1280, 720)) if frame is not None else np.zeros((720, 1280, 3), np.uint8)
+    gallery = np.random.default_rng(0).normal(0, 0.09, (2000, 128))
+
+    stop = threading.Event()
+
+    def capture_load():
+        # stands in for the capture thread: preview resize + colour conversion at ~30 fps
+        while not stop.is_set():
+            cv2.cvtColor(cv2.resize(frame, (640, 360)), cv2.COLOR_BGR2RGB)
+            time.sleep(0.033)
+
+    loader = threading.Thread(target=capture_load, daemon=True)
+    loader.start()
+    pin_current_thread(cpus)
+    times = []
+    for _ in range(BENCH_FRAMES):
+        t0 = time.perf_counter()
+        small = cv2.resize(frame, (0, 0), fx=0.35, fy=0.35)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        boxes = face_recognition.face_locations(rgb)
+        for enc in face_recognition.face_encodings(rgb, boxes):
+            np.linalg.norm(gallery - enc, axis=1).argmin()
+        times.append(time.perf_counter() - t0)
+    stop.set()
+    times.sort()
+    print(json.dumps({"p50_ms": 1000 * times[len(times) // 2],
+                      "p95_ms": 1000 * times[min(len(times) - 1, int(0.95 * len(times)))]}))
+
+
+def candidate_policies():
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, max(1, cores // 2), cores})
+    pin_sets = [None]
+    if cores >= 4 and hasattr(os, "sched_setaffinity"):
+        pin_sets.append(list(range(cores // 2, cores)))     # keep the low cores for capture / Tk
+    for cv2_n, blas_n, cpus in itertools.product(counts, counts, pin_sets):
+        yield {"cv2_threads": cv2_n, "blas_threads": blas_n, "recognition_cpus": cpus}
+
+
+def benchmark_policies(save=False):
+    """Sweep cv2/BLAS thread counts and pinning; print a table and return the best policy (lowest p95)."""
+    results = []
+    for policy in candidate_policies():
+        cmd = [sys.executable, os.path.abspath(__file__), "--bench-child", json.dumps(policy)]
+        try:
+            out = subprocess.run(cmd, capture_output=True, text=True, timeout=600, check=True).stdout
+            stats = json.loads(out.strip().splitlines()[-1])
+        except Exception as e:
+            print(f"  {policy}: failed ({e})")
+            continue
+        results.append((policy, stats))
+        print(f"  cv2={policy['cv2_threads']:<3} blas={policy['blas_threads']:<3} "
+              f"cpus={str(policy['recognition_cpus'] or 'any'):<14} "
+              f"p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms")
+    if not results:
+        return None
+    best, stats = min(results, key=lambda r: (r[1]["p95_ms"], r[1]["p50_ms"]))
+    print(f"Recommended: {best} (p95 {stats['p95_ms']:.1f} ms)")
+    if save:
+        with open(_here(POLICY_FILE), "w", encoding="utf-8") as f:
+            json.dump(best, f, indent=2)
+        print(f"Saved to {POLICY_FILE}; applied on the next start.")
+    return best
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "--bench-child":
+        p = json.loads(sys.argv[2])
+        _bench_child(p["cv2_threads"], p["blas_threads"], p["recognition_cpus"])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "--bench":
+        print(f"{os.cpu_count()} logical CPU(s), {BENCH_FRAMES} frames per setting")
+        benchmark_policies(save="--save" in sys.argv)
+    else:
+        print(f"policy: {load_policy()}")
+        print("usage: python runtime_policy.py --bench [--save]")
@@ -0,0 +1,95 @@
+import csv
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_aggregates import AttendanceAggregates, StudentAggregate, get_attendance_aggregates
+from attendance_db import ATTENDANCE_HEADER
+from attendance_repository import get_attendance_repository
+
+
+def _write(path, rows, mode="w"):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if mode == "w":
+            w.writerow(ATTENDANCE_HEADER)
+        for r in rows:
+            w.writerow(r)
+
+
+def _aggs(tmp_path):
+    return AttendanceAggregates(str(tmp_path / "Attendance.csv"), str(tmp_path / "attendance_aggregates.json"))
+
+
+def test_lookup_unions_username_full_name_substring_and_registration(tmp_path):
+    a = _aggs(tmp_path)
+    a._apply("9", "Someone", "ann", "2025-11-03", "09:00:00", "Present")
+    a._apply("8", "Someone", "ann.k", "2025-11-04", "09:00:00", "Present")
+    a._apply("7", "Ann", "", "2025-11-05", "09:00:00", "Present")
+    a._apply("1", "Other", "other", "2025-11-06", "09:00:00", "Present")
+    a._apply("5", "Someone", "joanna", "2025-11-07", "09:00:00", "Absent")
+    assert a.present_days("Ann") == 3
+    assert a.present_days("ann", "1") == 4
+    assert a.present_days("", "1") == 1
+    assert a.student("nobody") is None
+
+
+def test_rows_are_idempotent(tmp_path):
+    a = _aggs(tmp_path)
+    assert a._apply("1", "Ann", "ann", "2025-11-03", "09:00:00", "Present")
+    assert not a._apply("1", "Ann", "ann", "03/11/2025", "10:00:00", "present")
+    assert a._apply("1", "Ann", "ann", "garbage 10:00", "10:00:00", "Present")
+    assert not a._apply("1", "Ann", "ann", "garbage", "11:00:00", "Present")
+    assert a.present_days("ann") == 2
+
+
+def test_union_is_cached_until_a_change(tmp_path):
+    a = _aggs(tmp_path)
+    a._apply("1", "Ann", "ann", "2025-11-03", "09:00:00", "Present")
+    a._apply("1", "Ann", "ann.k", "2025-11-04", "09:00:00", "Present")
+    first = a.student("ann", "1")
+    assert a.student("ann", "1") is first
+    a._apply("1", "Ann", "ann", "2025-11-03", "12:00:00", "Present")       # already counted
+    assert a.student("ann", "1") is first
+    a._apply("2", "Bo", "xannx", "2025-11-05", "09:00:00", "Present")      # new substring match
+    assert a.student("ann", "1") is not first
+    assert a.present_days("ann", "1") == 3
+
+
+def test_streaks_skip_weekends():
+    s = StudentAggregate()
+    for d in (date(2025, 10, 30), date(2025, 10, 31), date(2025, 11, 3), date(2025, 11, 5)):
+        s.add(d)
+    assert (s.tail_streak, s.longest_streak) == (1, 3)
+    s.add(date(2025, 11, 4))                # back-dated row fills the gap
+    assert (s.tail_streak, s.longest_streak) == (5, 5)
+    assert s.current_streak(date(2025, 11, 6)) == 5
+    assert s.current_streak(date(2025, 11, 7)) == 0
+
+
+def test_saved_totals_are_reused_and_rebuilt_when_csv_changes(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-03", "09:00:00", "Present"]])
+    a = _aggs(tmp_path)
+    a.load()
+    assert a.rebuilds == 1 and a.present_days("ann") == 1
+    b = _aggs(tmp_path)
+    b.load()
+    assert b.rebuilds == 0 and b.present_days("ann") == 1
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-04", "09:00:00", "Present"],
+                      ["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    c = _aggs(tmp_path)
+    c.load()
+    assert c.rebuilds == 1 and c.present_days("ann") == 2
+
+
+def test_rows_appended_by_other_tools_arrive_on_refresh(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-03", "09:00:00", "Present"]])
+    aggs = get_attendance_aggregates(csv_path)
+    assert aggs.present_days("ann") == 1
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-04", "09:00:00", "Present"]], mode="a")
+    get_attendance_repository(csv_path).refresh()
+    assert aggs.present_days("ann") == 2
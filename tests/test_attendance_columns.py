@@ -0,0 +1,116 @@
+import csv
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+import attendance_columns
+from attendance_columns import AttendanceColumns, get_attendance_columns
+from attendance_db import ATTENDANCE_HEADER
+from attendance_repository import AttendanceRecord, AttendanceTable
+
+
+def _records(n=3000, seed=3):
+    rnd = random.Random(seed)
+    day0 = date(2025, 9, 1)
+    out = []
+    for _ in range(n):
+        s = rnd.randrange(60)
+        user = "" if s == 0 else f"Student{s}"
+        d = None if rnd.random() < 0.02 else day0 + timedelta(days=rnd.randrange(90))
+        present = rnd.random() < 0.8
+        out.append(AttendanceRecord(f"R{s:03d}", f"Student {s}", user, user.lower(), ("CSE", "ECE", "ME")[s % 3],
+                                    d, d.isoformat() if d else "garbage", "09:00:00",
+                                    "Present" if present else "Absent", present))
+    return out
+
+
+def _py_per_day(records, start=None, end=None):
+    per = {}
+    for r in records:
+        if r.present and r.date and r.username_norm and (not start or r.date >= start) and (not end or r.date <= end):
+            per.setdefault(r.date, set()).add(r.username_norm)
+    return {d: len(u) for d, u in per.items()}
+
+
+def _py_per_user(records):
+    per = {}
+    for r in records:
+        if r.present and r.date and r.username_norm:
+            per.setdefault(r.username_norm, set()).add(r.date)
+    return {u: len(d) for u, d in per.items()}
+
+
+@pytest.mark.parametrize("dense", [True, False])
+def test_group_bys_match_record_loops(monkeypatch, dense):
+    if not dense:
+        monkeypatch.setattr(attendance_columns, "DENSE_GRID_LIMIT", 0)
+    records = _records()
+    cols = AttendanceColumns(records)
+    assert dict(zip(*cols.present_per_day())) == _py_per_day(records)
+    start, end = date(2025, 10, 1), date(2025, 10, 15)
+    assert dict(zip(*cols.present_per_day(start, end))) == _py_per_day(records, start, end)
+    assert cols.present_days_per_user() == _py_per_user(records)
+
+
+def test_present_per_department():
+    records = _records()
+    day = date(2025, 10, 3)
+    want = {}
+    for r in records:
+        if r.present and r.date == day and r.username_norm:
+            want.setdefault(r.department, set()).add(r.username_norm)
+    assert AttendanceColumns(records).present_per_department(day) == {k: len(v) for k, v in want.items()}
+
+
+def test_status_bits_survive_growing_in_odd_chunks():
+    records = _records(2500)
+    cols = AttendanceColumns()
+    i = 0
+    for k in (1, 7, 13, 1000, 3, 1476):
+        cols.extend(records[i:i + k])
+        i += k
+    assert len(cols) == 2500
+    assert cols.present.tolist() == [r.present for r in records]
+    assert cols.column("day")[records.index(next(r for r in records if r.date is None))] == attendance_columns.NO_DAY
+
+
+def test_mask_and_search_match_the_table():
+    records = _records()
+    cols = AttendanceColumns(records)
+    table = AttendanceTable(records)
+    cols.table = table
+    m = cols.mask(username="STUDENT7", start=date(2025, 10, 1), end=date(2025, 10, 31), present=True)
+    assert [records[i] for i in np.flatnonzero(m)] == [
+        r for r in records if r.username_norm == "student7" and r.present and r.date and
+        date(2025, 10, 1) <= r.date <= date(2025, 10, 31)]
+    assert not cols.mask(username="nobody").any()
+    for name_q, reg_q in (("dent1", ""), ("", "r00"), ("ENT 5", "R04"), ("", "")):
+        assert cols.records(cols.search(name_q, reg_q)) == table.search(name_q, reg_q)
+
+
+def test_get_attendance_columns_follows_the_repository(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+
+    def write(rows, mode="w"):
+        with open(csv_path, mode, encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            if mode == "w":
+                w.writerow(ATTENDANCE_HEADER)
+            w.writerows(rows)
+
+    write([["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    cols = get_attendance_columns(csv_path)
+    assert len(cols) == 1
+    write([["2", "Bo", "bo", "ECE", "2025-11-05", "09:00:00", "Present"]], mode="a")
+    assert get_attendance_columns(csv_path) is cols and len(cols) == 2
+    assert cols.present_per_department(date(2025, 11, 5)) == {"CSE": 1, "ECE": 1}
+    write([["3", "Cy", "cy", "ME", "2025-11-06", "09:00:00", "Absent"]])
+    rebuilt = get_attendance_columns(csv_path)
+    assert rebuilt is not cols and len(rebuilt) == 1 and rebuilt.present.tolist() == [False]
@@ -0,0 +1,117 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_db import ATTENDANCE_HEADER, AttendanceDB
+
+
+def _write(path, rows, mode="w"):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if mode == "w":
+            w.writerow(ATTENDANCE_HEADER)
+        for r in rows:
+            w.writerow(r)
+
+
+def _row(reg, user, day, status="Present"):
+    return [reg, user.title(), user, "CSE", day, "09:00:00", status]
+
+
+def _bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+
+def _db(tmp_path):
+    return AttendanceDB(str(tmp_path / "attendance.db"))
+
+
+def test_unique_index_dedups_same_day(tmp_path):
+    db = _db(tmp_path)
+    assert db.insert("1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00")
+    assert not db.insert("1", "Ann", "ann", "CSE", "2025-11-05", "10:00:00")
+    assert not db.insert("1", "Ann", "ANN ", "CSE", "05/11/2025", "10:00:00")
+    assert db.insert("1", "Ann", "ann", "CSE", "2025-11-06", "09:00:00")
+    assert db.count_rows() == 2
+    assert db.is_present("2025-11-05", registration="1")
+    assert db.is_present("2025-11-05", username="Ann")
+    assert not db.is_present("2025-11-07", "1", "ann")
+
+
+def test_import_skips_duplicates_and_undated(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2025-11-05"), _row("1", "ann", "2025-11-05"), _row("2", "bob", "garbage")])
+    imported, skipped = _db(tmp_path).import_csv(csv_path)
+    assert (imported, skipped) == (1, 2)
+
+
+def test_present_dates_match_username_substring_full_name_and_registration(tmp_path):
+    db = _db(tmp_path)
+    db.insert("9", "Someone", "ann", "CSE", "2025-11-03", "09:00:00")
+    db.insert("8", "Someone", "ann.k_2", "CSE", "2025-11-04", "09:00:00")
+    db.insert("7", "Ann", "", "CSE", "2025-11-05", "09:00:00")
+    db.insert("1", "Other", "other", "CSE", "2025-11-06", "09:00:00")
+    db.insert("5", "Someone", "joanna", "CSE", "2025-11-07", "09:00:00", "Absent")
+    db.insert("6", "Someone", "bob", "CSE", "2025-11-08", "09:00:00")
+    assert db.present_dates_for("Ann", "1") == {"2025-11-03", "2025-11-04", "2025-11-05", "2025-11-06"}
+    assert db.present_dates_for("", "6") == {"2025-11-08"}
+    assert db.present_dates_for("a_n", None) == set()      # a literal substring, not a LIKE pattern
+
+
+def test_sync_imports_appended_rows(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2025-11-05")])
+    db = _db(tmp_path)
+    assert db.sync_csv(csv_path)
+    assert not db.sync_csv(csv_path)
+    _write(csv_path, [_row("2", "bob", "2025-11-05")], mode="a")
+    assert db.sync_csv(csv_path)
+    assert db.count_rows() == 2
+
+
+def test_sync_rebuilds_after_same_size_rewrite(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2025-11-05", "Present"), _row("2", "bob", "2025-11-05", "Present")])
+    db = _db(tmp_path)
+    db.sync_csv(csv_path)
+    _write(csv_path, [_row("1", "ann", "2025-11-05", "Present"), _row("2", "bob", "2025-11-05", "Absent!")])
+    _bump_mtime(csv_path)
+    db.sync_csv(csv_path)
+    assert db.present_usernames_on("2025-11-05") == {"ann"}
+
+
+def test_sync_rebuilds_after_larger_rewrite(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2025-11-05"), _row("2", "bob", "2025-11-05")])
+    db = _db(tmp_path)
+    db.sync_csv(csv_path)
+    # bob's row replaced by two others: the file grows, but it is not an append
+    _write(csv_path, [_row("1", "ann", "2025-11-05"), _row("3", "cy", "2025-11-05"), _row("4", "dee", "2025-11-06")])
+    db.sync_csv(csv_path)
+    assert db.distinct_usernames() == {"ann", "cy", "dee"}
+    assert db.count_rows() == 3
+
+
+def test_sync_rebuilds_after_reorder(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    rows = [_row("1", "ann", "2025-11-05"), _row("2", "bob", "2025-11-06")]
+    _write(csv_path, rows)
+    db = _db(tmp_path)
+    db.sync_csv(csv_path)
+    _write(csv_path, rows[::-1])
+    _bump_mtime(csv_path)
+    db.sync_csv(csv_path)
+    assert [r[2] for r in db.all_rows()] == ["bob", "ann"]
+
+
+def test_sync_rebuilds_after_shrink(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2025-11-05"), _row("2", "bob", "2025-11-05")])
+    db = _db(tmp_path)
+    db.sync_csv(csv_path)
+    _write(csv_path, [_row("2", "bob", "2025-11-05")])
+    db.sync_csv(csv_path)
+    assert db.distinct_usernames() == {"bob"}
@@ -0,0 +1,166 @@
+import csv
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_db import ATTENDANCE_HEADER
+from attendance_repository import AttendanceRepository, parse_attendance_csv, records_from_rows
+
+
+def _write(path, rows, mode="w", header=ATTENDANCE_HEADER):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if mode == "w":
+            w.writerow(header)
+        w.writerows(rows)
+
+
+def _row(reg, user, day, status="Present", time="09:00:00"):
+    return [reg, user.title(), user, "CSE", day, time, status]
+
+
+def _repo(tmp_path, rows):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, rows)
+    return AttendanceRepository(csv_path), csv_path
+
+
+def test_records_are_parsed_once_with_typed_fields(tmp_path):
+    _write(str(tmp_path / "a.csv"), [["1", "Ann Lee", "Ann ", "CSE", "2025-11-05 09:30:00", "", "present"],
+                                     ["2", "Bo", "bo", "ECE", "garbage", "10:00:00", "Absent"]])
+    ann, bo = parse_attendance_csv(str(tmp_path / "a.csv"))
+    assert (ann.username_norm, ann.date, ann.date_text, ann.time, ann.present) == \
+        ("ann", date(2025, 11, 5), "2025-11-05", "09:30:00", True)
+    assert (bo.date, bo.date_text, bo.present) == (None, "garbage", False)
+    assert parse_attendance_csv(str(tmp_path / "missing.csv")) == []
+
+
+def test_header_variants_resolve_to_the_same_fields(tmp_path):
+    path = str(tmp_path / "a.csv")
+    _write(path, [["ann", "Ann", "7", "2025-11-05", "Present"]],
+           header=["username", "Full Name", "Student ID", "date", "status"])
+    (rec,) = parse_attendance_csv(path)
+    assert (rec.username, rec.full_name, rec.registration, rec.date, rec.present) == \
+        ("ann", "Ann", "7", date(2025, 11, 5), True)
+
+
+def test_records_from_rows_uses_the_attendance_header():
+    (rec,) = records_from_rows([("1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", None)])
+    assert (rec.registration, rec.date, rec.status, rec.present) == ("1", date(2025, 11, 5), "", False)
+
+
+def test_table_queries(tmp_path):
+    repo, _ = _repo(tmp_path, [_row("1", "ann", "2025-11-05"), _row("1", "ann", "2025-11-05", "Absent", "10:00:00"),
+                               _row("2", "bob", "2025-11-05", "Absent"), _row("1", "ann", "2025-11-06", "Absent"),
+                               _row("3", "cyann", "2025-12-01")])
+    t = repo.snapshot()
+    assert len(t) == 5 and t.usernames() == {"ann", "bob", "cyann"}
+    assert [r.time for r in t.for_user("ANN")] == ["09:00:00", "10:00:00", "09:00:00"]
+    assert t.present_usernames_on(date(2025, 11, 5)) == {"ann"}
+    assert t.timeseries("ann") == {date(2025, 11, 5): 1, date(2025, 11, 6): 0}
+    assert t.present_days_in_month("ann", 2025, 11) == {5}
+    assert [r.username for r in t.last(2)] == ["cyann", "ann"]
+    assert {r.username for r in t.search("ann", "")} == {"ann", "cyann"}
+    assert [r.username for r in t.search("", "2")] == ["bob"]
+    assert t.search("", "") == []
+
+
+def test_snapshots_are_immutable_and_share_a_lineage_until_a_rewrite(tmp_path):
+    repo, csv_path = _repo(tmp_path, [_row("1", "ann", "2025-11-05")])
+    first = repo.snapshot()
+    _write(csv_path, [_row("2", "bob", "2025-11-05")], mode="a")
+    second = repo.snapshot()
+    assert second is not first and second.lineage is first.lineage
+    assert len(first) == 1 and len(second) == 2
+    assert first.for_user("bob") == [] and len(second.for_user("bob")) == 1
+    assert repo.snapshot() is second
+    _write(csv_path, [_row("3", "cy", "2025-11-06")])
+    third = repo.snapshot()
+    assert third.lineage is not first.lineage and [r.username for r in third.records] == ["cy"]
+
+
+def _bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+
+def _subscribed(repo):
+    events = []
+    repo.subscribe(lambda records, reloaded: events.append(([r.username for r in records], reloaded)))
+    return events
+
+
+def test_appended_rows_are_tail_read_and_pushed(tmp_path):
+    repo, csv_path = _repo(tmp_path, [_row("1", "ann", "2025-11-05")])
+    events = _subscribed(repo)
+    repo.refresh()
+    assert events == [(["ann"], True)]
+    assert repo.refresh() == []
+    _write(csv_path, [_row("2", "bob", "2025-11-05"), _row("3", "cy", "2025-11-05")], mode="a")
+    assert [r.username for r in repo.refresh()] == ["bob", "cy"]
+    assert events[-1] == (["bob", "cy"], False)
+    assert (repo.parses, repo.tail_reads) == (1, 1)
+
+
+def test_half_written_line_waits_for_its_newline(tmp_path):
+    repo, csv_path = _repo(tmp_path, [_row("1", "ann", "2025-11-05")])
+    repo.refresh()
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write('2,"Bo ')
+    assert repo.refresh() == []
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write('B",bob,CSE,2025-11-05,09:00:00,Present\r\n')
+    (rec,) = repo.refresh()
+    assert (rec.full_name, rec.present) == ("Bo B", True)
+    assert repo.parses == 1
+
+
+def test_last_row_without_trailing_newline(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(ATTENDANCE_HEADER) + "\n1,Ann,ann,CSE,2025-11-05,09:00:00,Present")
+    repo = AttendanceRepository(csv_path)
+    assert [r.username for r in repo.snapshot().records] == ["ann"]
+    # the next writer adds the missing line break before its row
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write("\n2,Bo,bob,CSE,2025-11-05,09:00:00,Present\n")
+    assert [r.username for r in repo.refresh()] == ["bob"]
+    assert (repo.parses, len(repo.snapshot())) == (1, 2)
+
+
+def test_continued_last_row_is_a_rewrite(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(ATTENDANCE_HEADER) + "\n1,Ann,ann,CSE,2025-11-05,09:00:00,Present")
+    repo = AttendanceRepository(csv_path)
+    repo.refresh()
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write("ly\n")
+    repo.refresh()
+    assert repo.parses == 2 and repo.snapshot().records[0].status == "Presently"
+
+
+def test_rewrites_are_detected(tmp_path):
+    repo, csv_path = _repo(tmp_path, [_row("1", "ann", "2025-11-05"), _row("2", "bob", "2025-11-05")])
+    events = _subscribed(repo)
+    repo.refresh()
+    # same size, different bytes
+    _write(csv_path, [_row("1", "ann", "2025-11-06"), _row("2", "bob", "2025-11-05")])
+    _bump_mtime(csv_path)
+    repo.refresh()
+    assert events[-1] == (["ann", "bob"], True)
+    assert repo.snapshot().records[0].date == date(2025, 11, 6)
+    # grown, but the last row we had parsed changed
+    _write(csv_path, [_row("1", "ann", "2025-11-06"), _row("2", "bo", "2025-11-05"), _row("3", "cy", "2025-11-07")])
+    repo.refresh()
+    assert events[-1] == (["ann", "bo", "cy"], True)
+    # shrunk
+    _write(csv_path, [_row("3", "cy", "2025-11-07")])
+    repo.refresh()
+    assert events[-1] == (["cy"], True) and repo.parses == 4
+    # removed
+    os.remove(csv_path)
+    assert repo.refresh() == [] and len(repo.snapshot()) == 0
+    assert events[-1] == ([], True)
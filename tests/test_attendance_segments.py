@@ -0,0 +1,133 @@
+import csv
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attendance_segments
+import attendance_writer
+from attendance_db import ATTENDANCE_HEADER
+from attendance_segments import SegmentStore
+
+
+def _write(path, rows, mode="w"):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if mode == "w":
+            w.writerow(ATTENDANCE_HEADER)
+        for r in rows:
+            w.writerow(r)
+
+
+def _row(reg, user, day, status="Present"):
+    return [reg, user.title(), user, "CSE", day, "09:00:00", status]
+
+
+def _store(tmp_path, rows=None):
+    csv_path = str(tmp_path / "Attendance.csv")
+    if rows is not None:
+        _write(csv_path, rows)
+    return SegmentStore(str(tmp_path / "attendance_segments"), csv_path), csv_path
+
+
+def _bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+
+def test_migration_partitions_legacy_csv_by_day(tmp_path):
+    store, _ = _store(tmp_path, [_row("1", "ann", "2025-10-01"), _row("2", "bob", "02/10/2025"),
+                                 _row("3", "cy", "2025-10-02"), _row("4", "dee", "not a date")])
+    m = store.manifest()
+    assert sorted(m["segments"]) == ["2025-10-01", "2025-10-02", "undated"]
+    assert m["segments"]["2025-10-02"]["rows"] == 2
+    assert store.count_rows() == 4
+    assert [r[2] for r in store.rows_on("2025-10-02")] == ["bob", "cy"]
+    assert store.rows_on("2025-10-02")[0][4] == "2025-10-02"
+
+
+def test_append_writes_segment_and_mirrors_csv(tmp_path):
+    store, csv_path = _store(tmp_path, [_row("1", "ann", "2025-10-01")])
+    store.append(_row("2", "bob", "2025-10-03"))
+    assert [r[2] for r in store.rows_on("2025-10-03")] == ["bob"]
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        assert [r[2] for r in csv.reader(f)][1:] == ["ann", "bob"]
+    # the mirrored line is not imported a second time
+    assert SegmentStore(store.root, csv_path).count_rows() == 2
+
+
+def test_rows_appended_to_csv_by_other_tools_are_imported(tmp_path):
+    store, csv_path = _store(tmp_path, [_row("1", "ann", "2025-10-01")])
+    assert store.count_rows() == 1
+    _write(csv_path, [_row("2", "bob", "2025-10-01")], mode="a")
+    assert [r[2] for r in store.rows_on("2025-10-01")] == ["ann", "bob"]
+
+
+def test_rewritten_csv_is_repartitioned(tmp_path):
+    store, csv_path = _store(tmp_path, [_row("1", "ann", "2025-10-01"), _row("2", "bob", "2025-10-02")])
+    assert store.count_rows() == 2
+    # same length, different content
+    _write(csv_path, [_row("1", "ann", "2025-10-03"), _row("2", "bob", "2025-10-04")])
+    _bump_mtime(csv_path)
+    assert store.rows_on("2025-10-01") == []
+    assert sorted(store.manifest()["segments"]) == ["2025-10-03", "2025-10-04"]
+    # shrink
+    _write(csv_path, [_row("1", "ann", "2025-10-05")])
+    assert store.count_rows() == 1
+    assert sorted(store.manifest()["segments"]) == ["2025-10-05"]
+
+
+def test_compaction_merges_finished_months(tmp_path):
+    store, _ = _store(tmp_path, [_row("1", "ann", "2025-10-01"), _row("2", "bob", "2025-10-15"),
+                                 _row("3", "cy", "2025-11-02")])
+    assert store.compact(before="2025-11-10") == ["2025-10"]
+    m = store.manifest()
+    assert sorted(m["segments"]) == ["2025-10", "2025-11-02"]
+    assert m["segments"]["2025-10"] == {"rows": 2, "first": "2025-10-01", "last": "2025-10-15"}
+    assert not os.path.exists(os.path.join(store.root, "2025-10-01.csv"))
+    # a late row for a compacted month goes to the month file
+    store.append(_row("4", "dee", "2025-10-20"))
+    assert sorted(store.manifest()["segments"]) == ["2025-10", "2025-11-02"]
+    assert [r[2] for r in store.rows_between("2025-10-10", "2025-10-31")] == ["bob", "dee"]
+    assert store.count_rows() == 4
+
+
+def test_today_query_opens_one_segment(tmp_path, monkeypatch):
+    today = date.today().isoformat()
+    store, _ = _store(tmp_path, [_row("1", "ann", "2024-01-05"), _row("2", "bob", "2024-02-05"),
+                                 _row("3", "cy", today), _row("4", "dee", "2024-03-05", "Absent")])
+    store.count_rows()
+    opened = []
+    real_open = open
+
+    def spy(path, *args, **kwargs):
+        if os.path.dirname(os.path.abspath(str(path))) == store.root:
+            opened.append(os.path.basename(str(path)))
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(attendance_segments, "open", spy, raising=False)
+    assert store.present_usernames_on() == {"cy"}
+    assert opened == [today + ".csv"]
+
+
+def test_present_days_in_month_reads_the_month_range(tmp_path):
+    store, _ = _store(tmp_path, [_row("1", "ann", "2025-10-01"), _row("1", "ann", "2025-10-09", "Absent"),
+                                 _row("1", "ann", "2025-10-31"), _row("1", "ann", "2025-11-01"),
+                                 _row("2", "bob", "2025-10-02")])
+    assert store.present_days_in_month("ANN", 2025, 10) == {1, 31}
+    assert store.present_days_in_month("ann", 2025, 12) == set()
+
+
+def test_kpi_rollup_reads_today_from_segments(tmp_path, monkeypatch):
+    import kpi_rollup
+
+    today = date.today().isoformat()
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [_row("1", "ann", "2024-01-05"), _row("2", "bob", today)])
+    monkeypatch.setattr(attendance_writer, "ATTENDANCE_BACKEND", "segments")
+    store = attendance_segments.get_segment_store(csv_path, compactor=False)
+    store.append(_row("3", "cy", today))
+    snap = kpi_rollup.KpiRollup(os.path.abspath(csv_path), str(tmp_path / "students.json")).snapshot(
+        total_students_override=5)
+    assert (snap.total_records, snap.present_today, snap.absent_today) == (3, 2, 3)
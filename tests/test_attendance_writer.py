@@ -0,0 +1,73 @@
+import concurrent.futures
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attendance_writer
+from attendance_writer import ATTENDANCE_HEADER, get_attendance_writer, mark_present
+
+
+def _rows(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_mark_present_writes_header_and_skips_same_day_duplicates(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    assert mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00") == "marked"
+    assert mark_present(csv_path, "1", "Ann", "other", "CSE", "2025-11-05", "10:00:00") == "already"
+    assert mark_present(csv_path, "", "Ann", "ann", "CSE", "2025-11-05", "10:00:00") == "already"
+    assert mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-06", "09:00:00") == "marked"
+    rows = _rows(csv_path)
+    assert rows[0] == ATTENDANCE_HEADER
+    assert [r[4] for r in rows[1:]] == ["2025-11-05", "2025-11-06"]
+
+
+def test_listeners_see_each_written_row(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    seen = []
+
+    def listener(path, row):
+        seen.append((path, row))
+
+    attendance_writer.add_write_listener(listener)
+    try:
+        mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00")
+        mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:30:00")
+    finally:
+        attendance_writer.remove_write_listener(listener)
+    assert seen == [(csv_path, ["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"])]
+
+
+def test_concurrent_marks_through_the_writer_record_one_row(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    writer = get_attendance_writer()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as callers:
+        futures = list(callers.map(
+            lambda i: writer.submit(mark_present, csv_path, "7", "Bo", "bo", "CSE", "2025-11-05", f"09:00:{i:02d}"),
+            range(20)))
+    results = [f.result(timeout=5) for f in futures]
+    assert results.count("marked") == 1 and results.count("already") == 19
+    assert len(_rows(csv_path)) == 2
+
+
+def test_rows_appended_by_another_tool_count_as_present(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00")
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerow(["2", "Bo", "bo", "CSE", "2025-11-05", "09:05:00", "Present"])
+    assert mark_present(csv_path, "2", "Bo", "bo", "CSE", "2025-11-05", "09:10:00") == "already"
+
+
+def test_sqlite_backend_keeps_the_csv_and_database_in_step(tmp_path, monkeypatch):
+    from attendance_db import get_attendance_db
+
+    monkeypatch.setattr(attendance_writer, "ATTENDANCE_BACKEND", "sqlite")
+    csv_path = str(tmp_path / "Attendance.csv")
+    assert mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00") == "marked"
+    assert mark_present(csv_path, "1", "Ann", "ann", "CSE", "2025-11-05", "09:10:00") == "already"
+    db = get_attendance_db(csv_path=csv_path)
+    assert db.count_rows() == 1 and len(_rows(csv_path)) == 2
+    assert os.path.exists(tmp_path / "attendance.db")
@@ -0,0 +1,68 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+np = pytest.importorskip("numpy")
+
+import batch_recognize
+from face_gallery import ENCODING_SIZE, Gallery, is_enrollment_image
+
+
+def _encodings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 0.1, size=(n, ENCODING_SIZE))
+
+
+def _build(encs, storage):
+    return Gallery.build(((f"s{i}", str(i), "CSE", e) for i, e in enumerate(encs)), storage=storage)
+
+
+def test_gallery_rows_dequantizes_int8():
+    encs = _encodings(40)
+    int8 = _build(encs, "int8")
+    assert int8.storage == "int8"
+    rows = batch_recognize.gallery_rows(int8)
+    assert rows.dtype == np.float64 and rows.shape == encs.shape
+    # the raw codes are in [-127, 127]; the rows handed to workers must be back on the encoding scale
+    assert np.abs(rows - encs).max() < 0.01
+
+
+def test_worker_gallery_from_int8_matches_like_float():
+    encs = _encodings(40, seed=1)
+    float_gallery = _build(encs, "float64")
+    rows = batch_recognize.gallery_rows(_build(encs, "int8"))
+    # what _init_worker builds from the rows it is given
+    worker = Gallery.build(((n, "", "", e) for n, e in zip(float_gallery.names, rows)), storage="int8")
+    probes = encs + np.random.default_rng(2).normal(0.0, 0.01, size=encs.shape)
+    for probe, name in zip(probes, float_gallery.names):
+        got, dist = worker.match(probe, tolerance=0.45)
+        want, want_dist = float_gallery.match(probe, tolerance=0.45)
+        assert got == want == name
+        assert abs(dist - want_dist) < 0.02
+
+
+def test_batch_against_int8_gallery(tmp_path):
+    pytest.importorskip("cv2")
+    pytest.importorskip("face_recognition")
+    images_dir = os.path.join(ROOT, "images")
+    photos = sorted(f for f in os.listdir(images_dir) if is_enrollment_image(f)) if os.path.isdir(images_dir) else []
+    if not photos:
+        pytest.skip("no enrollment photos in images/")
+    enroll = tmp_path / "enroll"
+    enroll.mkdir()
+    shutil.copy(os.path.join(images_dir, photos[0]), enroll / photos[0])
+    from face_gallery import load_gallery
+    encoded = load_gallery(str(enroll), dataset_dirs=())
+    if not len(encoded):
+        pytest.skip(f"no face found in {photos[0]}")
+    gallery = Gallery.build(((n, *encoded.info[n], e) for n, e in zip(encoded.names, encoded.encodings)),
+                            storage="int8")
+    rows, stats = batch_recognize.recognize_session(str(enroll), workers=1, gallery=gallery)
+    assert stats["faces"] >= 1
+    assert [r["FullName"] for r in rows] == [encoded.names[0].title()]
+    assert rows[0]["Confidence"] > 0.9
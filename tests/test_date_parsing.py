@@ -0,0 +1,86 @@
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import date_parsing
+from attendance_repository import RowParser
+from date_parsing import ColumnDateParser, iso_date, parse_date, parse_datetime
+
+
+def test_padded_iso():
+    assert parse_date("2025-11-05") == date(2025, 11, 5)
+    assert parse_datetime("2025-11-05 09:30:15") == datetime(2025, 11, 5, 9, 30, 15)
+    assert parse_datetime("2025-11-05T09:30") == datetime(2025, 11, 5, 9, 30)
+
+
+def test_non_padded_iso():
+    assert parse_date("2025-1-5") == date(2025, 1, 5)
+    assert parse_date("2025-11-5") == date(2025, 11, 5)
+    assert parse_date("2025-1-15") == date(2025, 1, 15)
+    assert parse_datetime("2025-1-5 10:00:00") == datetime(2025, 1, 5, 10, 0, 0)
+    assert iso_date("2025-1-5") == "2025-01-05"
+
+
+def test_ambiguous_slash_dates_are_day_first():
+    # ViewAttendancePage used to read these month-first; every page now reads them day-first
+    assert parse_date("05/01/2025") == date(2025, 1, 5)
+    assert parse_date("05-01-2025") == date(2025, 1, 5)
+
+
+def test_unambiguous_month_first_slash_date():
+    assert parse_date("12/25/2025") == date(2025, 12, 25)
+
+
+def test_column_settles_slash_order():
+    month_first = ["%02d/%02d/2025" % (m, d) for m in (1, 3, 5) for d in range(13, 31)]
+    col = ColumnDateParser()
+    for v in month_first[:date_parsing.DETECT_SAMPLE]:
+        col.parse(v)
+    assert col.format == "%m/%d/%Y"
+    assert col.parse("05/01/2025") == date(2025, 5, 1)
+
+
+def test_ambiguous_value_among_the_sample_rows():
+    month_first = ["05/01/2025"] + ["%02d/%02d/2025" % (m, d) for m in (1, 3, 5) for d in range(13, 31)]
+    # fed one at a time: the early reading is dropped once the column is settled
+    col = ColumnDateParser()
+    assert col.parse(month_first[0]) == date(2025, 1, 5)
+    for v in month_first[1:date_parsing.DETECT_SAMPLE]:
+        col.parse(v)
+    assert col.format == "%m/%d/%Y"
+    assert col.parse(month_first[0]) == date(2025, 5, 1)
+    # a batch is settled before its first row is read
+    rows = [["1", "Ann", "ann", "CSE", v, "09:00:00", "Present"] for v in month_first]
+    records = RowParser(["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"]).parse(rows)
+    assert records[0].date == date(2025, 5, 1)
+    assert records[1].date == date(2025, 1, 13)
+
+
+def test_short_column_is_settled_at_end_of_input():
+    col = ColumnDateParser()
+    for v in ("05/01/2025", "12/25/2025"):
+        col.parse(v)
+    assert col.format is None
+    col.finish()
+    assert col.format == "%m/%d/%Y"
+    assert col.parse("05/01/2025") == date(2025, 5, 1)
+
+    rows = [["1", "Ann", "ann", "CSE", v, "09:00:00", "Present"] for v in ("05/01/2025", "12/25/2025")]
+    records = RowParser(["Registration No", "FullName", "Username", "Department", "Date", "Time", "Status"]).parse(rows)
+    assert [r.date for r in records] == [date(2025, 5, 1), date(2025, 12, 25)]
+    # no values: nothing to decide from yet
+    col = ColumnDateParser()
+    col.detect(["", None])
+    assert col.format is None and col.parse("05/01/2025") == date(2025, 1, 5)
+
+
+def test_non_dates():
+    for v in ("", None, "Present", "12", "2025-13-45"):
+        assert parse_date(v) is None
+
+
+def test_date_and_datetime_values():
+    assert parse_date(date(2025, 1, 5)) == date(2025, 1, 5)
+    assert parse_datetime(datetime(2025, 1, 5, 8, 0)) == datetime(2025, 1, 5, 8, 0)
@@ -0,0 +1,95 @@
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_detection
+from face_detection import budget_scale, non_max_suppression, plan_tiles
+
+
+def _covered(tiles, width, height):
+    return all(any(x0 <= x < x1 and y0 <= y < y1 for x0, y0, x1, y1 in tiles)
+               for x in range(0, width, 37) for y in range(0, height, 37))
+
+
+def test_plan_tiles_cover_the_frame_with_overlap():
+    tiles = plan_tiles(3840, 2160, tile_size=960, overlap=160)
+    assert _covered(tiles, 3840, 2160)
+    assert all(x1 - x0 == 960 and y1 - y0 == 960 for x0, y0, x1, y1 in tiles)
+    xs = sorted({x0 for x0, _, _, _ in tiles})
+    assert xs[-1] == 3840 - 960
+    assert all(b - a <= 960 - 160 for a, b in zip(xs, xs[1:]))
+
+
+def test_plan_tiles_small_frame_is_one_tile():
+    assert plan_tiles(640, 480, tile_size=960, overlap=160) == [(0, 0, 640, 480)]
+    tiles = plan_tiles(1000, 480, tile_size=960, overlap=160)
+    assert tiles == [(0, 0, 960, 480), (40, 0, 1000, 480)]
+
+
+def test_budget_scale():
+    tiles = plan_tiles(3840, 2160)
+    assert budget_scale(3840, 2160, tiles, workers=4, budget_s=1000) == 1.0
+    s = budget_scale(3840, 2160, tiles, workers=1, budget_s=0.6)
+    assert 0.25 <= s < 1.0
+    assert budget_scale(3840, 2160, tiles, workers=1, budget_s=1e-6) == 0.25
+
+
+def test_nms_keeps_the_larger_of_overlapping_boxes():
+    whole = (100, 200, 200, 100)
+    cut = (100, 180, 200, 110)          # the same face clipped by a seam
+    other = (400, 500, 500, 400)
+    assert sorted(non_max_suppression([cut, whole, other])) == sorted([whole, other])
+
+
+def test_tiled_detection_maps_boxes_and_bounds_inflight_jobs(monkeypatch):
+    np = pytest.importorskip("numpy")
+    lock = threading.Lock()
+    running = [0, 0]                    # current, max
+
+    def fake_tile(job):
+        tile, x0, y0, scale, upsample, backend = job
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return [(y0 + 10, x0 + 60, y0 + 60, x0 + 10)]
+
+    monkeypatch.setattr(face_detection, "_detect_tile", fake_tile)
+    rgb = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        boxes, stats = face_detection.detect_faces_tiled(rgb, pool, budget_s=5.0, workers=2)
+    tiles = plan_tiles(1920, 1080)
+    assert stats["tiles"] == len(tiles) and stats["tiles_late"] == 0
+    assert sorted(boxes) == sorted((y0 + 10, x0 + 60, y0 + 60, x0 + 10) for x0, y0, _, _ in tiles)
+    assert running[1] <= 2
+
+
+def test_tiles_past_the_budget_are_dropped(monkeypatch):
+    np = pytest.importorskip("numpy")
+    release = threading.Event()
+
+    def slow_tile(job):
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(face_detection, "_detect_tile", slow_tile)
+    rgb = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    inflight = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        try:
+            boxes, stats = face_detection.detect_faces_tiled(rgb, pool, budget_s=0.05, workers=2, inflight=inflight)
+            assert boxes == [] and stats["tiles_late"] == stats["tiles"]
+            assert len(inflight) == 2
+            # the next frame finds both workers busy and submits nothing
+            _, stats = face_detection.detect_faces_tiled(rgb, pool, budget_s=0.05, workers=2, inflight=inflight)
+            assert len(inflight) == 2 and stats["tiles_late"] == stats["tiles"]
+        finally:
+            release.set()
@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gallery_watcher
+from face_gallery import ENCODING_SIZE
+from gallery_watcher import GalleryWatcher
+
+
+def _fake_encode(path, resize_scale, is_crop, profile):
+    with open(path, "rb") as f:
+        return [float(len(f.read()))] * ENCODING_SIZE
+
+
+def _watcher(tmp_path, monkeypatch, encode=_fake_encode, interval=0.05):
+    monkeypatch.setattr(gallery_watcher, "encode_image_file", encode)
+    updates = []
+    w = GalleryWatcher(lambda g, s: updates.append((g, s)), images_dir=str(tmp_path / "images"),
+                       dataset_dirs=(), interval=interval)
+    return w, updates
+
+
+def _image(tmp_path, name, data=b"x"):
+    (tmp_path / "images").mkdir(exist_ok=True)
+    (tmp_path / "images" / name).write_bytes(data)
+
+
+def test_sync_publishes_only_changes(tmp_path, monkeypatch):
+    w, updates = _watcher(tmp_path, monkeypatch)
+    _image(tmp_path, "ANN_1_CSE.jpg")
+    _image(tmp_path, "BOB_2_ECE.png")
+    _image(tmp_path, "notes.txt")
+    assert w.sync()
+    gallery, stats = updates[-1]
+    assert sorted(gallery.names) == ["ANN", "BOB"]
+    assert gallery.info["BOB"] == ("2", "ECE")
+    assert (stats["added"], stats["changed"], stats["removed"], stats["lag_s"]) == (2, 0, 0, None)
+    assert not w.sync()
+    assert len(updates) == 1
+
+    _image(tmp_path, "ANN_1_CSE.jpg", b"xyz")
+    os.remove(tmp_path / "images" / "BOB_2_ECE.png")
+    _image(tmp_path, "CY_3_CSE.jpg")
+    assert w.sync()
+    gallery, stats = updates[-1]
+    assert (stats["added"], stats["changed"], stats["removed"]) == (1, 1, 1)
+    assert sorted(gallery.names) == ["ANN", "CY"]
+    assert stats["lag_s"] is not None
+
+
+def test_failed_encodes_are_kept_until_the_file_changes(tmp_path, monkeypatch):
+    calls = []
+
+    def encode(path, *args):
+        calls.append(os.path.basename(path))
+        return None if path.endswith("BAD_9_X.jpg") else _fake_encode(path, *args)
+
+    w, updates = _watcher(tmp_path, monkeypatch, encode)
+    _image(tmp_path, "ANN_1_CSE.jpg")
+    _image(tmp_path, "BAD_9_X.jpg")
+    assert w.sync()
+    assert updates[-1][0].names == ["ANN"]
+    assert not w.sync()
+    assert sorted(calls) == ["ANN_1_CSE.jpg", "BAD_9_X.jpg"]
+
+
+def test_stop_during_encode_publishes_nothing(tmp_path, monkeypatch):
+    stop = threading.Event()
+
+    def encode(path, *args):
+        stop.set()
+        return _fake_encode(path, *args)
+
+    w, updates = _watcher(tmp_path, monkeypatch, encode)
+    _image(tmp_path, "ANN_1_CSE.jpg")
+    _image(tmp_path, "BOB_2_ECE.jpg")
+    assert not w.sync(stop)
+    assert updates == [] and w.last_stats is None
+
+
+def test_restart_after_stop(tmp_path, monkeypatch):
+    w, updates = _watcher(tmp_path, monkeypatch)
+    published = threading.Event()
+    w.on_update = lambda g, s: (updates.append((g, s)), published.set())
+    _image(tmp_path, "ANN_1_CSE.jpg")
+    w.start()
+    assert published.wait(5) and w.is_running()
+    w.stop()
+    assert not w.is_running()
+
+    published.clear()
+    _image(tmp_path, "BOB_2_ECE.jpg")
+    w.start()
+    try:
+        assert published.wait(5) and w.is_running()
+        assert sorted(updates[-1][0].names) == ["ANN", "BOB"]
+    finally:
+        w.stop()
+    assert not w.is_running()
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kpi_rollup
+from attendance_db import ATTENDANCE_HEADER
+from attendance_writer import mark_present
+from kpi_rollup import get_kpi_rollup, read_roster
+
+
+def _setup(tmp_path, rows, students=None):
+    csv_path = str(tmp_path / "Attendance.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(ATTENDANCE_HEADER)
+        w.writerows(rows)
+    students_json = str(tmp_path / "students.json")
+    if students is not None:
+        with open(students_json, "w", encoding="utf-8") as f:
+            json.dump(students, f)
+    return csv_path, students_json
+
+
+def _row(reg, user, day, status="Present"):
+    return [reg, user.title(), user, "CSE", day, "09:00:00", status]
+
+
+def test_read_roster_shapes(tmp_path):
+    path = str(tmp_path / "students.json")
+    for data, want in (({"ann": {"username": "Ann"}, "bob": {}}, (2, {"ann", "bob"})),
+                       ([{"username": "Ann"}, {"Username": "bo"}, "junk"], (3, {"ann", "bo"})),
+                       ("nope", (0, set()))):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        assert read_roster(path) == want
+    assert read_roster(str(tmp_path / "missing.json")) == (0, set())
+
+
+def test_snapshot_counts_and_moves_with_writes(tmp_path):
+    today = date.today().isoformat()
+    csv_path, students_json = _setup(
+        tmp_path, [_row("1", "ann", "2024-01-05"), _row("1", "ann", today), _row("2", "bob", today, "Absent")],
+        {"ann": {"username": "ann"}, "bob": {"username": "bob"}, "cy": {"username": "cy"}, "dee": {"username": "dee"}})
+    rollup = get_kpi_rollup(csv_path, students_json)
+    snap = rollup.snapshot()
+    assert (snap.total_students, snap.total_records, snap.present_today, snap.absent_today) == (4, 3, 1, 3)
+    assert rollup.snapshot().version == snap.version
+
+    assert mark_present(csv_path, "3", "Cy", "cy", "CSE", today, "09:10:00") == "marked"
+    after = rollup.snapshot()
+    assert (after.total_records, after.present_today, after.absent_today) == (4, 2, 2)
+    assert after.version != snap.version
+    assert after.present_pct == 0.5
+
+    # rows appended by another tool are picked up on the next snapshot
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerow(_row("4", "dee", today))
+    assert rollup.snapshot().present_today == 3
+
+
+def test_absent_today_falls_back_without_a_roster(tmp_path):
+    today = date.today().isoformat()
+    csv_path, students_json = _setup(tmp_path, [_row("1", "ann", today), _row("2", "bob", "2024-01-05")])
+    rollup = kpi_rollup.KpiRollup(os.path.abspath(csv_path), students_json)
+    rollup._reset_from(rollup._repo.snapshot())
+    assert rollup.snapshot().absent_today == 1                      # everyone seen in the CSV
+    assert rollup.snapshot(default_total_students=10).absent_today == 9
+    assert rollup.snapshot(total_students_override=3).absent_today == 2
+
+
+def test_roster_changes_are_picked_up(tmp_path):
+    csv_path, students_json = _setup(tmp_path, [], {"ann": {"username": "ann"}})
+    rollup = get_kpi_rollup(csv_path, students_json)
+    first = rollup.snapshot()
+    assert first.total_students == 1
+    with open(students_json, "w", encoding="utf-8") as f:
+        json.dump({"ann": {"username": "ann"}, "bob": {"username": "bob"}, "cyril": {"username": "cyril"}}, f)
+    second = rollup.snapshot()
+    assert second.total_students == 3 and second.version != first.version
+
+
+def test_present_today_rolls_over_at_midnight(tmp_path, monkeypatch):
+    today = date.today()
+    csv_path, students_json = _setup(tmp_path, [_row("1", "ann", today.isoformat()),
+                                                _row("2", "bob", (today + timedelta(days=1)).isoformat())])
+    rollup = get_kpi_rollup(csv_path, students_json)
+    assert rollup.snapshot(total_students_override=2).present_today == 1
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return today + timedelta(days=1)
+
+    monkeypatch.setattr(kpi_rollup, "date", Tomorrow)
+    snap = rollup.snapshot(total_students_override=2)
+    assert snap.present_today == 1 and snap.total_records == 2
+    assert rollup._present == {"bob"}
@@ -0,0 +1,83 @@
+import csv
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attendance_aggregates import AttendanceAggregates
+from attendance_db import ATTENDANCE_HEADER
+from presence_bitmaps import PresenceBitmaps
+
+
+def _write(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(ATTENDANCE_HEADER)
+        w.writerows(rows)
+
+
+def _bitmaps(tmp_path, rows):
+    bm = PresenceBitmaps(str(tmp_path / "Attendance.csv"), str(tmp_path / "presence_bitmaps.json"))
+    for reg, full, user, day, present in rows:
+        bm._apply(reg, full, user, day, present)
+    return bm
+
+
+# Mon 2025-11-03 .. Fri 2025-11-07, then Mon 2025-11-10
+def test_streak_spans_weekends(tmp_path):
+    days = [date(2025, 10, 30), date(2025, 10, 31), date(2025, 11, 3), date(2025, 11, 4)]
+    bm = _bitmaps(tmp_path, [("1", "Ann", "ann", d, True) for d in days])
+    assert bm.current_streak("ann", today=date(2025, 11, 4)) == 4
+    assert bm.longest_streak("ann") == 4
+
+
+def test_unmarked_today_does_not_break_the_streak(tmp_path):
+    bm = _bitmaps(tmp_path, [("1", "Ann", "ann", date(2025, 11, 3), True), ("1", "Ann", "ann", date(2025, 11, 4), True)])
+    assert bm.current_streak("ann", today=date(2025, 11, 5)) == 2
+    # a class day missed before today does
+    assert bm.current_streak("ann", today=date(2025, 11, 6)) == 0
+
+
+def test_absent_today_breaks_the_streak(tmp_path):
+    bm = _bitmaps(tmp_path, [("1", "Ann", "ann", date(2025, 11, 3), True), ("1", "Ann", "ann", date(2025, 11, 4), True),
+                             ("1", "Ann", "ann", date(2025, 11, 5), False)])
+    assert bm.current_streak("ann", today=date(2025, 11, 5)) == 0
+    assert bm.longest_streak("ann") == 2
+
+
+def test_streaks_use_the_same_keys_as_the_count(tmp_path):
+    rows = [("7", "Ann", "ann", date(2025, 11, 3), True),
+            ("7", "Ann", "", date(2025, 11, 4), True),              # matched by full name
+            ("7", "Someone", "ann.k", date(2025, 11, 5), True),     # matched by username substring
+            ("7", "Someone", "zed", date(2025, 11, 6), True)]       # matched by registration only
+    bm = _bitmaps(tmp_path, rows)
+    aggs = AttendanceAggregates(bm.csv_path, str(tmp_path / "attendance_aggregates.json"))
+    for reg, full, user, day, present in rows:
+        aggs._apply(reg, full, user, day.isoformat(), "09:00:00", "Present" if present else "Absent")
+    assert aggs.present_days("ann") == 3
+    assert bm.longest_streak("ann") == 3
+    assert aggs.present_days("ann", "7") == 4
+    assert bm.current_streak("ann", "7", today=date(2025, 11, 6)) == 4
+    assert bm.longest_streak("ann", "7") == aggs.student("ann", "7").longest_streak
+
+
+def test_month_bits_and_series_rebase_on_older_rows(tmp_path):
+    bm = _bitmaps(tmp_path, [("1", "Ann", "ann", date(2025, 11, 5), True), ("1", "Ann", "ann", date(2025, 11, 7), False)])
+    bm._apply("1", "Ann", "ann", date(2025, 10, 31), True)
+    assert bm.origin == date(2025, 10, 31)
+    assert bm.present_days_in_month("ann", 2025, 11) == {5}
+    assert bm.present_days_in_month("ann", 2025, 10) == {31}
+    assert bm.series("ann") == ([date(2025, 10, 31), date(2025, 11, 5), date(2025, 11, 7)], [1, 1, 0])
+    assert bm.present_days_in_month("nobody", 2025, 11) == set()
+
+
+def test_saved_bitmaps_are_reused_while_the_csv_is_unchanged(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-03", "09:00:00", "Present"]])
+    a = PresenceBitmaps(csv_path, str(tmp_path / "presence_bitmaps.json"))
+    a.load()
+    b = PresenceBitmaps(csv_path, str(tmp_path / "presence_bitmaps.json"))
+    b.load()
+    assert (a.rebuilds, b.rebuilds) == (1, 0)
+    assert b.bitmap("ann") == a.bitmap("ann") == (1, 1)
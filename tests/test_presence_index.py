@@ -0,0 +1,59 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from presence_index import PresenceIndex
+
+
+def _write(path, rows, mode="w", header=("Registration No", "FullName", "Username", "Department", "Date", "Time", "Status")):
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        if mode == "w":
+            w.writerow(header)
+        w.writerows(rows)
+
+
+def test_matches_registration_or_username(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"],
+                      ["", "Bo", "bo", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    idx = PresenceIndex(csv_path)
+    assert idx.is_present("2025-11-05", "1", "someone")
+    assert idx.is_present("2025-11-05", "", "ann")
+    assert idx.is_present("2025-11-05", "9", "bo")
+    assert not idx.is_present("2025-11-06", "1", "ann")
+    assert not idx.is_present("2025-11-05", "", "")
+    assert len(idx) == 3
+
+
+def test_registration_column_variants(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["42", "2025-11-05"]], header=("StudentID", "Date"))
+    assert PresenceIndex(csv_path).is_present("2025-11-05", "42")
+
+
+def test_own_appends_do_not_rebuild(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    idx = PresenceIndex(csv_path)
+    assert not idx.is_present("2025-11-06", "1")
+    for day in ("2025-11-06", "2025-11-07"):
+        _write(csv_path, [["1", "Ann", "ann", "CSE", day, "09:00:00", "Present"]], mode="a")
+        idx.record(day, "1", "ann")
+    assert idx.is_present("2025-11-07", "1")
+    assert idx.reloads == 1
+
+
+def test_external_change_rebuilds(tmp_path):
+    csv_path = str(tmp_path / "Attendance.csv")
+    _write(csv_path, [["1", "Ann", "ann", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    idx = PresenceIndex(csv_path)
+    assert idx.is_present("2025-11-05", "1")
+    _write(csv_path, [["2", "Bo", "bo", "CSE", "2025-11-05", "09:00:00", "Present"]])
+    assert not idx.is_present("2025-11-05", "1")
+    assert idx.is_present("2025-11-05", "2")
+    assert idx.reloads == 2
+    os.remove(csv_path)
+    assert not idx.is_present("2025-11-05", "2")
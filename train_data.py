@@ -2,11 +2,14 @@ import os
 import face_recognition
 import pickle
 import cv2
+from face_gallery import encode_faces, TEMPLATE_PROFILE
 
-def train_data(images_path="images", output_file="train.pkl"):
+def train_data(images_path="images", output_file="train.pkl", profile=TEMPLATE_PROFILE):
     """
     Trains face encodings from images in a folder and saves them to a pickle file.
     Each image filename should be the person's name (e.g., AHANA ROY.jpg).
+    `profile` is the encoding profile (see face_gallery.ENCODING_PROFILES); it is
+    stored in the pickle so probes can be encoded compatibly.
     """
     known_encodings = []
     known_names = []
@@ -35,7 +38,7 @@ def train_data(images_path="images", output_file="train.pkl"):
 
             # Detect face locations and encodings
             boxes = face_recognition.face_locations(rgb)
-            encodings = face_recognition.face_encodings(rgb, boxes)
+            encodings = encode_faces(rgb, boxes, profile)
 
             if len(encodings) > 0:
                 known_encodings.append(encodings[0])
@@ -50,7 +53,7 @@ def train_data(images_path="images", output_file="train.pkl"):
     # Save the encodings and names to a pickle file
     if known_encodings:
         with open(output_file, "wb") as f:
-            pickle.dump({"encodings": known_encodings, "names": known_names}, f)
+            pickle.dump({"encodings": known_encodings, "names": known_names, "profile": profile}, f)
         print(f"\n💾 Training complete! Encodings saved to '{output_file}'.")
     else:
         print("\n⚠️ No valid faces were encoded. Please check your images.")
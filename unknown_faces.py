@@ -0,0 +1,368 @@
+"""
+unknown_faces.py
+
+Capture and offline clustering of faces the kiosk could not match.
+
+When UNKNOWN_CAPTURE is on in attendance.py, every encoding that fails
+FR_TOLERANCE is appended to a bounded on-disk ring buffer (unknown_faces/):
+ - encodings.f32  (capacity, 128) float32 memmap, one slot per captured face
+ - meta.f64       (capacity, 2) float64 memmap: capture time, best gallery distance
+ - crops/<slot>.jpg optional face thumbnail so staff can see who it was
+ - state.json     capacity and the total number of faces ever written (saved at most
+                  every STATE_SAVE_INTERVAL_S from the capture path, and on flush())
+Face number n (counting from 0) lives in slot n % capacity; once full, the
+oldest slot is overwritten. The same face standing in front of
+the camera is captured at most once per UNKNOWN_CAPTURE_INTERVAL_S.
+
+The clustering job groups the buffered encodings by identity (leader clustering
+on Euclidean distance, NumPy only) and ranks the clusters by how often they were
+seen. It is incremental: cluster centroids and counts are kept in clusters.npz
+and each run only assigns the faces captured since the previous run.
+
+Each cluster is reported with its nearest enrolled student:
+ - close to an enrolled student -> that student's template is probably bad
+ - far from everyone           -> probably an unenrolled student
+
+    python unknown_faces.py            # cluster new captures and print the ranking
+    python unknown_faces.py --rebuild  # forget the saved clusters and start over
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+from face_gallery import ENCODING_SIZE
+
+# ---------- Configuration ----------
+UNKNOWN_DIR = "unknown_faces"
+UNKNOWN_CAPACITY = 5000              # ring buffer slots (~2.5 MB of encodings)
+UNKNOWN_CAPTURE_INTERVAL_S = 1.0     # min seconds between captures of the same face
+UNKNOWN_SAME_FACE_DISTANCE = 0.35    # "same face" for the capture throttle
+UNKNOWN_SAVE_CROPS = True
+CROP_SIZE = 96
+CLUSTER_RADIUS = 0.45                # a face joins a cluster whose centroid is closer than this
+CLUSTER_MERGE_DISTANCE = 0.3         # centroids closer than this are merged after each run
+CLUSTER_SAMPLES = 5                  # newest faces kept per cluster for the report / crop preview
+STATE_SAVE_INTERVAL_S = 5.0          # state.json is rewritten at most this often while capturing
+BAD_TEMPLATE_DISTANCE = 0.6          # nearest enrolled student within this -> suspect template
+
+
+def _here(*parts):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *parts)
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class UnknownFaceBuffer:
+    """Bounded on-disk ring buffer of unmatched encodings. add() is thread-safe and cheap (one 512-byte slot)."""
+
+    def __init__(self, directory=None, capacity=UNKNOWN_CAPACITY, save_crops=UNKNOWN_SAVE_CROPS):
+        self.directory = directory or _here(UNKNOWN_DIR)
+        self.save_crops = save_crops and cv2 is not None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "crops"), exist_ok=True)
+
+        state = self._read_state()
+        self.capacity = int(state.get("capacity") or capacity)
+        self.written = int(state.get("written") or 0)
+        mode = "r+" if os.path.exists(self._path("encodings.f32")) else "w+"
+        self._enc = np.memmap(self._path("encodings.f32"), dtype=np.float32, mode=mode,
+                              shape=(self.capacity, ENCODING_SIZE))
+        self._meta = np.memmap(self._path("meta.f64"), dtype=np.float64, mode=mode, shape=(self.capacity, 2))
+        self._recent = []      # [(time, encoding)] for the capture throttle
+        self._state_saved_at = 0.0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_state(self):
+        try:
+            with open(self._path("state.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def add(self, encoding, best_distance=None, rgb=None, box=None):
+        """
+        Store one unmatched encoding. `rgb`/`box` (top, right, bottom, left) are used for the
+        thumbnail. Returns False when the same face was captured less than
+        UNKNOWN_CAPTURE_INTERVAL_S ago.
+        """
+        enc = np.asarray(encoding, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            self._recent = [(t, e) for t, e in self._recent if now - t < UNKNOWN_CAPTURE_INTERVAL_S]
+            if self._recent:
+                near = np.linalg.norm(np.stack([e for _, e in self._recent]) - enc, axis=1)
+                if float(near.min()) < UNKNOWN_SAME_FACE_DISTANCE:
+                    return False
+            self._recent.append((now, enc))
+
+            slot = self.written % self.capacity
+            self._enc[slot] = enc
+            self._meta[slot] = (now, best_distance if best_distance is not None else np.nan)
+            self.written += 1
+            if now - self._state_saved_at >= STATE_SAVE_INTERVAL_S:
+                self._save_state(now)
+        if self.save_crops and rgb is not None and box is not None:
+            self._save_crop(slot, rgb, box)
+        return True
+
+    def _save_crop(self, slot, rgb, box):
+        try:
+            top, right, bottom, left = box
+            crop = rgb[max(0, top):bottom, max(0, left):right]
+            if crop.size:
+                crop = cv2.resize(crop, (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+                cv2.imwrite(os.path.join(self.directory, "crops", f"{slot}.jpg"),
+                            cv2.cvtColor(crop, cv2.COLOR_RGB2BGR))
+        except Exception as e:
+            print(f"[WARN] unknown face crop not saved: {e}")
+
+    def _save_state(self, now=None):
+        _write_json_atomic(self._path("state.json"), {"capacity": self.capacity, "written": self.written})
+        self._state_saved_at = now or time.time()
+
+    def flush(self):
+        with self._lock:
+            self._enc.flush()
+            self._meta.flush()
+            self._save_state()
+
+    def holds(self, seq):
+        """True if face number `seq` is still in the ring (not yet overwritten)."""
+        return self.written - self.capacity <= seq < self.written
+
+    def crop_path(self, seq):
+        return os.path.join(self.directory, "crops", f"{seq % self.capacity}.jpg")
+
+    def read_since(self, written_before):
+        """
+        Faces written after the `written_before` counter still held in the ring.
+        Returns (seqs, encodings, meta, lost): face numbers (slot = seq % capacity) and
+        `lost`, the faces overwritten before they were read.
+        """
+        with self._lock:
+            self._enc.flush()
+            self._meta.flush()
+            end = self.written
+        start = max(written_before, end - self.capacity)
+        seqs = np.arange(start, end)
+        slots = seqs % self.capacity
+        return seqs, np.array(self._enc[slots]), np.array(self._meta[slots]), max(0, start - written_before)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_unknown_buffer():
+    """Process-wide UnknownFaceBuffer (created on first call)."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = UnknownFaceBuffer()
+        return _buffer
+
+
+# ---------------------- Incremental clustering ----------------------
+class FaceClusters:
+    """
+    Leader clustering with running-mean centroids.
+    Arrays: centroids (K, 128) float64, counts (K,), first/last seen (K,), samples (K, CLUSTER_SAMPLES)
+    face numbers (the buffer's `written` sequence, -1 = empty; newest kept).
+    """
+
+    def __init__(self):
+        self.centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0, dtype=np.float64)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.samples = np.full((0, CLUSTER_SAMPLES), -1, dtype=np.int64)
+        self.consumed = 0      # buffer `written` counter already clustered
+
+    # ---- persistence ----
+    @classmethod
+    def load(cls, path):
+        c = cls()
+        if os.path.exists(path):
+            with np.load(path) as z:
+                c.centroids, c.counts = z["centroids"], z["counts"]
+                c.first_seen, c.last_seen, c.samples = z["first_seen"], z["last_seen"], z["samples"]
+                c.consumed = int(z["consumed"])
+                if "sample_seqs" not in z.files:
+                    c.samples = np.full_like(c.samples, -1)     # older files stored ring slots, not face numbers
+        return c
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, counts=self.counts, first_seen=self.first_seen,
+                 last_seen=self.last_seen, samples=self.samples, consumed=np.int64(self.consumed),
+                 sample_seqs=np.int8(1))
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # ---- clustering ----
+    def _new_cluster(self, enc, ts, seq):
+        self.centroids = np.vstack([self.centroids, enc[None, :]])
+        self.counts = np.append(self.counts, 1)
+        self.first_seen = np.append(self.first_seen, ts)
+        self.last_seen = np.append(self.last_seen, ts)
+        row = np.full((1, CLUSTER_SAMPLES), -1, dtype=np.int64)
+        row[0, 0] = seq
+        self.samples = np.vstack([self.samples, row])
+
+    def _absorb(self, labels, encs, ts, seqs):
+        """Fold points into existing clusters `labels` (vectorized running mean)."""
+        k = len(self.counts)
+        add_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels, encs)
+        total = self.counts + add_counts
+        hit = add_counts > 0
+        self.centroids[hit] = (self.centroids[hit] * self.counts[hit, None] + sums[hit]) / total[hit, None]
+        self.counts = total
+        np.maximum.at(self.last_seen, labels, ts)
+        first = np.full(k, np.inf)
+        np.minimum.at(first, labels, ts)
+        self.first_seen = np.minimum(self.first_seen, first)
+        for lab, seq in zip(labels, seqs):
+            row = self.samples[lab]
+            oldest = int(row.argmin())          # an empty (-1) entry first, else the oldest face
+            if seq > row[oldest]:
+                row[oldest] = seq
+
+    def add(self, encs, meta, seqs, radius=CLUSTER_RADIUS):
+        """Assign a batch: everything near an existing centroid in one vectorized step, the rest as new leaders."""
+        if len(encs) == 0:
+            return
+        encs = encs.astype(np.float64)
+        ts = meta[:, 0]
+        if len(self.counts):
+            d = np.sqrt(np.maximum(
+                (encs * encs).sum(1)[:, None] - 2.0 * encs @ self.centroids.T
+                + (self.centroids * self.centroids).sum(1)[None, :], 0.0))
+            nearest = d.argmin(axis=1)
+            near = d[np.arange(len(encs)), nearest] < radius
+            if near.any():
+                self._absorb(nearest[near], encs[near], ts[near], seqs[near])
+            rest = np.flatnonzero(~near)
+        else:
+            rest = np.arange(len(encs))
+        # leftovers are few (new identities); each either seeds a cluster or joins one seeded in this batch
+        base = len(self.counts)
+        for i in rest:
+            if len(self.counts) > base:
+                dd = np.linalg.norm(self.centroids[base:] - encs[i], axis=1)
+                j = int(dd.argmin())
+                if dd[j] < radius:
+                    self._absorb(np.array([base + j]), encs[i:i + 1], ts[i:i + 1], seqs[i:i + 1])
+                    continue
+            self._new_cluster(encs[i], ts[i], seqs[i])
+
+    def merge(self, distance=CLUSTER_MERGE_DISTANCE):
+        """Merge clusters whose centroids drifted together (largest cluster keeps its index)."""
+        order = np.argsort(-self.counts)
+        keep = np.ones(len(self.counts), dtype=bool)
+        for a in order:
+            if not keep[a]:
+                continue
+            d = np.linalg.norm(self.centroids - self.centroids[a], axis=1)
+            dup = np.flatnonzero(keep & (d < distance))
+            dup = dup[dup != a]
+            if not len(dup):
+                continue
+            members = np.append(dup, a)
+            w = self.counts[members].astype(np.float64)
+            self.centroids[a] = (self.centroids[members] * w[:, None]).sum(0) / w.sum()
+            self.counts[a] = int(w.sum())
+            self.first_seen[a] = self.first_seen[members].min()
+            self.last_seen[a] = self.last_seen[members].max()
+            pooled = sorted((s for s in self.samples[members].ravel() if s >= 0), reverse=True)[:CLUSTER_SAMPLES]
+            self.samples[a] = -1
+            self.samples[a, :len(pooled)] = pooled
+            keep[dup] = False
+        self.centroids, self.counts = self.centroids[keep], self.counts[keep]
+        self.first_seen, self.last_seen, self.samples = self.first_seen[keep], self.last_seen[keep], self.samples[keep]
+
+    def ranked(self):
+        """Cluster indices, most frequent first."""
+        return np.argsort(-self.counts, kind="stable")
+
+
+def cluster_unknown_faces(buffer=None, rebuild=False):
+    """Cluster faces captured since the last run and persist the result. Returns (clusters, new_faces, lost)."""
+    buffer = buffer or UnknownFaceBuffer()
+    path = os.path.join(buffer.directory, "clusters.npz")
+    clusters = FaceClusters() if rebuild else FaceClusters.load(path)
+    seqs, encs, meta, lost = buffer.read_since(clusters.consumed)
+    clusters.add(encs, meta, seqs)
+    clusters.merge()
+    clusters.consumed = buffer.written
+    clusters.save(path)
+    return clusters, len(encs), lost
+
+
+def report_clusters(clusters, buffer, gallery=None, top=20, min_count=2):
+    """
+    Print the clusters by frequency with their nearest enrolled student. Sample crops
+    are listed only for faces still in `buffer` (an overwritten slot shows someone else).
+    """
+    print(f"{'#':>3} {'faces':>6} {'first seen':>17} {'last seen':>17}  nearest enrolled            verdict")
+    for rank, idx in enumerate(clusters.ranked()[:top], 1):
+        if clusters.counts[idx] < min_count:
+            break
+        nearest, dist = "-", None
+        if gallery is not None and len(gallery):
+            d = gallery.distances(clusters.centroids[idx])
+            j = int(np.argmin(d))
+            nearest, dist = gallery.names[j], float(d[j])
+        if dist is not None and dist < BAD_TEMPLATE_DISTANCE:
+            verdict = f"check template ({dist:.2f})"
+        else:
+            verdict = "unenrolled?"
+        fmt = "%Y-%m-%d %H:%M"
+        print(f"{rank:3d} {clusters.counts[idx]:6d} {time.strftime(fmt, time.localtime(clusters.first_seen[idx])):>17} "
+              f"{time.strftime(fmt, time.localtime(clusters.last_seen[idx])):>17}  {nearest[:26]:26}  {verdict}")
+        crops = [os.path.relpath(buffer.crop_path(s), buffer.directory)
+                 for s in sorted(clusters.samples[idx], reverse=True) if s >= 0 and buffer.holds(s)]
+        if crops:
+            print(f"      samples: {', '.join(crops)}")
+
+
+if __name__ == "__main__":
+    if np is None:
+        print("numpy is required.")
+        sys.exit(1)
+    buf = UnknownFaceBuffer()
+    clusters, new, lost = cluster_unknown_faces(buf, rebuild="--rebuild" in sys.argv)
+    print(f"{len(buf)} face(s) buffered, {new} new since last run"
+          + (f" ({lost} overwritten before clustering)" if lost else "") + f", {len(clusters)} cluster(s)")
+    try:
+        from face_gallery import load_gallery
+        gallery = load_gallery()
+    except Exception:
+        gallery = None
+    report_clusters(clusters, buf, gallery)
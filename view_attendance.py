@@ -6,7 +6,7 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox, filedialog
 import calendar
-from datetime import datetime, date
+from datetime import date
 import pandas as pd
 import os
 import threading
@@ -17,6 +17,13 @@ from reportlab.lib.styles import getSampleStyleSheet
 import json
 import time
 
+from attendance_repository import get_attendance_repository, records_from_rows
+from attendance_db import active_attendance_db
+from attendance_segments import active_segment_store
+from attendance_columns import get_attendance_columns
+from presence_bitmaps import get_presence_bitmaps
+from date_parsing import parse_datetime
+
 ATTENDANCE_CSV = "Attendance.csv"
 _BATCH_SIZE = 100
 PROFILES_JSON = "profiles.json"
@@ -181,226 +188,54 @@ class ViewAttendancePage:
         self.frame.after(50, self._insert_batch_ui)
 
     def _read_csv_prepare_rows(self):
-        # Robust CSV -> normalize headers -> enrich from profiles.json
+        # shared parsed snapshot (attendance_repository) -> this user's rows, enriched from profiles.json
         if not os.path.exists(ATTENDANCE_CSV):
             self.frame.after(0, lambda: self.status_label.configure(text="⚠️ No attendance records found."))
             self._loading = False
             return
 
         try:
-            df = pd.read_csv(ATTENDANCE_CSV, on_bad_lines='skip', dtype=str)
+            table = get_attendance_repository(ATTENDANCE_CSV).snapshot()
         except Exception as e:
             self.frame.after(0, lambda: messagebox.showerror("Error", f"Failed to read attendance file:\n{e}"))
             self.frame.after(0, lambda: self.status_label.configure(text=""))
             self._loading = False
             return
 
-        if df.empty:
+        if not len(table):
             self.frame.after(0, lambda: self.status_label.configure(text="ℹ️ No valid attendance data found."))
             self._loading = False
             return
 
-        # Normalize column names (map lower->original) and strip header whitespace
-        orig_cols = list(df.columns)
-        col_map_lower = {c.lower().strip(): c for c in orig_cols}
-
-        # identify username/date/time/status columns in a robust way
-        username_candidates = ["username", "user", "user name", "user_name", "fullname", "full name", "full_name"]
-        date_candidates = ["date", "day", "datetime", "timestamp"]
-        time_candidates = ["time", "timestamp"]
-        status_candidates = ["status", "presence", "state"]
-
-        username_col = None
-        date_col = None
-        time_col = None
-        status_col = None
-
-        for cand in username_candidates:
-            if cand in col_map_lower:
-                username_col = col_map_lower[cand]
-                break
-        for cand in date_candidates:
-            if cand in col_map_lower:
-                date_col = col_map_lower[cand]
-                break
-        for cand in time_candidates:
-            if cand in col_map_lower:
-                time_col = col_map_lower[cand]
-                break
-        for cand in status_candidates:
-            if cand in col_map_lower:
-                status_col = col_map_lower[cand]
-                break
-
-        working = df.copy()
-
-        # Trim whitespace in relevant string columns to avoid mismatch
-        for c in working.columns:
-            try:
-                working[c] = working[c].astype(str).str.strip()
-            except Exception:
-                pass
-
-        # If username column exists and we have a logged-in username, filter to that user
-        if username_col:
-            try:
-                # case-insensitive match: compare lowered versions
-                if self.username:
-                    uname_l = str(self.username).strip().lower()
-                    # create temporary lowered column to compare robustly
-                    working["__cmp_uname__"] = working[username_col].astype(str).str.lower().fillna("")
-                    working = working[working["__cmp_uname__"] == uname_l]
-            except Exception:
-                pass
-
-        # load profiles so we can enrich missing FullName / StudentID / Department
-        profiles = self._load_profiles()
-
-        # Prepare target columns: FullName, StudentID, Department, Date, Time, Status
-        final = pd.DataFrame()
-
-        # Try to pick columns from CSV if present, else create empties
-        # FullName heuristics
-        full_name_col = None
-        for cand in ("fullname", "full_name", "full name", "fullName", "name"):
-            if cand in col_map_lower:
-                full_name_col = col_map_lower[cand]
-                break
-        studentid_col = None
-        for cand in ("studentid", "student_id", "registration", "registration no", "registration_no", "regno", "reg_no"):
-            if cand in col_map_lower:
-                studentid_col = col_map_lower[cand]
-                break
-        dept_col = None
-        for cand in ("department", "dept", "course"):
-            if cand in col_map_lower:
-                dept_col = col_map_lower[cand]
-                break
-
-        # Build columns
-        if full_name_col and full_name_col in working.columns:
-            final["FullName"] = working[full_name_col].astype(str).fillna("")
+        db = active_attendance_db(ATTENDANCE_CSV) if self.username else None
+        if db:
+            records = records_from_rows(db.rows_for_user(self.username))
         else:
-            final["FullName"] = ""
+            records = table.for_user(self.username) if self.username else list(table.records)
 
-        if studentid_col and studentid_col in working.columns:
-            final["StudentID"] = working[studentid_col].astype(str).fillna("")
-        else:
-            # also try "Registration No" or similar exact header variants
-            found = None
-            for k in working.columns:
-                if k.lower().strip().startswith("registration") or k.lower().strip().startswith("reg"):
-                    found = k; break
-            final["StudentID"] = working[found].astype(str).fillna("") if found else ""
-
-        if dept_col and dept_col in working.columns:
-            final["Department"] = working[dept_col].astype(str).fillna("")
-        else:
-            final["Department"] = ""
-
-        # Date and Time
-        if date_col and date_col in working.columns:
-            final["Date"] = working[date_col].astype(str).fillna("")
-        else:
-            # fallback: try first column that looks like a date
-            guess = None
-            for c in working.columns:
-                sample = working[c].dropna().astype(str).head(6).tolist()
-                if any(("-" in s and len(s.split("-")[0]) == 4) or ("/" in s and len(s.split("/")[0]) in (1,2)) for s in sample):
-                    guess = c; break
-            final["Date"] = working[guess].astype(str).fillna("") if guess else ""
-
-        # Time extraction helper (local function)
-        def extract_time(s):
-            try:
-                s = str(s)
-                # if datetime-like "2025-11-28 09:12:00" return the time portion
-                if " " in s:
-                    return s.split(" ", 1)[1].strip()
-            except Exception:
-                pass
-            return ""
-
-        # Time (explicit time column preferred; else try to split datetime)
-        if time_col and time_col in working.columns:
-            final["Time"] = working[time_col].astype(str).fillna("")
-        elif date_col and date_col in working.columns:
-            final["Time"] = working[date_col].astype(str).apply(extract_time).fillna("")
-        else:
-            final["Time"] = ""
-
-        # Status
-        if status_col and status_col in working.columns:
-            final["Status"] = working[status_col].astype(str).fillna("")
-        else:
-            final["Status"] = ""
-
-        # If username column exists and we filtered earlier but helper col left, drop it
-        if "__cmp_uname__" in working.columns:
-            try:
-                working = working.drop(columns=["__cmp_uname__"])
-            except Exception:
-                pass
-
-        # If the CSV did NOT contain a username column but we have a username, try to filter final rows using profile info
-        if (username_col is None) and self.username:
+        # rows without a username: match on the profile's student id / full name instead
+        if not records and self.username:
             try:
+                profiles = self._load_profiles()
                 prof = profiles.get(self.username, {}) if isinstance(profiles, dict) else {}
                 pid = str(prof.get("student_id") or prof.get("studentId") or prof.get("studentID") or "").strip()
                 pname = str(prof.get("full_name") or prof.get("fullName") or prof.get("name") or "").strip().lower()
-                if pid and final.get("StudentID") is not None:
-                    final = final[final["StudentID"].astype(str).str.strip() == pid]
-                elif pname and final.get("FullName") is not None:
-                    final = final[final["FullName"].astype(str).str.strip().str.lower() == pname]
+                if pid:
+                    records = [r for r in table.records if r.registration == pid]
+                elif pname:
+                    records = [r for r in table.records if r.full_name.lower() == pname]
             except Exception:
                 pass
 
-        # Drop rows that don't have a Date or have empty FullName and StudentID (likely garbage rows)
-        try:
-            cond_date = final["Date"].astype(str).str.strip() != ""
-            cond_ident = (final["FullName"].astype(str).str.strip() != "") | (final["StudentID"].astype(str).str.strip() != "")
-            final = final[cond_date & cond_ident]
-        except Exception:
-            pass
-
-        # Convert to list of rows expected by Treeview (Name, Registration, Department, Date, Time, Status)
-        rows = []
-        try:
-            for _, r in final.iterrows():
-                name = str(r.get("FullName") or "")
-                sid = str(r.get("StudentID") or "")
-                dept = str(r.get("Department") or "")
-                dt = str(r.get("Date") or "")
-                tm = str(r.get("Time") or "")
-                st = str(r.get("Status") or "")
-                rows.append([name, sid, dept, dt, tm, st])
-        except Exception:
-            rows = final.fillna("").values.tolist()
-
-        # If the resulting rows are empty but username column exists, attempt a relaxed match (case-insensitive contains) on username column
-        if not rows and username_col and self.username:
-            try:
-                df2 = pd.read_csv(ATTENDANCE_CSV, dtype=str, on_bad_lines='skip')
-                df2 = df2.fillna("")
-                uname_l = str(self.username).strip().lower()
-                # attempt to find matching rows where the username column contains the username
-                candidate_cols = [c for c in df2.columns if c.lower().strip() == username_col.lower().strip()]
-                if candidate_cols:
-                    mask_series = df2[candidate_cols[0]].astype(str).str.lower().str.contains(uname_l)
-                    df2 = df2[mask_series]
-                    # remap to expected output
-                    for _, r in df2.iterrows():
-                        name = r.get('FullName', '') if 'FullName' in r else r.get(candidate_cols[0], '')
-                        sid = r.get('StudentID', '') if 'StudentID' in r else ''
-                        dept = r.get('Department', '') if 'Department' in r else ''
-                        dt = r.get('Date', '') if 'Date' in r else ''
-                        tm = r.get('Time', '') if 'Time' in r else ''
-                        st = r.get('Status', '') if 'Status' in r else ''
-                        rows.append([name, sid, dept, dt, tm, st])
-            except Exception:
-                pass
+        # still nothing: relaxed match (username contains the login name)
+        if not records and self.username:
+            uname_l = self.username.lower()
+            records = [r for r in table.records if uname_l in r.username_norm]
 
-        self._rows = rows
+        # Drop rows that don't have a Date or have empty FullName and StudentID (likely garbage rows)
+        # Rows expected by Treeview: (Name, Registration, Department, Date, Time, Status)
+        self._rows = [[r.full_name, r.registration, r.department, r.date_text, r.time, r.status]
+                      for r in records if r.date_text and (r.full_name or r.registration)]
         self._loading = False
 
     def _insert_batch_ui(self):
@@ -604,55 +439,22 @@ class ViewAttendancePage:
             self.calendar_grid.grid_rowconfigure(i, weight=1)
 
     def _get_present_days(self):
-        days = set()
         if not os.path.exists(ATTENDANCE_CSV):
-            return days
-
+            return set()
         try:
-            df = pd.read_csv(ATTENDANCE_CSV, on_bad_lines="skip", dtype=str)
-            df = df.fillna("")
-            # Try username match if present
-            if "Username" in df.columns:
-                uname_l = str(self.username).strip().lower()
-                df = df[df["Username"].astype(str).str.strip().str.lower() == uname_l]
-
-            # find a date column
-            if "Date" not in df.columns:
-                for c in df.columns:
-                    sample = df[c].astype(str).head(4).tolist()
-                    if any(("-" in s and len(s.split("-")[0]) == 4) or ("/" in s and len(s.split("/")[-1]) == 4) for s in sample):
-                        df["Date"] = df[c]
-                        break
-            if "Date" not in df.columns:
-                return days
-
-            for d in df["Date"].astype(str).fillna(""):
-                dt = self._parse_date_safe(d)
-                if dt and dt.year == self._cal_year and dt.month == self._cal_month:
-                    days.add(dt.day)
+            db = active_attendance_db(ATTENDANCE_CSV)
+            if db:
+                return db.present_days_in_month(self.username, self._cal_year, self._cal_month)
+            store = active_segment_store(ATTENDANCE_CSV)
+            if store is not None:
+                return store.present_days_in_month(self.username, self._cal_year, self._cal_month)
+            return get_presence_bitmaps(ATTENDANCE_CSV).present_days_in_month(self.username, self._cal_year, self._cal_month)
         except Exception:
-            pass
-        return days
+            return set()
 
     @staticmethod
     def _parse_date_safe(val):
-        s = str(val)
-        fmts = (
-            "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d", "%m/%d/%Y",
-            "%Y-%m-%d %H:%M:%S", "%d-%m-%Y %H:%M:%S",
-            "%Y/%m/%d %H:%M:%S", "%m/%d/%Y %H:%M:%S"
-        )
-
-        for f in fmts:
-            try:
-                return datetime.strptime(s, f)
-            except Exception:
-                continue
-
-        try:
-            return pd.to_datetime(s).to_pydatetime()
-        except Exception:
-            return None
+        return parse_datetime(val)
 
     def _prev_month(self):
         if self._cal_month == 1:
@@ -723,40 +525,20 @@ class TeacherAttendancePage:
         self.status_label.pack(anchor="w", padx=6)
 
         self._rows = []
-        self._csv_mtime = None
+        self._repo = get_attendance_repository(ATTENDANCE_CSV)
+        self._table = None          # latest repository table the tree reflects
+        self._shown = 0             # records of that table already in self._rows
+        self._apply_pending = False
         self._autoscan_interval_ms = autoscan_interval_ms
         self._stop_scan = False
 
-        # initial load
+        # initial load, then appended rows arrive through the repository subscription
         self.refresh_view()
+        self._unsubscribe = self._repo.subscribe(self._on_new_records)
         # start autoscan thread
         self._scan_thread = threading.Thread(target=self._watch_csv_loop, daemon=True)
         self._scan_thread.start()
 
-    def _normalize_cols(self, df):
-        # ensure the dataframe has the standard columns (best-effort)
-        df = df.fillna("")
-        cols = df.columns.tolist()
-        lower = {c.lower().strip(): c for c in cols}
-        mapping = {}
-        mapping['Registration'] = lower.get('registration') or lower.get('registration no') or lower.get('regno') or lower.get('studentid') or lower.get('student_id') or None
-        mapping['FullName'] = lower.get('fullname') or lower.get('full_name') or lower.get('name') or None
-        mapping['Username'] = lower.get('username') or lower.get('user') or None
-        mapping['Department'] = lower.get('department') or lower.get('dept') or None
-        mapping['Date'] = lower.get('date') or lower.get('datetime') or None
-        mapping['Time'] = lower.get('time') or None
-        mapping['Status'] = lower.get('status') or None
-
-        out = pd.DataFrame()
-        out['Registration'] = df[mapping['Registration']] if mapping['Registration'] in df.columns else ""
-        out['FullName'] = df[mapping['FullName']] if mapping['FullName'] in df.columns else ""
-        out['Username'] = df[mapping['Username']] if mapping['Username'] in df.columns else ""
-        out['Department'] = df[mapping['Department']] if mapping['Department'] in df.columns else ""
-        out['Date'] = df[mapping['Date']] if mapping['Date'] in df.columns else ""
-        out['Time'] = df[mapping['Time']] if mapping['Time'] in df.columns else ""
-        out['Status'] = df[mapping['Status']] if mapping['Status'] in df.columns else ""
-        return out
-
     def refresh_view(self):
         try:
             if not os.path.exists(ATTENDANCE_CSV):
@@ -764,24 +546,56 @@ class TeacherAttendancePage:
                 self._populate_tree([])
                 self.status_label.configure(text="No attendance file found.")
                 return
-            df = pd.read_csv(ATTENDANCE_CSV, dtype=str, on_bad_lines='skip')
-            if df.empty:
+            table = self._repo.snapshot()
+            records = list(table.records)
+            self._table, self._shown = table, len(records)
+            if not records:
                 self._rows = []
                 self._populate_tree([])
                 self.status_label.configure(text="No records found.")
                 return
-            df = self._normalize_cols(df)
-            # save internal rows
-            self._rows = df.values.tolist()
+            # save internal rows (Registration, FullName, Username, Department, Date, Time, Status)
+            self._rows = [self._record_row(r) for r in records]
             self._populate_tree(self._rows)
-            try:
-                self._csv_mtime = os.path.getmtime(ATTENDANCE_CSV)
-            except Exception:
-                self._csv_mtime = None
             self.status_label.configure(text=f"Loaded {len(self._rows)} records.")
         except Exception as e:
             self.status_label.configure(text=f"Error loading CSV: {e}")
 
+    @staticmethod
+    def _record_row(r):
+        return [r.registration, r.full_name, r.username, r.department, r.date_text, r.time, r.status]
+
+    def _on_new_records(self, records, reloaded):
+        # repository subscriber (runs on whichever thread refreshed it): hop to the Tk thread once
+        if self._apply_pending:
+            return
+        self._apply_pending = True
+        try:
+            self.frame.after(0, self._apply_new_records)
+        except Exception:
+            self._apply_pending = False
+
+    def _apply_new_records(self):
+        """Append only the records added since the tree was built (full refresh if the file was rewritten)."""
+        self._apply_pending = False
+        table = self._repo.current()
+        if table is None or self._table is None or table.lineage is not self._table.lineage:
+            self.refresh_view()
+            return
+        self._table = table
+        new = table.records[self._shown:]
+        if not new:
+            return
+        self._shown += len(new)
+        rows = [self._record_row(r) for r in new]
+        self._rows.extend(rows)
+        txt = str(self.filter_var.get()).strip().lower()
+        for r in rows:
+            if not txt or any(txt in str(v).lower() for v in r[:3]):
+                self.tree.insert("", "end", values=[str(x) for x in r])
+        if not txt:
+            self.status_label.configure(text=f"Loaded {len(self._rows)} records.")
+
     def _populate_tree(self, rows):
         # clear and insert
         for i in self.tree.get_children():
@@ -795,18 +609,14 @@ class TeacherAttendancePage:
             self._populate_tree(self._rows)
             return
         try:
-            df = pd.DataFrame(self._rows, columns=['Registration', 'FullName', 'Username', 'Department', 'Date', 'Time', 'Status'])
-            # corrected, robust mask
-            mask = df.apply(
-                lambda r: (
-                    txt in str(r.get('Registration', '')).lower()
-                    or txt in str(r.get('FullName', '')).lower()
-                    or txt in str(r.get('Username', '')).lower()
-                ),
-                axis=1
-            )
-            filtered = df[mask]
-            self._populate_tree(filtered.values.tolist())
+            # self._rows are the records of self._table in order, so row indices carry over
+            cols = get_attendance_columns(ATTENDANCE_CSV)
+            if cols is not None and cols.table.lineage is self._table.lineage and len(cols) >= len(self._rows):
+                hits = cols.contains(txt)[:len(self._rows)].nonzero()[0]
+                filtered = [self._rows[i] for i in hits]
+            else:
+                filtered = [r for r in self._rows if any(txt in str(v).lower() for v in r[:3])]
+            self._populate_tree(filtered)
             self.status_label.configure(text=f"Showing {len(filtered)} filtered records.")
         except Exception as e:
             self.status_label.configure(text=f"Filter error: {e}")
@@ -833,26 +643,17 @@ class TeacherAttendancePage:
             messagebox.showerror("Error", f"Export failed: {e}")
 
     def _watch_csv_loop(self):
-        """Background loop to watch CSV mtime and refresh automatically."""
+        """Background loop: parse whatever was appended to the CSV; new records reach _on_new_records."""
         while not self._stop_scan:
             try:
-                if os.path.exists(ATTENDANCE_CSV):
-                    try:
-                        m = os.path.getmtime(ATTENDANCE_CSV)
-                    except Exception:
-                        m = None
-                    if m and self._csv_mtime is None:
-                        self._csv_mtime = m
-                    elif m and self._csv_mtime != m:
-                        self._csv_mtime = m
-                        # refresh in main thread
-                        try:
-                            self.frame.after(100, self.refresh_view)
-                        except Exception:
-                            self.refresh_view()
-                time.sleep(max(0.5, self._autoscan_interval_ms/1000.0))
+                self._repo.refresh()
             except Exception:
-                time.sleep(1.0)
+                pass
+            time.sleep(max(0.5, self._autoscan_interval_ms/1000.0))
 
     def stop(self):
         self._stop_scan = True
+        try:
+            self._unsubscribe()
+        except Exception:
+            pass